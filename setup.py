@@ -2,6 +2,7 @@
 from setuptools import find_packages, setup
 
 install_requires = [
+    'asgiref>=3.2',
     'django-oscar>=3.0',
     'python-dateutil>=2.6,<3.0',
 ]
@@ -48,6 +49,7 @@ setup(
     tests_require=tests_require,
     setup_requires=['setuptools_scm'],
     extras_require={
+        'orjson': ['orjson>=3.0'],
         'test': tests_require,
     },
     use_scm_version=True,
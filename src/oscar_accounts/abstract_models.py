@@ -1,17 +1,22 @@
+import datetime
 import hashlib
 import hmac
+import secrets
+from collections import defaultdict
 from decimal import Decimal as D
 
 from django.conf import settings
-from django.db import models, transaction
-from django.db.models import Sum
-from django.urls import reverse
+from django.core.cache import cache
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from oscar.core.compat import AUTH_USER_MODEL
 from treebeard.mp_tree import MP_Node
 
-from oscar_accounts import exceptions
+from oscar_accounts import (
+    accounttypes, codefilter, core, exceptions, serialisers, striping, threads)
 
 
 class ActiveAccountManager(models.Manager):
@@ -43,8 +48,24 @@ class AccountType(MP_Node):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        accounttypes.clear_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        accounttypes.clear_cache()
+        return result
+
+    def move(self, *args, **kwargs):
+        super().move(*args, **kwargs)
+        accounttypes.clear_cache()
+
     @property
     def full_name(self):
+        full_name = accounttypes.full_name(self)
+        if full_name is not None:
+            return full_name
         names = [a.name for a in self.get_ancestors()]
         names.append(self.name)
         return " / ".join(names)
@@ -99,6 +120,10 @@ class Account(models.Model):
     balance = models.DecimalField(decimal_places=2, max_digits=12,
                                   default=D('0.00'), null=True)
 
+    # Incremented by every change to the cached balance so that postings can
+    # detect concurrent changes without locking the account row.
+    version = models.BigIntegerField(default=0, editable=False)
+
     # Accounts can have an date range to indicate when they are 'active'.  Note
     # that these dates are ignored when creating a transfer.  It is up to your
     # client code to use them to enforce business logic.
@@ -132,6 +157,15 @@ class Account(models.Model):
             return self.name
         return 'Anonymous'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The balance of a striped account is spread over its stripes
+        if 'balance' in field_names and instance.balance is not None:
+            if striping.num_stripes(instance):
+                instance.balance += instance._stripes_balance()
+        return instance
+
     def is_active(self):
         if self.start_date is None and self.end_date is None:
             return True
@@ -142,18 +176,98 @@ class Account(models.Model):
             return now < self.end_date
         return self.start_date <= now < self.end_date
 
+    # Fields that are maintained by the posting code using atomic database
+    # updates.  A plain save() never writes them out as the in-memory values
+    # may be stale.
+    posting_fields = ('balance', 'version')
+
     def save(self, *args, **kwargs):
         if self.code:
             self.code = self.code.upper()
-        # Ensure the balance is always correct when saving
-        self.balance = self._balance()
-        return super().save(*args, **kwargs)
+        adding = self._state.adding
+        if not adding and kwargs.get('update_fields') is None:
+            skip = self.get_deferred_fields() | set(self.posting_fields)
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in skip]
+        super().save(*args, **kwargs)
+        if adding:
+            # Other processes pick the code up once it is committed
+            codefilter.add(self.code)
+        if self.name:
+            core.clear_cache()
+            # The account may have been renamed from a striped name
+            if striping.get_config():
+                striping.clear_cache()
+
+    def delete(self, *args, **kwargs):
+        if self.name:
+            core.clear_cache()
+            if striping.is_striped_name(self.name):
+                striping.clear_cache()
+        return super().delete(*args, **kwargs)
 
     def _balance(self):
         aggregates = self.transactions.aggregate(sum=Sum('amount'))
         sum = aggregates['sum']
         return D('0.00') if sum is None else sum
 
+    def balance_as_of(self, date):
+        """
+        Return the balance of the account at the passed datetime (ie the sum of
+        the transactions created before it).
+
+        Only the transactions since the nearest earlier balance checkpoint are
+        added up.
+        """
+        transactions = self.transactions.filter(date_created__lt=date)
+        balance = D('0.00')
+        checkpoint = self.checkpoints.filter(
+            date__lte=date).order_by('-date').first()
+        if checkpoint:
+            balance = checkpoint.balance
+            transactions = transactions.filter(
+                date_created__gte=checkpoint.date)
+        total = transactions.aggregate(sum=Sum('amount'))['sum']
+        return balance if total is None else balance + total
+
+    def _stripes_balance(self):
+        aggregates = self.stripes.aggregate(sum=Sum('balance'))
+        sum = aggregates['sum']
+        return D('0.00') if sum is None else sum
+
+    def recalculate_balance(self):
+        """
+        Recalculate the cached balance from the account transactions.
+
+        Postings keep the cached balance up to date incrementally so this is
+        only needed to repair an account whose balance has drifted.
+        """
+        with transaction.atomic():
+            # Lock the account row (and its stripes) so that no posting can
+            # change the balance between the aggregation and the write.
+            self.__class__.objects.select_for_update().only('pk').get(
+                pk=self.pk)
+            stripes = list(self.stripes.select_for_update().values_list(
+                'pk', flat=True))
+            self.__class__.objects.filter(pk=self.pk).update(
+                balance=self._balance(), version=F('version') + 1)
+            if stripes:
+                self.stripes.update(balance=D('0.00'))
+        self._expire_balance()
+
+    def _expire_balance(self):
+        # Drop the in-memory balance (and version) so that it is reloaded from
+        # the database the next time it is accessed.
+        for name in self.posting_fields:
+            self.__dict__.pop(name, None)
+
+    def _load_balance(self):
+        # Load the balance and version together so that they are consistent
+        expired = self.get_deferred_fields().intersection(self.posting_fields)
+        if expired:
+            self.refresh_from_db(fields=self.posting_fields)
+
     def num_transactions(self):
         return self.transactions.all().count()
 
@@ -251,10 +365,10 @@ class Account(models.Model):
             'end_date': '',
             'status': self.status,
             'balance': "%.2f" % self.balance,
-            'redemptions_url': reverse('oscar_accounts_api:account-redemptions',
-                                       kwargs={'code': self.code}),
-            'refunds_url': reverse('oscar_accounts_api:account-refunds',
-                                   kwargs={'code': self.code})}
+            'redemptions_url': serialisers.url(
+                'account-redemptions', 'code', self.code),
+            'refunds_url': serialisers.url(
+                'account-refunds', 'code', self.code)}
 
         if self.start_date:
             data['start_date'] = self.start_date.isoformat()
@@ -263,6 +377,26 @@ class Account(models.Model):
         return data
 
 
+class AccountStripe(models.Model):
+    """
+    A share of the cached balance of a striped account.
+
+    See ``oscar_accounts.striping`` for details.
+    """
+    account = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                related_name='stripes')
+    index = models.PositiveIntegerField()
+    balance = models.DecimalField(decimal_places=2, max_digits=12,
+                                  default=D('0.00'))
+
+    class Meta:
+        abstract = True
+        unique_together = ('account', 'index')
+
+    def __str__(self):
+        return "%s #%d" % (self.account, self.index)
+
+
 class PostingManager(models.Manager):
     """
     Custom manager to provide a new 'create' method to create a new transfer.
@@ -274,8 +408,24 @@ class PostingManager(models.Manager):
                user=None, merchant_reference=None, description=None):
         # Write out transfer (which involves multiple writes).  We use a
         # database transaction to ensure that all get written out correctly.
+        optimistic = self.optimistic_locking_enabled()
+        if optimistic:
+            source._load_balance()
         self.verify_transfer(source, destination, amount, user)
         with transaction.atomic():
+            if optimistic:
+                # The debit is only applied if the source account is unchanged
+                # since it was verified.
+                version = self._expected_version(source)
+                self.update_balance(source, -amount, counterparty=destination,
+                                    version=version)
+            elif self.locking_enabled():
+                # Check the transfer again against the locked rows as the
+                # accounts may have changed since they were loaded.
+                legs = self._lock_legs([(source, destination, amount, {})])
+                locked_source, locked_destination = legs[0][:2]
+                self.verify_transfer(
+                    locked_source, locked_destination, amount, user)
             transfer = self.get_queryset().create(
                 source=source,
                 destination=destination,
@@ -290,19 +440,233 @@ class PostingManager(models.Manager):
             transfer.transactions.create(
                 account=destination, amount=amount)
             # Update the cached balances on the accounts
-            source.save()
-            destination.save()
+            if not optimistic:
+                self.update_balance(source, -amount, counterparty=destination)
+            self.update_balance(destination, amount, counterparty=source)
             return self._wrap(transfer)
 
+    async def acreate(self, *args, **kwargs):
+        """
+        Async version of create().
+
+        This doesn't access the database asynchronously: the whole posting is
+        made in a single call to a worker thread, in its own database
+        transaction (see oscar_accounts.threads).
+        """
+        return await threads.run_in_thread(self.create, *args, **kwargs)
+
+    def bulk_post(self, legs):
+        """
+        Post a batch of transfers in a single database transaction.
+
+        :legs: A sequence of (source, destination, amount, metadata) tuples,
+               where metadata is a dict of any of the optional 'parent',
+               'user', 'merchant_reference' and 'description' arguments of
+               create().
+
+        Every transfer is verified before anything is written.  The transfers
+        and their transactions are then bulk-inserted and each account
+        touched by the batch gets a single, net balance update.
+        """
+        legs = [(source, destination, amount, metadata or {})
+                for source, destination, amount, metadata in legs]
+        optimistic = self.optimistic_locking_enabled()
+        if optimistic:
+            for source, destination, amount, metadata in legs:
+                source._load_balance()
+        self.verify_transfers(legs)
+        transfers = []
+        for source, destination, amount, metadata in legs:
+            transfer = self.model(source=source, destination=destination,
+                                  amount=amount, **metadata)
+            if transfer.user:
+                transfer.username = transfer.user.get_username()
+            transfers.append(transfer)
+
+        # With optimistic locking, the balance updates of the accounts debited
+        # are conditional on the versions they were verified at.
+        versions = {}
+        if optimistic:
+            sources = defaultdict(list)
+            for source, destination, amount, metadata in legs:
+                sources[source.pk].append(source)
+            for pk, instances in sources.items():
+                versions[pk] = self._expected_version(*instances)
+
+        transaction_model = self.model._meta.get_field(
+            'transactions').related_model
+        accounts = defaultdict(list)
+        deltas = defaultdict(D)
+        with transaction.atomic(using=self.db):
+            if not optimistic and self.locking_enabled():
+                self.verify_transfers(self._lock_legs(legs))
+            self._bulk_insert(transfers)
+            transactions = []
+            for transfer in transfers:
+                transactions.append(transaction_model(
+                    transfer=transfer, account=transfer.source,
+                    amount=-transfer.amount))
+                transactions.append(transaction_model(
+                    transfer=transfer, account=transfer.destination,
+                    amount=transfer.amount))
+            transaction_model.objects.bulk_create(transactions)
+            for txn in transactions:
+                accounts[txn.account.pk].append(txn.account)
+                deltas[txn.account.pk] += txn.amount
+            # Update the cached balances on the accounts.  Plain accounts with
+            # the same net change (eg a batch of new giftcards all loaded with
+            # the same amount) share a single update.
+            groups = defaultdict(list)
+            for pk, delta in deltas.items():
+                account = accounts[pk][0]
+                if versions.get(pk) is None and not striping.num_stripes(
+                        account):
+                    groups[delta].append(pk)
+                else:
+                    self.update_balance(
+                        account, delta, version=versions.get(pk))
+            account_model = transaction_model._meta.get_field(
+                'account').related_model
+            for delta, pks in groups.items():
+                for i in range(0, len(pks), 500):
+                    account_model.objects.filter(pk__in=pks[i:i + 500]).update(
+                        balance=Coalesce(F('balance'), D('0.00')) + delta,
+                        version=F('version') + 1)
+            for instances in accounts.values():
+                for instance in instances:
+                    instance._expire_balance()
+            return [self._wrap(transfer) for transfer in transfers]
+
+    async def abulk_post(self, legs):
+        """
+        Async version of bulk_post(), which runs it in a worker thread (see
+        oscar_accounts.threads)
+        """
+        return await threads.run_in_thread(self.bulk_post, legs)
+
+    def locking_enabled(self):
+        return getattr(settings, 'ACCOUNTS_LOCK_ON_POSTING', True)
+
+    def optimistic_locking_enabled(self):
+        return getattr(settings, 'ACCOUNTS_OPTIMISTIC_LOCKING', False)
+
+    def _expected_version(self, *instances):
+        # Only debits from accounts with a credit limit depend on the balance
+        # they were verified against.  Credits and unlimited debits are always
+        # permitted, so they never need to conflict.
+        account = instances[0]
+        if not account.has_credit_limit:
+            return None
+        versions = {instance.version for instance in instances}
+        if len(versions) > 1:
+            raise exceptions.ConcurrentUpdate(
+                "Account #%d was changed by a concurrent posting" % account.pk)
+        return versions.pop()
+
+    def lock_accounts(self, accounts):
+        """
+        Lock the rows of the passed accounts until the end of the current
+        database transaction.  Return the freshly loaded accounts, keyed by PK.
+
+        Rows are always locked in PK order so that concurrent postings over
+        the same accounts can't deadlock.
+        """
+        pks = sorted({account.pk for account in accounts})
+        if not pks:
+            return {}
+        queryset = type(accounts[0]).objects.select_for_update().filter(
+            pk__in=pks).order_by('pk')
+        return {account.pk: account for account in queryset}
+
+    def _lock_legs(self, legs):
+        # Balance updates to a striped account don't touch its row, so locking
+        # it would bring back the contention that striping avoids.  It only
+        # needs locking when it is debited and has a credit limit to enforce.
+        accounts = []
+        for source, destination, amount, metadata in legs:
+            if not striping.num_stripes(source) or source.has_credit_limit:
+                accounts.append(source)
+            if not striping.num_stripes(destination):
+                accounts.append(destination)
+        locked = self.lock_accounts(accounts)
+        return [(locked.get(source.pk, source),
+                 locked.get(destination.pk, destination), amount, metadata)
+                for source, destination, amount, metadata in legs]
+
+    def _bulk_insert(self, transfers, batch_size=500):
+        for transfer in transfers:
+            transfer.reference = transfer._generate_reference()
+        self.bulk_create(transfers, batch_size=batch_size)
+        if not transfers or transfers[0].pk is not None:
+            return
+        # We need the PKs of the new transfers to link their transactions, so
+        # look them up by reference.
+        for i in range(0, len(transfers), batch_size):
+            batch = transfers[i:i + batch_size]
+            pks = dict(self.filter(
+                reference__in=[transfer.reference for transfer in batch]
+            ).values_list('reference', 'pk'))
+            for transfer in batch:
+                transfer.pk = pks[transfer.reference]
+
+    def update_balance(self, account, amount, counterparty=None,
+                       version=None):
+        """
+        Apply a change to the cached balance of the passed account.
+
+        The change is applied as an atomic database update rather than by
+        re-aggregating the account transactions, so the cost of a posting does
+        not grow with the history of the account.  For striped accounts, the
+        change is applied to one of the account's stripes.
+
+        If a version is passed, the change is only applied if the account's
+        version still matches it, otherwise ConcurrentUpdate is raised.
+        """
+        rows = account.__class__.objects.filter(pk=account.pk)
+        if version is not None:
+            rows = rows.filter(version=version)
+        stripes = striping.num_stripes(account)
+        if stripes:
+            # Stripe updates leave the account row alone unless they need to
+            # check its version.
+            if version is not None:
+                updated = rows.update(version=F('version') + 1)
+            if version is None or updated:
+                index = striping.choose_stripe(stripes, counterparty)
+                self._update_stripe(account, index, amount)
+        else:
+            updated = rows.update(
+                balance=Coalesce(F('balance'), D('0.00')) + amount,
+                version=F('version') + 1)
+        account._expire_balance()
+        if version is not None and not updated:
+            raise exceptions.ConcurrentUpdate(
+                "Account #%d was changed by a concurrent posting" % account.pk)
+
+    def _update_stripe(self, account, index, amount):
+        stripes = account.stripes.filter(index=index)
+        if stripes.update(balance=F('balance') + amount):
+            return
+        try:
+            with transaction.atomic():
+                account.stripes.create(index=index, balance=amount)
+        except IntegrityError:
+            # A concurrent posting created the stripe first
+            stripes.update(balance=F('balance') + amount)
+
     def _wrap(self, obj):
         # Dumb method that is here only so that it can be mocked to test the
         # transaction behaviour.
         return obj
 
-    def verify_transfer(self, source, destination, amount, user=None):
+    def verify_transfer(self, source, destination, amount, user=None,
+                        pending=D('0.00')):
         """
         Test whether the proposed transaction is permitted.  Raise an exception
         if not.
+
+        :pending: Balance change not yet posted to the source account (eg by
+                  earlier transfers of the same batch)
         """
         if amount <= 0:
             raise exceptions.InvalidAmount("Debits must use a positive amount")
@@ -315,11 +679,65 @@ class PostingManager(models.Manager):
         if not destination.is_open():
             raise exceptions.ClosedAccount(
                 "Destination account has been closed")
-        if not source.is_debit_permitted(amount):
+        if not source.is_debit_permitted(amount - pending):
             msg = "Unable to debit %.2f from account #%d:"
             raise exceptions.InsufficientFunds(
                 msg % (amount, source.id))
 
+    async def averify_transfer(self, *args, **kwargs):
+        """
+        Async version of verify_transfer(), which runs it in a worker thread
+        (see oscar_accounts.threads)
+        """
+        return await threads.run_in_thread(
+            self.verify_transfer, *args, **kwargs)
+
+    def assign_feed_positions(self, limit, attempts=3):
+        """
+        Give the next positions in the transfer feed to up to limit of the
+        committed transfers that don't have one yet, oldest first.  Return
+        the number of positions assigned.
+
+        Positions are assigned after the transfers have committed, and the
+        uniqueness of positions stops two concurrent calls from both
+        committing (unless they assign the same positions to the same
+        transfers), so positions become visible in increasing order.  A feed
+        read can't then skip a transfer whose transaction committed late.
+        """
+        for __ in range(attempts):
+            try:
+                with transaction.atomic(using=self.db):
+                    # Read the last position before the transfers without
+                    # one, so that any assigned in between collide with ours
+                    last = self.aggregate(
+                        last=models.Max('feed_position'))['last'] or 0
+                    pks = list(self.filter(feed_position=None).order_by(
+                        'pk').values_list('pk', flat=True)[:limit])
+                    self.bulk_update(
+                        [self.model(pk=pk, feed_position=last + index)
+                         for index, pk in enumerate(pks, 1)],
+                        ['feed_position'])
+                    return len(pks)
+            except IntegrityError:
+                # A concurrent call assigned the same positions first
+                continue
+        return 0
+
+    def verify_transfers(self, legs):
+        """
+        Test whether the proposed batch of transfers is permitted.  Raise an
+        exception if not.
+
+        Each transfer is checked as if the earlier transfers of the batch had
+        already been made.
+        """
+        pending = defaultdict(D)
+        for source, destination, amount, metadata in legs:
+            self.verify_transfer(source, destination, amount,
+                                 metadata.get('user'), pending[source.pk])
+            pending[source.pk] -= amount
+            pending[destination.pk] += amount
+
 
 class Transfer(models.Model):
     """
@@ -356,6 +774,11 @@ class Transfer(models.Model):
 
     date_created = models.DateTimeField(auto_now_add=True)
 
+    # The order of the transfer in the transfer feed, which is assigned once
+    # it has committed (see PostingManager.assign_feed_positions)
+    feed_position = models.BigIntegerField(null=True, unique=True,
+                                           editable=False)
+
     # Use a custom manager that extends the create method to also create the
     # account transactions.
     objects = PostingManager()
@@ -374,18 +797,16 @@ class Transfer(models.Model):
         # Store audit information about authorising user (if one is set)
         if self.user:
             self.username = self.user.get_username()
-        # We generate a transaction reference using the PK of the transfer so
-        # we save the transfer first
-        super().save(*args, **kwargs)
+        # We generate the reference up front so that the transfer is written
+        # out with a single INSERT
         if not self.reference:
             self.reference = self._generate_reference()
-            super().save(update_fields=['reference'])
+        super().save(*args, **kwargs)
 
     def _generate_reference(self):
-        obj = hmac.new(key=settings.SECRET_KEY.encode(),
-                       msg=str(self.id).encode(),
-                       digestmod=hashlib.md5)
-        return obj.hexdigest().upper()
+        # 128 random bits, formatted as 32 uppercase hex characters like the
+        # PK-based references of earlier versions
+        return secrets.token_hex(16).upper()
 
     @property
     def authorisor_username(self):
@@ -397,9 +818,13 @@ class Transfer(models.Model):
         """
         Return the maximum amount that can be refunded against this transfer
         """
-        aggregates = self.related_transfers.filter(
-            source=self.destination).aggregate(sum=Sum('amount'))
-        already_refunded = aggregates['sum']
+        if 'refunded_amount' in self.__dict__:
+            # Annotated by serialisers.with_related
+            already_refunded = self.refunded_amount
+        else:
+            aggregates = self.related_transfers.filter(
+                source=self.destination).aggregate(sum=Sum('amount'))
+            already_refunded = aggregates['sum']
         if already_refunded is None:
             return self.amount
         return self.amount - already_refunded
@@ -416,12 +841,10 @@ class Transfer(models.Model):
             'datetime': self.date_created.isoformat(),
             'merchant_reference': self.merchant_reference,
             'description': self.description,
-            'reverse_url': reverse(
-                'oscar_accounts_api:transfer-reverse',
-                kwargs={'reference': self.reference}),
-            'refunds_url': reverse(
-                'oscar_accounts_api:transfer-refunds',
-                kwargs={'reference': self.reference})}
+            'reverse_url': serialisers.url(
+                'transfer-reverse', 'reference', self.reference),
+            'refunds_url': serialisers.url(
+                'transfer-refunds', 'reference', self.reference)}
 
 
 class Transaction(models.Model):
@@ -445,10 +868,199 @@ class Transaction(models.Model):
     class Meta:
         unique_together = ('transfer', 'account')
         abstract = True
+        indexes = [
+            # For paging through an account's statement
+            models.Index(fields=['account', 'date_created', 'id'],
+                         name='oscar_acc_txn_statement_idx'),
+        ]
 
     def delete(self, *args, **kwargs):
         raise RuntimeError("Transactions cannot be deleted")
 
+    def as_dict(self):
+        # The transfer and its accounts should be fetched with
+        # select_related, to serialise a list of transactions without a
+        # query per row
+        transfer = self.transfer
+        if self.account_id == transfer.source_id:
+            counterparty = transfer.destination
+        else:
+            counterparty = transfer.source
+        return {
+            'id': self.pk,
+            'amount': "%.2f" % self.amount,
+            'datetime': self.date_created.isoformat(),
+            'reference': transfer.reference,
+            'merchant_reference': transfer.merchant_reference,
+            'description': transfer.description,
+            'counterparty_code': counterparty.code,
+            'counterparty_name': counterparty.name,
+            'transfer_url': serialisers.url(
+                'transfer', 'reference', transfer.reference)}
+
+
+class PendingTransferManager(models.Manager):
+
+    def process_batch(self, batch_size=500):
+        """
+        Post a batch of pending transfers, oldest first.  Return the numbers of
+        transfers posted and failed.
+
+        The pending transfers are locked (skipping any locked by another
+        worker) and marked as processed in the same database transaction as
+        the posting, so each one is posted exactly once.  Transfers that
+        conflict with a concurrent posting (see ACCOUNTS_OPTIMISTIC_LOCKING)
+        are left pending, to be posted by a later batch.
+        """
+        transfer_model = self.model._meta.get_field('transfer').related_model
+        with transaction.atomic(using=self.db):
+            queryset = self.filter(status=self.model.PENDING).select_related(
+                'source', 'destination', 'user').order_by('pk')
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(
+                    skip_locked=True, of=('self',))
+            batch = list(queryset[:batch_size])
+            if not batch:
+                return 0, 0
+
+            # Fail the invalid transfers up front so that they don't stop the
+            # rest of the batch from being posted
+            valid, failed = [], []
+            pending = defaultdict(D)
+            for item in batch:
+                try:
+                    transfer_model.objects.verify_transfer(
+                        item.source, item.destination, item.amount,
+                        item.user, pending[item.source_id])
+                except exceptions.AccountException as e:
+                    item.fail(e)
+                    failed.append(item)
+                else:
+                    pending[item.source_id] -= item.amount
+                    pending[item.destination_id] += item.amount
+                    valid.append(item)
+
+            try:
+                transfers = transfer_model.objects.bulk_post(
+                    [item.as_leg() for item in valid])
+            except exceptions.AccountException:
+                # The accounts changed since they were verified, so post the
+                # transfers one at a time to find the ones that now fail
+                transfers, posted = [], []
+                for item in valid:
+                    source, destination, amount, metadata = item.as_leg()
+                    source._expire_balance()
+                    try:
+                        transfers.append(transfer_model.objects.create(
+                            source, destination, amount, **metadata))
+                    except exceptions.ConcurrentUpdate:
+                        # Not a reason to fail it, so leave it pending
+                        continue
+                    except exceptions.AccountException as e:
+                        item.fail(e)
+                        failed.append(item)
+                    else:
+                        posted.append(item)
+                valid = posted
+
+            now = timezone.now()
+            for item, transfer in zip(valid, transfers):
+                item.status = item.POSTED
+                item.transfer = transfer
+            processed = valid + failed
+            for item in processed:
+                item.date_processed = now
+            self.bulk_update(
+                processed, ['status', 'transfer', 'error', 'date_processed'])
+        return len(valid), len(failed)
+
+
+class PendingTransfer(models.Model):
+    """
+    A transfer that has been queued to be posted later, in a batch, by the
+    ``process_pending_transfers`` management command.
+    """
+    source = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                               related_name='pending_source_transfers')
+    destination = models.ForeignKey(
+        'oscar_accounts.Account', models.CASCADE,
+        related_name='pending_destination_transfers')
+    amount = models.DecimalField(decimal_places=2, max_digits=12)
+    merchant_reference = models.CharField(max_length=128, null=True)
+    description = models.CharField(max_length=256, null=True)
+    user = models.ForeignKey(AUTH_USER_MODEL, models.SET_NULL,
+                             related_name="pending_transfers", null=True)
+
+    PENDING, POSTED, FAILED = 'Pending', 'Posted', 'Failed'
+    status = models.CharField(max_length=32, default=PENDING, db_index=True)
+
+    # The transfer that was posted, or the reason it couldn't be
+    transfer = models.OneToOneField(
+        'oscar_accounts.Transfer', models.SET_NULL, null=True,
+        related_name='pending_transfer')
+    error = models.CharField(max_length=256, blank=True)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_processed = models.DateTimeField(null=True)
+
+    objects = PendingTransferManager()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return "Pending transfer #%d (%s)" % (self.pk, self.status)
+
+    def as_leg(self):
+        return (self.source, self.destination, self.amount,
+                {'user': self.user,
+                 'merchant_reference': self.merchant_reference,
+                 'description': self.description})
+
+    def fail(self, error):
+        self.status = self.FAILED
+        self.error = str(error)[:256]
+
+    def as_dict(self):
+        data = {
+            'id': self.pk,
+            'status': self.status,
+            'error': self.error,
+            'amount': "%.2f" % self.amount,
+            'datetime': self.date_created.isoformat(),
+            'merchant_reference': self.merchant_reference,
+            'description': self.description,
+            'transfer_url': None}
+        if self.transfer:
+            data['transfer_url'] = serialisers.url(
+                'transfer', 'reference', self.transfer.reference)
+        return data
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    The balance of an account at a period boundary.
+
+    Checkpoints are created by the ``create_balance_checkpoints`` management
+    command and allow historical balances to be calculated without adding up
+    the whole history of an account.
+    """
+    account = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                related_name='checkpoints')
+
+    # The balance is the sum of the account transactions created before this
+    # date
+    date = models.DateTimeField()
+    balance = models.DecimalField(decimal_places=2, max_digits=12)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+        unique_together = ('account', 'date')
+
+    def __str__(self):
+        return "%s at %s: %.2f" % (self.account, self.date, self.balance)
+
 
 class IPAddressRecord(models.Model):
     ip_address = models.GenericIPAddressField(_("IP address"), unique=True)
@@ -504,3 +1116,155 @@ class IPAddressRecord(models.Model):
 
     def is_permanently_blocked(self):
         return self.total_failures > self.BLOCK_THRESHOLD
+
+
+class APIKeyManager(models.Manager):
+
+    def create_key(self, user, name=''):
+        """
+        Create an API key for the passed user.  Return the APIKey and the key
+        itself, which is not stored and can't be retrieved later.
+        """
+        prefix = secrets.token_hex(4)
+        key = "%s.%s" % (prefix, secrets.token_urlsafe(32))
+        api_key = self.create(user=user, name=name, prefix=prefix,
+                              hashed_key=self.model.hash_key(key))
+        return api_key, key
+
+    def authenticate(self, key):
+        """
+        Return the active user that the passed key belongs to, or None.
+
+        Keys are looked up by their prefix and cached for
+        ACCOUNTS_API_KEY_CACHE_TIMEOUT seconds, so most requests are
+        authenticated without a database query.  Only the user's ID and
+        status are cached; the returned user has its other fields deferred.
+        As keys are long and random, a single SHA-256 hash is enough to
+        protect them.
+        """
+        prefix = key.split('.', 1)[0]
+        cache_key = self.model.cache_key(prefix)
+        cached = cache.get(cache_key)
+        if cached is None:
+            api_key = self.filter(prefix=prefix, is_active=True).values_list(
+                'hashed_key', 'user_id', 'user__is_active').first()
+            cached = api_key or ()
+            cache.set(cache_key, cached, getattr(
+                settings, 'ACCOUNTS_API_KEY_CACHE_TIMEOUT', 60))
+        if not cached:
+            return None
+        hashed_key, user_id, is_active = cached
+        if not is_active or not hmac.compare_digest(
+                hashed_key, self.model.hash_key(key)):
+            return None
+        User = self.model._meta.get_field('user').related_model
+        return User.from_db(router.db_for_read(User),
+                            [User._meta.pk.attname, 'is_active'],
+                            (user_id, is_active))
+
+    def clear_cache(self, user):
+        """
+        Revoke the cached copies of the passed user's keys
+        """
+        prefixes = self.filter(user=user).values_list('prefix', flat=True)
+        cache.delete_many([self.model.cache_key(prefix) for prefix in prefixes])
+
+
+class APIKey(models.Model):
+    """
+    A key for authenticating requests to the accounts API as a user, without
+    the cost of checking their password.
+    """
+    name = models.CharField(max_length=128, blank=True)
+    user = models.ForeignKey(AUTH_USER_MODEL, models.CASCADE,
+                             related_name='account_api_keys')
+
+    # The key is only stored as a hash.  Its first part is kept in the clear
+    # to look it up by.
+    prefix = models.CharField(max_length=16, unique=True)
+    hashed_key = models.CharField(max_length=64)
+
+    is_active = models.BooleanField(default=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = APIKeyManager()
+
+    class Meta:
+        abstract = True
+        verbose_name = _("API key")
+        verbose_name_plural = _("API keys")
+
+    def __str__(self):
+        return "%s (%s...)" % (self.name or self.user, self.prefix)
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cache_key(prefix):
+        return 'oscar_accounts:apikey:%s' % prefix
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Revoke the cached copy straight away.  Deleted keys (including those
+        # deleted with their user) are revoked by a signal receiver.
+        cache.delete(self.cache_key(self.prefix))
+
+
+class IdempotencyKeyManager(models.Manager):
+
+    def expired(self):
+        ttl = getattr(settings, 'ACCOUNTS_IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+        cutoff = timezone.now() - datetime.timedelta(seconds=ttl)
+        return self.filter(date_created__lt=cutoff)
+
+    def delete_expired(self, batch_size=1000):
+        """
+        Delete the expired keys in batches.  Return the number deleted.
+        """
+        num_deleted = 0
+        while True:
+            pks = list(self.expired().values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return num_deleted
+            num_deleted += self.filter(pk__in=pks).delete()[0]
+
+
+class IdempotencyKey(models.Model):
+    """
+    The response to an API request made with an Idempotency-Key header, which
+    is replayed if the request is retried with the same key.
+
+    It is saved in the same database transaction as any transfer that the
+    request makes, so a request is either made and recorded or neither.
+    """
+    user = models.ForeignKey(AUTH_USER_MODEL, models.CASCADE,
+                             related_name='account_idempotency_keys')
+    key = models.CharField(max_length=255)
+
+    # A hash of the request's path and body, so that reusing a key for a
+    # different request can be detected
+    fingerprint = models.CharField(max_length=64)
+
+    status_code = models.PositiveSmallIntegerField()
+    content_type = models.CharField(max_length=128, default='application/json')
+    content = models.TextField()
+    location = models.CharField(max_length=255, blank=True)
+
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = IdempotencyKeyManager()
+
+    class Meta:
+        abstract = True
+        unique_together = ('user', 'key')
+        verbose_name = _("Idempotency key")
+        verbose_name_plural = _("Idempotency keys")
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def make_fingerprint(path, body):
+        return hashlib.sha256(path.encode('utf-8') + b'\n' + body).hexdigest()
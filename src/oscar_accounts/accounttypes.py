@@ -0,0 +1,116 @@
+"""
+A per-process cache of the account type tree.
+
+The tree is small and rarely changes, so the whole of it is loaded with one
+query and kept with the full name and children of each type.  Saving or
+deleting an account type changes a version key in the shared cache, which
+makes every process reload the tree.  As with the system accounts (see
+oscar_accounts.core), the tree is also reloaded once it is older than
+ACCOUNTS_LOCAL_CACHE_TIMEOUT, and isn't kept if the shared cache doesn't work.
+"""
+import time
+from collections import defaultdict
+
+from django.db import router
+from oscar.core.loading import get_model
+
+from oscar_accounts import core
+
+VERSION_KEY = 'oscar_accounts:account_types:version'
+
+_state = {'version': None, 'loaded': None, 'tree': None}
+
+
+class Tree(object):
+
+    def __init__(self, model, db, field_names, rows):
+        self.model = model
+        self.db = db
+        self.field_names = field_names
+        self.rows = {}
+        self.pks_by_name = defaultdict(list)
+        self.children = defaultdict(list)
+        self.full_names = {}
+        pks_by_path = {}
+        pk_index = field_names.index(model._meta.pk.attname)
+        path_index = field_names.index('path')
+        name_index = field_names.index('name')
+        # Rows are ordered by path, so parents come before their children
+        for values in rows:
+            pk, path, name = (
+                values[pk_index], values[path_index], values[name_index])
+            self.rows[pk] = values
+            self.pks_by_name[name].append(pk)
+            pks_by_path[path] = pk
+            parent = pks_by_path.get(path[:-model.steplen])
+            if parent is None:
+                self.full_names[pk] = name
+            else:
+                self.children[parent].append(pk)
+                self.full_names[pk] = "%s / %s" % (self.full_names[parent], name)
+
+    def instance(self, pk):
+        return self.model.from_db(self.db, self.field_names, self.rows[pk])
+
+
+def get(name):
+    """
+    Return the account type with the passed name.  Like
+    AccountType.objects.get(name=name), raise DoesNotExist if there isn't one
+    and MultipleObjectsReturned if there is more than one.
+    """
+    tree = _get_tree()
+    pks = tree.pks_by_name.get(name, [])
+    if not pks:
+        raise tree.model.DoesNotExist(
+            "AccountType matching query does not exist.")
+    if len(pks) > 1:
+        raise tree.model.MultipleObjectsReturned(
+            "get() returned more than one AccountType -- it returned %d!" % len(pks))
+    return tree.instance(pks[0])
+
+
+def get_children(account_type):
+    """
+    Return a list of the children of the passed account type
+    """
+    tree = _get_tree()
+    return [tree.instance(pk) for pk in tree.children.get(account_type.pk, ())]
+
+
+def full_name(account_type):
+    """
+    Return the names of the passed account type and its ancestors, joined
+    with slashes, or None if the type isn't in the tree
+    """
+    return _get_tree().full_names.get(account_type.pk)
+
+
+def clear_cache():
+    """
+    Make every process reload the tree
+    """
+    core.change_version(VERSION_KEY)
+
+
+def _get_tree():
+    version = core.shared_version(VERSION_KEY)
+    if _state['tree'] is not None and core.is_current(
+            _state['version'], _state['loaded'], version):
+        return _state['tree']
+    loaded = time.monotonic()
+    tree = _load()
+    if version is None:
+        _state.update(tree=None, version=None, loaded=None)
+    else:
+        _state.update(tree=tree, version=version, loaded=loaded)
+    return tree
+
+
+def _load():
+    AccountType = get_model('oscar_accounts', 'AccountType')
+    field_names = [f.attname for f in AccountType._meta.concrete_fields]
+    db = router.db_for_read(AccountType)
+    rows = AccountType.objects.using(db).order_by('path').values_list(
+        *field_names)
+    return Tree(AccountType, db, field_names, list(rows))
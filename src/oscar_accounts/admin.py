@@ -6,7 +6,10 @@ AccountType = get_model('oscar_accounts', 'AccountType')
 Account = get_model('oscar_accounts', 'Account')
 Transfer = get_model('oscar_accounts', 'Transfer')
 Transaction = get_model('oscar_accounts', 'Transaction')
+PendingTransfer = get_model('oscar_accounts', 'PendingTransfer')
 IPAddressRecord = get_model('oscar_accounts', 'IPAddressRecord')
+APIKey = get_model('oscar_accounts', 'APIKey')
+IdempotencyKey = get_model('oscar_accounts', 'IdempotencyKey')
 
 
 class AccountAdmin(admin.ModelAdmin):
@@ -28,6 +31,14 @@ class TransactionAdmin(admin.ModelAdmin):
     readonly_fields = ('transfer', 'account', 'amount', 'date_created')
 
 
+class PendingTransferAdmin(admin.ModelAdmin):
+    list_display = ['id', 'amount', 'source', 'destination', 'status',
+                    'transfer', 'date_created', 'date_processed']
+    list_filter = ['status']
+    readonly_fields = ('amount', 'source', 'destination', 'user', 'status',
+                       'transfer', 'error', 'date_created', 'date_processed')
+
+
 class IPAddressAdmin(admin.ModelAdmin):
     list_display = ['ip_address', 'total_failures', 'consecutive_failures',
                     'is_temporarily_blocked', 'is_permanently_blocked',
@@ -35,8 +46,22 @@ class IPAddressAdmin(admin.ModelAdmin):
     readonly_fields = ('ip_address', 'total_failures', 'date_last_failure')
 
 
+class APIKeyAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'name', 'user', 'is_active', 'date_created']
+    readonly_fields = ('prefix', 'hashed_key', 'date_created')
+
+
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'status_code', 'date_created']
+    readonly_fields = ('key', 'user', 'fingerprint', 'status_code', 'content',
+                       'location', 'date_created')
+
+
 admin.site.register(AccountType, TreeAdmin)
 admin.site.register(Account, AccountAdmin)
 admin.site.register(Transfer, TransferAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(PendingTransfer, PendingTransferAdmin)
 admin.site.register(IPAddressRecord, IPAddressAdmin)
+admin.site.register(APIKey, APIKeyAdmin)
+admin.site.register(IdempotencyKey, IdempotencyKeyAdmin)
@@ -17,13 +17,19 @@ class AccountsAPIConfig(OscarConfig):
 
         self.accounts_view = views.AccountsView
         self.account_view = views.AccountView
+        self.account_transactions_view = views.AccountTransactionsView
         self.account_redemptions_view = views.AccountRedemptionsView
         self.account_refunds_view = views.AccountRefundsView
 
         self.transfer_view = views.TransferView
+        self.transfer_feed_view = views.TransferFeedView
         self.transfer_reverse_view = views.TransferReverseView
         self.transfer_refunds_view = views.TransferRefundsView
 
+        self.pending_transfer_view = views.PendingTransferView
+
+        self.batch_view = views.BatchView
+
     def get_urls(self):
         urls = [
             path('accounts/', self.accounts_view.as_view(), name='accounts'),
@@ -34,6 +40,12 @@ class AccountsAPIConfig(OscarConfig):
                 name='account-redemptions'
             ),
             path('accounts/<str:code>/refunds/', self.account_refunds_view.as_view(), name='account-refunds'),
+            path(
+                'accounts/<str:code>/transactions/',
+                self.account_transactions_view.as_view(),
+                name='account-transactions'
+            ),
+            path('transfers/feed/', self.transfer_feed_view.as_view(), name='transfer-feed'),
             re_path(
                 r'^transfers/(?P<reference>[A-Z0-9]{32})/$',
                 self.transfer_view.as_view(),
@@ -49,8 +61,14 @@ class AccountsAPIConfig(OscarConfig):
                 self.transfer_refunds_view.as_view(),
                 name='transfer-refunds'
             ),
+            path(
+                'pending-transfers/<int:pk>/',
+                self.pending_transfer_view.as_view(),
+                name='pending-transfer'
+            ),
+            path('batch/', self.batch_view.as_view(), name='batch'),
         ]
         return self.post_process_urls(urls)
 
     def get_url_decorator(self, url_name):
-        return lambda x: csrf_exempt(decorators.basicauth(x))
+        return lambda x: csrf_exempt(decorators.apikey_or_basicauth(x))
@@ -3,6 +3,7 @@ import base64
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.http import HttpResponse
+from oscar.core.loading import get_model
 
 
 def view_or_basicauth(view, request, *args, **kwargs):
@@ -34,3 +35,26 @@ def basicauth(view_func):
     def wrapper(request, *args, **kwargs):
         return view_or_basicauth(view_func, request, *args, **kwargs)
     return wrapper
+
+
+def view_or_apikey_or_basicauth(view, request, *args, **kwargs):
+    # Check for a valid API key, which is much cheaper to check than a
+    # password
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'api-key':
+        APIKey = get_model('oscar_accounts', 'APIKey')
+        user = APIKey.objects.authenticate(auth[1])
+        if user is not None:
+            request.user = user
+            return view(request, *args, **kwargs)
+    return view_or_basicauth(view, request, *args, **kwargs)
+
+
+def apikey_or_basicauth(view_func):
+    """
+    API key or basic auth decorator
+    """
+    def wrapper(request, *args, **kwargs):
+        return view_or_apikey_or_basicauth(
+            view_func, request, *args, **kwargs)
+    return wrapper
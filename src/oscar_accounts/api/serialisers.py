@@ -0,0 +1,21 @@
+"""
+Fast encoding of the accounts API's responses, with orjson if it is installed.
+
+See oscar_accounts.serialisers for building the data itself without
+per-object queries.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    """
+    Encode the passed data as JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
@@ -1,3 +1,5 @@
+import base64
+import hashlib
 import json
 from decimal import Decimal as D
 from decimal import InvalidOperation
@@ -5,20 +7,68 @@ from decimal import InvalidOperation
 from dateutil import parser
 from django import http
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
 from django.shortcuts import get_object_or_404
-from django.urls import reverse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import generic
+from django.views.decorators.http import condition
 from oscar.core.loading import get_model
 
-from oscar_accounts import codes, exceptions, facade, names
+from oscar_accounts import (
+    accounttypes, codefilter, codes, core, exceptions, facade, names,
+    serialisers, striping)
 from oscar_accounts.api import errors
+from oscar_accounts.api.serialisers import dumps
 
 Account = get_model('oscar_accounts', 'Account')
 AccountType = get_model('oscar_accounts', 'AccountType')
+IdempotencyKey = get_model('oscar_accounts', 'IdempotencyKey')
+PendingTransfer = get_model('oscar_accounts', 'PendingTransfer')
 Transfer = get_model('oscar_accounts', 'Transfer')
 
 
+def get_account_or_404(code):
+    # Reject malformed and unknown codes without a database query
+    if not codes.is_valid(code) or not codefilter.might_exist(code):
+        raise http.Http404
+    return get_object_or_404(Account, code=code)
+
+
+def make_etag(*values):
+    return hashlib.blake2b(repr(values).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+def account_etag(request, code):
+    """
+    Return an ETag for the account with the passed code, from its version
+    (which changes with every balance update) and the other fields that it is
+    serialised with, without loading the whole account.
+    """
+    if not codes.is_valid(code) or not codefilter.might_exist(code):
+        return None
+    row = Account.objects.filter(code=code).values_list(
+        'name', 'version', 'status', 'start_date', 'end_date').first()
+    if row is None or (row[0] and striping.is_striped_name(row[0])):
+        # The balance updates of striped accounts don't change their version
+        return None
+    return make_etag(*row)
+
+
+def transfer_etag(request, reference):
+    """
+    Return an ETag for the transfer with the passed reference.  Transfers
+    can't be changed, but their refundable amount changes with each transfer
+    made against them.
+    """
+    row = Transfer.objects.filter(reference=reference).values('pk').annotate(
+        last_related=Max('related_transfers__id')).values_list(
+        'pk', 'last_related').first()
+    return make_etag(*row) if row else None
+
+
 class InvalidPayload(Exception):
     pass
 
@@ -46,7 +96,7 @@ class JSONView(generic.View):
     def error(self, status_code, code, msg):
         data = {'code': code if code is not None else '',
                 'message': msg if msg is not None else errors.message(code)}
-        return http.HttpResponse(json.dumps(data),
+        return http.HttpResponse(dumps(data),
                                  status=status_code,
                                  content_type='application/json')
 
@@ -54,16 +104,64 @@ class JSONView(generic.View):
 
     def created(self, url, data):
         response = http.HttpResponse(
-            json.dumps(data), content_type='application/json',
+            dumps(data), content_type='application/json',
             status=201)
         response['Location'] = url
         return response
 
     def ok(self, data):
-        return http.HttpResponse(json.dumps(data),
+        return http.HttpResponse(dumps(data),
                                  content_type='application/json')
 
     def post(self, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if key is None:
+            return self.handle_post(request)
+        if not key or len(key) > 255:
+            return self.bad_request(
+                msg="Idempotency-Key must be between 1 and 255 characters")
+        return self.handle_idempotent_post(request, key)
+
+    def handle_idempotent_post(self, request, key):
+        """
+        Handle a request made with an Idempotency-Key header, replaying the
+        stored response if the key has been used before
+        """
+        fingerprint = IdempotencyKey.make_fingerprint(
+            request.path, request.body)
+        stored = IdempotencyKey.objects.filter(
+            user=request.user, key=key).first()
+        if stored is None:
+            try:
+                with transaction.atomic():
+                    response = self.handle_post(request)
+                    IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=fingerprint,
+                        status_code=response.status_code,
+                        content_type=response['Content-Type'],
+                        content=response.content.decode('utf-8'),
+                        location=response.get('Location', ''))
+                return response
+            except IntegrityError:
+                # A concurrent request with the same key got there first, so
+                # this one has been rolled back
+                stored = IdempotencyKey.objects.filter(
+                    user=request.user, key=key).first()
+                if stored is None:
+                    raise
+        if stored.fingerprint != fingerprint:
+            return self.error(
+                422, None,
+                "Idempotency-Key has already been used for a different request")
+        response = http.HttpResponse(stored.content,
+                                     status=stored.status_code,
+                                     content_type=stored.content_type)
+        if stored.location:
+            response['Location'] = stored.location
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def handle_post(self, request):
         # Only accept JSON
         if request.META['CONTENT_TYPE'] != 'application/json':
             return self.bad_request(
@@ -145,7 +243,7 @@ class AccountsView(JSONView):
         if value not in names.DEFERRED_INCOME_ACCOUNT_TYPES:
             raise InvalidPayload('Unrecognised account type')
         try:
-            acc_type = AccountType.objects.get(name=value)
+            acc_type = accounttypes.get(value)
         except AccountType.DoesNotExist:
             raise InvalidPayload('Unrecognised account type')
         return acc_type
@@ -166,7 +264,7 @@ class AccountsView(JSONView):
                 msg=e.message)
         else:
             return self.created(
-                reverse('oscar_accounts_api:account', kwargs={'code': account.code}),
+                serialisers.url('account', 'code', account.code),
                 account.as_dict())
 
     def create_account(self, payload):
@@ -178,7 +276,7 @@ class AccountsView(JSONView):
         )
 
     def load_account(self, account, payload):
-        bank = Account.objects.get(name=names.BANK)
+        bank = core.bank_account()
         facade.transfer(bank, account, payload['amount'],
                         description="Load from bank")
 
@@ -186,12 +284,98 @@ class AccountsView(JSONView):
 class AccountView(JSONView):
     """
     Fetch details of an account
+
+    Responses have an ETag, so clients polling for changes can make
+    conditional requests which are answered with a 304 without loading the
+    account.
     """
+    @method_decorator(condition(etag_func=account_etag))
     def get(self, request, *args, **kwargs):
-        account = get_object_or_404(Account, code=kwargs['code'])
+        account = get_account_or_404(kwargs['code'])
         return self.ok(account.as_dict())
 
 
+class AccountTransactionsView(JSONView):
+    """
+    Page through an account's transactions, newest first
+
+    Pages are fetched with a cursor (the position of the last transaction of
+    the previous page) rather than an offset, so that deep pages are as quick
+    to fetch as the first.  The transactions can be filtered with the
+    start_date (inclusive) and end_date (exclusive) query parameters.
+    """
+    default_page_size = 50
+
+    def get(self, request, *args, **kwargs):
+        account = get_account_or_404(kwargs['code'])
+        try:
+            page_size = self.get_page_size()
+            transactions = self.filter(
+                account.transactions.all(), request.GET)
+        except InvalidPayload as e:
+            return self.bad_request(msg=str(e))
+        transactions = transactions.select_related(
+            'transfer', 'transfer__source', 'transfer__destination').order_by(
+            '-date_created', '-id')
+        page = list(transactions[:page_size + 1])
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            params = request.GET.copy()
+            params['cursor'] = self.encode_cursor(page[-1])
+            next_url = '%s?%s' % (request.path, params.urlencode())
+        return self.ok({
+            'transactions': [txn.as_dict() for txn in page],
+            'next_url': next_url})
+
+    def get_page_size(self):
+        max_page_size = getattr(settings, 'ACCOUNTS_API_MAX_PAGE_SIZE', 500)
+        try:
+            page_size = int(self.request.GET.get(
+                'page_size', self.default_page_size))
+        except ValueError:
+            raise InvalidPayload("Page size must be an integer")
+        if not 0 < page_size <= max_page_size:
+            raise InvalidPayload(
+                "Page size must be between 1 and %d" % max_page_size)
+        return page_size
+
+    def filter(self, transactions, params):
+        if 'start_date' in params:
+            transactions = transactions.filter(
+                date_created__gte=self.parse_date(params['start_date']))
+        if 'end_date' in params:
+            transactions = transactions.filter(
+                date_created__lt=self.parse_date(params['end_date']))
+        if 'cursor' in params:
+            date_created, pk = self.decode_cursor(params['cursor'])
+            earlier = Q(date_created__lt=date_created)
+            transactions = transactions.filter(
+                earlier | Q(date_created=date_created, id__lt=pk))
+        return transactions
+
+    def parse_date(self, value):
+        try:
+            date = parser.parse(value)
+        except (ValueError, OverflowError):
+            raise InvalidPayload("'%s' is not a valid date" % value)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def encode_cursor(self, txn):
+        value = '%s,%d' % (txn.date_created.isoformat(), txn.pk)
+        return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            date_created, pk = value.rsplit(',', 1)
+            return parser.isoparse(date_created), int(pk)
+        except (ValueError, UnicodeError):
+            raise InvalidPayload("Invalid cursor")
+
+
 class AccountRedemptionsView(JSONView):
     required_keys = ('amount',)
     optional_keys = ('merchant_reference',)
@@ -209,14 +393,14 @@ class AccountRedemptionsView(JSONView):
         """
         Redeem an amount from the selected giftcard
         """
-        account = get_object_or_404(Account, code=self.kwargs['code'])
+        account = get_account_or_404(self.kwargs['code'])
         if not account.is_active():
             raise ValidationError(errors.ACCOUNT_INACTIVE)
         amt = payload['amount']
         if not account.is_debit_permitted(amt):
             raise ValidationError(errors.INSUFFICIENT_FUNDS)
 
-        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        redemptions = core.redemptions_account()
         try:
             transfer = facade.transfer(
                 account, redemptions, amt,
@@ -226,7 +410,7 @@ class AccountRedemptionsView(JSONView):
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
         return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
+            serialisers.url('transfer', 'reference', transfer.reference),
             transfer.as_dict())
 
 
@@ -244,10 +428,10 @@ class AccountRefundsView(JSONView):
         return amount
 
     def valid_payload(self, payload):
-        account = get_object_or_404(Account, code=self.kwargs['code'])
+        account = get_account_or_404(self.kwargs['code'])
         if not account.is_active():
             raise ValidationError(errors.ACCOUNT_INACTIVE)
-        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        redemptions = core.redemptions_account()
         try:
             transfer = facade.transfer(
                 redemptions, account, payload['amount'],
@@ -257,16 +441,86 @@ class AccountRefundsView(JSONView):
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
         return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
+            serialisers.url('transfer', 'reference', transfer.reference),
             transfer.as_dict())
 
 
 class TransferView(JSONView):
+    @method_decorator(condition(etag_func=transfer_etag))
     def get(self, request, *args, **kwargs):
-        transfer = get_object_or_404(Transfer, reference=kwargs['reference'])
+        transfer = get_object_or_404(
+            serialisers.with_related(Transfer.objects.all()),
+            reference=kwargs['reference'])
         return self.ok(transfer.as_dict())
 
 
+class TransferFeedView(JSONView):
+    """
+    Stream the transfers made after a cursor, oldest first, as
+    newline-delimited JSON
+
+    The cursor is the feed position of the last transfer that the client has
+    seen (the 'position' of each line), so a client can tail the ledger by
+    passing the position of the last line it processed as the 'after'
+    parameter of its next request.  Positions are assigned to transfers once
+    they have committed, in the order they are first read, so a transfer
+    whose database transaction commits after a later one's isn't skipped.
+
+    Each transfer has two transactions: a debit of the amount from the source
+    account and a credit of it to the destination account.
+    """
+    default_page_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        max_page_size = getattr(settings, 'ACCOUNTS_API_MAX_FEED_PAGE_SIZE', 10000)
+        try:
+            after = int(request.GET.get('after', 0))
+            page_size = int(request.GET.get(
+                'page_size', self.default_page_size))
+        except ValueError:
+            return self.bad_request(
+                msg="The cursor and page size must be integers")
+        if not 0 < page_size <= max_page_size:
+            return self.bad_request(
+                msg="Page size must be between 1 and %d" % max_page_size)
+        Transfer.objects.assign_feed_positions(page_size)
+        transfers = Transfer.objects.filter(
+            feed_position__gt=after,
+        ).select_related('source', 'destination', 'parent').order_by(
+            'feed_position')
+        return http.StreamingHttpResponse(
+            (dumps(self.serialise(transfer)) + b'\n'
+             for transfer in transfers[:page_size].iterator()),
+            content_type='application/x-ndjson')
+
+    def serialise(self, transfer):
+        return {
+            'id': transfer.pk,
+            'position': transfer.feed_position,
+            'reference': transfer.reference,
+            'parent_reference': transfer.parent.reference if transfer.parent else None,
+            'source_code': transfer.source.code,
+            'source_name': transfer.source.name,
+            'destination_code': transfer.destination.code,
+            'destination_name': transfer.destination.name,
+            'amount': "%.2f" % transfer.amount,
+            'datetime': transfer.date_created.isoformat(),
+            'merchant_reference': transfer.merchant_reference,
+            'description': transfer.description,
+            'username': transfer.username}
+
+
+class PendingTransferView(JSONView):
+    """
+    Fetch the status of a queued transfer
+    """
+    def get(self, request, *args, **kwargs):
+        pending = get_object_or_404(
+            PendingTransfer.objects.select_related('transfer'),
+            pk=kwargs['pk'])
+        return self.ok(pending.as_dict())
+
+
 class TransferReverseView(JSONView):
     optional_keys = ('merchant_reference',)
 
@@ -284,7 +538,7 @@ class TransferReverseView(JSONView):
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
         return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
+            serialisers.url('transfer', 'reference', transfer.reference),
             transfer.as_dict())
 
 
@@ -322,5 +576,184 @@ class TransferRefundsView(JSONView):
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
         return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
+            serialisers.url('transfer', 'reference', transfer.reference),
             transfer.as_dict())
+
+
+class BatchView(JSONView):
+    """
+    Make a batch of redemptions, refunds and reversals in one request
+
+    The body is either a JSON array of operations or, so that large batches
+    needn't be held in memory, newline-delimited JSON (one operation per
+    line, with CONTENT_TYPE 'application/x-ndjson').  Each operation has an
+    'op' key of 'redeem', 'refund' or 'reverse' and the keys of the matching
+    single-operation endpoint:
+
+        {"op": "redeem", "code": "ABCD1234", "amount": "10.00"}
+        {"op": "refund", "code": "ABCD1234", "amount": "2.50"}
+        {"op": "reverse", "reference": "..."}
+
+    The response is newline-delimited JSON with one result per operation, in
+    order.  By default each operation is made (or fails) on its own and the
+    results are streamed as they complete.  With ?atomic=1, either all of the
+    operations are made or none are: processing stops at the first failure,
+    which is returned as the error response.
+
+    Only atomic batches can be made with an Idempotency-Key header, as the
+    results of the others are streamed rather than stored.
+    """
+    content_types = ('application/json', 'application/x-ndjson')
+    operations = {
+        'redeem': 'make_redemption',
+        'refund': 'make_refund',
+        'reverse': 'make_reversal'}
+
+    def post(self, request, *args, **kwargs):
+        has_key = 'HTTP_IDEMPOTENCY_KEY' in request.META
+        if has_key and not self.is_atomic(request):
+            return self.bad_request(
+                msg="Idempotency-Key is only supported for atomic batches")
+        return super().post(request, *args, **kwargs)
+
+    def is_atomic(self, request):
+        return request.GET.get('atomic') in ('1', 'true')
+
+    def handle_post(self, request):
+        content_type = request.content_type
+        if content_type not in self.content_types:
+            return self.bad_request(
+                msg="Requests must have CONTENT_TYPE 'application/json' or "
+                    "'application/x-ndjson'")
+        if content_type == 'application/json':
+            try:
+                operations = json.loads(request.body.decode('utf-8'))
+            except ValueError:
+                return self.bad_request(
+                    msg="JSON payload could not be decoded")
+            if not isinstance(operations, list):
+                return self.bad_request(
+                    msg="JSON payload must be an array of operations")
+        else:
+            operations = self.read_lines(request)
+        self.redemptions = None
+        if self.is_atomic(request):
+            return self.process_atomically(operations)
+        return self.stream(
+            self.process_operation(index, operation)
+            for index, operation in enumerate(operations))
+
+    def read_lines(self, request):
+        for line in request:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode('utf-8'))
+            except ValueError:
+                yield None
+
+    def stream(self, results):
+        return http.StreamingHttpResponse(
+            (dumps(result) + b'\n' for result in results),
+            content_type='application/x-ndjson')
+
+    def process_atomically(self, operations):
+        max_size = getattr(settings, 'ACCOUNTS_API_MAX_ATOMIC_BATCH_SIZE', 1000)
+        results = []
+        with transaction.atomic():
+            for index, operation in enumerate(operations):
+                if index >= max_size:
+                    transaction.set_rollback(True)
+                    return self.bad_request(
+                        msg="Atomic batches are limited to %d operations" % max_size)
+                result = self.process_operation(index, operation)
+                if result['status'] != 201:
+                    transaction.set_rollback(True)
+                    return http.HttpResponse(
+                        dumps(result), status=result['status'],
+                        content_type='application/json')
+                results.append(result)
+        # The results are all in memory by now, so aren't streamed
+        return http.HttpResponse(
+            b''.join(dumps(result) + b'\n' for result in results),
+            content_type='application/x-ndjson')
+
+    def process_operation(self, index, operation):
+        result = {'index': index}
+        try:
+            if not isinstance(operation, dict):
+                raise InvalidPayload("Operation could not be decoded")
+            if operation.get('op') not in self.operations:
+                raise InvalidPayload("Unrecognised operation")
+            transfer = getattr(self, self.operations[operation['op']])(operation)
+        except InvalidPayload as e:
+            result.update(status=400, code='', message=str(e))
+        except ValidationError as e:
+            result.update(status=403, code=e.code,
+                          message=errors.message(e.code))
+        except http.Http404:
+            result.update(status=404, code='', message="Not found")
+        except exceptions.AccountException as e:
+            result.update(status=403, code=errors.CANNOT_CREATE_TRANSFER,
+                          message=e.message)
+        else:
+            result.update(
+                status=201,
+                location=serialisers.url(
+                    'transfer', 'reference', transfer.reference),
+                transfer=transfer.as_dict())
+        return result
+
+    def get_redemptions_account(self):
+        # Looked up once per batch
+        if self.redemptions is None:
+            self.redemptions = core.redemptions_account()
+        return self.redemptions
+
+    def clean_amount(self, value):
+        try:
+            amount = D(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise InvalidPayload("'%s' is not a valid amount" % value)
+        if amount < 0:
+            raise InvalidPayload("Amount must be positive")
+        return amount
+
+    def get_account(self, operation):
+        for key in ('code', 'amount'):
+            if key not in operation:
+                raise InvalidPayload(
+                    "Mandatory field '%s' is missing from operation" % key)
+        account = get_account_or_404(str(operation['code']))
+        if not account.is_active():
+            raise ValidationError(errors.ACCOUNT_INACTIVE)
+        return account
+
+    def make_redemption(self, operation):
+        account = self.get_account(operation)
+        amount = self.clean_amount(operation['amount'])
+        if not account.is_debit_permitted(amount):
+            raise ValidationError(errors.INSUFFICIENT_FUNDS)
+        return facade.transfer(
+            account, self.get_redemptions_account(), amount,
+            merchant_reference=operation.get('merchant_reference', None))
+
+    def make_refund(self, operation):
+        account = self.get_account(operation)
+        amount = self.clean_amount(operation['amount'])
+        return facade.transfer(
+            self.get_redemptions_account(), account, amount,
+            merchant_reference=operation.get('merchant_reference', None))
+
+    def make_reversal(self, operation):
+        if 'reference' not in operation:
+            raise InvalidPayload(
+                "Mandatory field 'reference' is missing from operation")
+        to_reverse = get_object_or_404(Transfer,
+                                       reference=str(operation['reference']))
+        if not to_reverse.source.is_active():
+            raise ValidationError(errors.ACCOUNT_INACTIVE)
+        return facade.reverse(
+            to_reverse,
+            merchant_reference=operation.get('merchant_reference', None))
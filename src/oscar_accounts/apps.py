@@ -7,3 +7,7 @@ class AccountsConfig(OscarConfig):
     name = 'oscar_accounts'
     verbose_name = _('Accounts')
     namespace = 'oscar_accounts'
+
+    def ready(self):
+        super().ready()
+        from oscar_accounts import receivers  # noqa
@@ -5,6 +5,8 @@ from django.utils.translation import gettext_lazy as _
 from oscar.core.loading import get_model
 from oscar.templatetags.currency_filters import currency
 
+from oscar_accounts import codefilter, codes
+
 Account = get_model('oscar_accounts', 'Account')
 
 
@@ -16,8 +18,12 @@ class ValidAccountForm(forms.Form):
         super().__init__(*args, **kwargs)
 
     def clean_code(self):
-        code = self.cleaned_data['code'].strip().upper()
-        code = code.replace('-', '')
+        code = codes.normalise(self.cleaned_data['code'])
+        if not codes.is_valid(code):
+            raise forms.ValidationError(
+                _("No account found with this code"), code='malformed')
+        if not codefilter.might_exist(code):
+            raise forms.ValidationError(_("No account found with this code"))
         try:
             self.account = Account.objects.get(
                 code=code)
@@ -0,0 +1,126 @@
+import datetime
+import logging
+from decimal import Decimal as D
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import (
+    DateTimeField, DecimalField, Max, Min, OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+BalanceCheckpoint = get_model('oscar_accounts', 'BalanceCheckpoint')
+Transaction = get_model('oscar_accounts', 'Transaction')
+
+logger = logging.getLogger('oscar_accounts')
+
+DAY, MONTH = 'day', 'month'
+PERIODS = {
+    DAY: relativedelta(days=1),
+    MONTH: relativedelta(months=1),
+}
+
+# Period boundaries more recent than this are skipped, so that transactions
+# that were still being written at the boundary are included.
+SAFETY_MARGIN = datetime.timedelta(minutes=10)
+
+# Earlier than any transaction, for accounts without a checkpoint
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def period_start(date, period):
+    """
+    Return the start of the period containing the passed datetime
+    """
+    date = date.astimezone(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    if period == MONTH:
+        date = date.replace(day=1)
+    return date
+
+
+def with_balances_as_of(accounts, date):
+    """
+    Annotate the passed queryset of accounts with their balance at the passed
+    datetime (as Account.balance_as_of gives it) as historical_balance, so
+    that the balances of many accounts are computed in a single query
+    """
+    amount = DecimalField(decimal_places=2, max_digits=12)
+    checkpoint = BalanceCheckpoint.objects.filter(
+        account=OuterRef('pk'), date__lte=date).order_by('-date')
+    accounts = accounts.annotate(
+        checkpoint_date=Coalesce(
+            Subquery(checkpoint.values('date')[:1]),
+            Value(EPOCH, output_field=DateTimeField())))
+    total = Transaction.objects.filter(
+        account=OuterRef('pk'), date_created__lt=date,
+        date_created__gte=OuterRef('checkpoint_date')).order_by().values(
+            'account').annotate(total=Sum('amount')).values('total')
+    opening = Coalesce(Subquery(checkpoint.values('balance')[:1]),
+                       Value(D('0.00')), output_field=amount)
+    since = Coalesce(Subquery(total), Value(D('0.00')), output_field=amount)
+    return accounts.annotate(historical_balance=opening + since)
+
+
+def create_checkpoints(period=DAY, until=None, batch_size=1000):
+    """
+    Create balance checkpoints for every period boundary since the last run,
+    up to the passed datetime (which defaults to now).
+
+    A checkpoint is only written for the accounts with transactions in the
+    period that ends at the boundary - the balance of other accounts is given
+    by their previous checkpoint.  Returns the number of checkpoints created.
+    """
+    if until is None:
+        until = timezone.now() - SAFETY_MARGIN
+    start = BalanceCheckpoint.objects.aggregate(date=Max('date'))['date']
+    if start is None:
+        first = Transaction.objects.aggregate(date=Min('date_created'))['date']
+        if first is None:
+            return 0
+        start = period_start(first, period)
+
+    num_created = 0
+    boundary = period_start(start, period) + PERIODS[period]
+    while boundary <= until:
+        num_created += create_checkpoints_at(start, boundary, batch_size)
+        start = boundary
+        boundary += PERIODS[period]
+    return num_created
+
+
+def create_checkpoints_at(start, end, batch_size=1000):
+    """
+    Create checkpoints at the passed end date for all accounts with
+    transactions between the passed dates.  The previous checkpoint of each
+    account must not be later than the start date.
+
+    The checkpoints are created in a single transaction, as the next run
+    starts from the latest checkpoint and would otherwise build on an older
+    checkpoint for the accounts that were missed.
+    """
+    with transaction.atomic():
+        opening_balance = BalanceCheckpoint.objects.filter(
+            account=OuterRef('account'), date__lte=start).order_by(
+                '-date').values('balance')[:1]
+        totals = Transaction.objects.filter(
+            date_created__gte=start, date_created__lt=end).order_by().values(
+                'account').annotate(total=Sum('amount'),
+                                    opening=Subquery(opening_balance))
+        checkpoints = []
+        num_created = 0
+        for row in totals.iterator():
+            balance = row['total']
+            if row['opening'] is not None:
+                balance += row['opening']
+            checkpoints.append(BalanceCheckpoint(
+                account_id=row['account'], date=end, balance=balance))
+            if len(checkpoints) == batch_size:
+                BalanceCheckpoint.objects.bulk_create(checkpoints)
+                num_created += len(checkpoints)
+                checkpoints = []
+        BalanceCheckpoint.objects.bulk_create(checkpoints)
+        num_created += len(checkpoints)
+    logger.info("Created %d balance checkpoints at %s", num_created, end)
+    return num_created
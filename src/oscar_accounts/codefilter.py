@@ -0,0 +1,236 @@
+"""
+An in-process Bloom filter of the account codes, which can tell that a code
+doesn't exist without a database query.
+
+The filter is loaded in a background thread, started by warm_up when a worker
+starts or by the first lookup, and no codes are ruled out until it is ready.
+When new accounts are committed, their codes are published in the shared cache
+(see add_many) and the other processes add them to their filters before they
+next rule out a code.  If a process can't tell that it has every published
+code, eg because the cache evicted some, it doesn't rule out any codes (so
+they are looked up in the database) until it has reloaded its filter in the
+background, which it does at most once per refresh interval.
+
+This relies on a cache that is shared between processes, such as memcached or
+Redis.  Without one, the filter never rules out codes.
+
+Sized for a 1% false positive rate, it takes about 1.2 bytes per code, ie
+around 12 MB for 10 million codes.  Room is left for the number of codes to
+double before the filter is rebuilt, so allow 24 MB per process.
+"""
+import hashlib
+import logging
+import math
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from oscar.core.loading import get_model
+
+SEQUENCE_KEY = 'oscar_accounts:codes:sequence'
+BATCH_KEY = 'oscar_accounts:codes:%d'
+
+# How long published codes are kept in the cache, and the most batches of
+# them a process reads to catch up before it reloads its filter instead
+BATCH_TIMEOUT = 24 * 60 * 60
+MAX_CATCH_UP = 1000
+
+logger = logging.getLogger('oscar_accounts')
+
+_lock = threading.Lock()
+_state = {'filter': None, 'sequence': None, 'attempted': None, 'thread': None}
+
+
+def enabled():
+    return getattr(settings, 'ACCOUNTS_CODE_FILTER', False)
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.num_bits = int(math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, code):
+        # Derive the positions from two halves of one digest (Kirsch and
+        # Mitzenmacher's double hashing)
+        digest = hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, code):
+        for position in self._positions(code):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, code):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(code))
+
+
+def might_exist(code):
+    """
+    Return False if no account has the passed code, and True if one might.
+    """
+    if not enabled():
+        return True
+    code_filter = _get_filter()
+    if code_filter is None or code in code_filter:
+        return True
+    # A miss only rules the code out if the filter has every code committed
+    # so far, which it may have gained the code in getting
+    if not _catch_up():
+        return True
+    return code in _state['filter']
+
+
+def add(code):
+    add_many([code])
+
+
+def add_many(codes):
+    """
+    Add the codes of new accounts to this process's filter, if it is loaded,
+    and publish them to the other processes once the current transaction
+    commits.  Account.save does this for each new account; code that creates
+    accounts in other ways (eg with bulk_create) must call it.
+    """
+    codes = [code for code in codes if code]
+    if not enabled() or not codes:
+        return
+    code_filter = _state['filter']
+    if code_filter is not None:
+        with _lock:
+            for code in codes:
+                code_filter.add(code)
+    transaction.on_commit(lambda: _publish(codes))
+
+
+def warm_up():
+    """
+    Start loading the filter in a background thread, unless it is already
+    being loaded.  Call this when a worker process starts, so that the
+    filter is ready by the time requests need it.
+    """
+    if not enabled():
+        return
+    with _lock:
+        thread = _state['thread']
+        if thread is not None and thread.is_alive():
+            return
+        _state['attempted'] = time.monotonic()
+        thread = threading.Thread(
+            target=_load_in_background, name='oscar_accounts.codefilter',
+            daemon=True)
+        _state['thread'] = thread
+        thread.start()
+
+
+def load():
+    """
+    Load the filter from the database in the calling thread, replacing any
+    filter already loaded
+    """
+    _state['attempted'] = time.monotonic()
+    # Read the sequence before the codes, so that any codes committed since
+    # are published after it
+    sequence = _current_sequence()
+    Account = get_model('oscar_accounts', 'Account')
+    accounts = Account.objects.filter(code__isnull=False)
+    # Leave room for the accounts created before the next full load
+    error_rate = getattr(settings, 'ACCOUNTS_CODE_FILTER_ERROR_RATE', 0.01)
+    code_filter = BloomFilter(2 * accounts.count() + 10000, error_rate)
+    for code in accounts.values_list('code', flat=True).iterator():
+        code_filter.add(code)
+    with _lock:
+        _state.update(filter=code_filter, sequence=sequence)
+
+
+def clear():
+    with _lock:
+        _state.update(filter=None, sequence=None, attempted=None)
+
+
+def _current_sequence():
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        # Start the sequence at a random point, so that a process that saw
+        # the sequence before it was evicted can't mistake a new one for it.
+        cache.add(SEQUENCE_KEY, secrets.randbits(48), None)
+        sequence = cache.get(SEQUENCE_KEY)
+    return sequence
+
+
+def _publish(codes):
+    if _current_sequence() is None:
+        return
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        # The sequence was evicted, so every process reloads its filter
+        return
+    cache.set(BATCH_KEY % sequence, codes, BATCH_TIMEOUT)
+
+
+def _get_filter():
+    code_filter = _state['filter']
+    if code_filter is None or code_filter.count >= code_filter.capacity:
+        _load_when_due()
+    return code_filter
+
+
+def _load_when_due():
+    attempted = _state['attempted']
+    interval = getattr(settings, 'ACCOUNTS_CODE_FILTER_REFRESH_INTERVAL', 60)
+    if attempted is None or time.monotonic() - attempted >= interval:
+        warm_up()
+
+
+def _load_in_background():
+    try:
+        load()
+    except Exception:
+        logger.exception("Couldn't load the account code filter")
+    finally:
+        connection.close()
+
+
+def _catch_up():
+    """
+    Add the codes published since the filter was last updated, and return
+    whether it has all of them
+    """
+    sequence = _current_sequence()
+    if sequence is None:
+        # The cache isn't working, so there is no telling what was missed
+        return False
+    if sequence == _state['sequence']:
+        return True
+    with _lock:
+        seen = _state['sequence']
+        if seen is not None and 0 < sequence - seen <= MAX_CATCH_UP:
+            keys = [BATCH_KEY % n for n in range(seen + 1, sequence + 1)]
+            batches = cache.get_many(keys)
+            code_filter = _state['filter']
+            for key in keys:
+                if key not in batches:
+                    # Evicted, or not yet written by the process that
+                    # published it
+                    break
+                for code in batches[key]:
+                    code_filter.add(code)
+                seen += 1
+            _state['sequence'] = seen
+            if seen == sequence:
+                return True
+    _load_when_due()
+    return False
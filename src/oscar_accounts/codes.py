@@ -1,24 +1,128 @@
-import random
+import secrets
 import string
 
+from django.conf import settings
 from oscar.core.loading import get_model
 
 Account = get_model('oscar_accounts', 'Account')
 
+DEFAULT_CHARS = string.ascii_uppercase + string.digits
+
+# The length of the codes generated before check characters were added, which
+# are accepted without one unless ACCOUNTS_LEGACY_CODE_LENGTHS says otherwise
+DEFAULT_LEGACY_CODE_LENGTHS = (12,)
+
+
+def check_digit_enabled():
+    return getattr(settings, 'ACCOUNTS_CODE_CHECK_DIGIT', False)
+
+
+def normalise(code):
+    """
+    Return the passed code as it is stored, ignoring case, whitespace and
+    hyphens
+    """
+    return ''.join(code.split()).replace('-', '').upper()
+
+
+def is_valid(code, chars=None):
+    """
+    Test whether the passed (normalised) code could be an account code,
+    without a database query.
+
+    When check digits are enabled, codes must end with a valid check
+    character, except for legacy codes with one of the lengths in the
+    ACCOUNTS_LEGACY_CODE_LENGTHS setting.
+    """
+    if not code:
+        return False
+    if not check_digit_enabled():
+        return True
+    legacy_lengths = getattr(settings, 'ACCOUNTS_LEGACY_CODE_LENGTHS',
+                             DEFAULT_LEGACY_CODE_LENGTHS)
+    if len(code) in legacy_lengths:
+        return True
+    return _luhn_sum(code, chars or DEFAULT_CHARS, double_last=False) == 0
+
+
+def check_character(code, chars=None):
+    """
+    Return the check character for the passed code, using the Luhn mod N
+    algorithm over the character set.  It detects any single mistyped
+    character and most transpositions of adjacent characters.
+    """
+    chars = chars or DEFAULT_CHARS
+    return chars[-_luhn_sum(code, chars, double_last=True) % len(chars)]
+
+
+def _luhn_sum(code, chars, double_last):
+    base = len(chars)
+    total = 0
+    double = double_last
+    for char in reversed(code):
+        value = chars.find(char)
+        if value < 0:
+            return None
+        if double:
+            value = value * 2 // base + value * 2 % base
+        total += value
+        double = not double
+    return total % base
+
 
 def generate(size=12, chars=None):
     """
     Generate a new account code
 
-    :size: Length of code
+    :size: Length of code (excluding any check character)
+    :chars: Character set to choose from
+    """
+    return generate_many(1, size=size, chars=chars)[0]
+
+
+def generate_many(n, size=12, chars=None, chunk_size=1000, max_attempts=100):
+    """
+    Generate a list of n new, distinct account codes
+
+    Candidate codes are checked against the existing ones in chunks, with one
+    query per chunk, and only the codes that collide are drawn again.  If the
+    ACCOUNTS_CODE_CHECK_DIGIT setting is True, a check character is appended
+    to each code.  Raises ValueError if the codes can't be found within
+    max_attempts draws, eg because existing codes use up nearly all of the
+    possible ones.
+
+    :n: Number of codes
+    :size: Length of code (excluding any check character)
     :chars: Character set to choose from
+    :chunk_size: Maximum number of codes checked in each query
+    :max_attempts: Maximum number of times to draw the codes that collide
     """
     if chars is None:
-        chars = string.ascii_uppercase + string.digits
-    code = ''.join(random.choice(chars) for x in range(size))
-    # Ensure code does not aleady exist
-    try:
-        Account.objects.get(code=code)
-    except Account.DoesNotExist:
-        return code
-    return generate(size=size, chars=chars)
+        chars = DEFAULT_CHARS
+    if n > len(set(chars)) ** size:
+        raise ValueError("Cannot generate %d distinct codes of length %d" % (
+            n, size))
+    check_digit = check_digit_enabled()
+    codes = set()
+    for __ in range(max_attempts):
+        if len(codes) == n:
+            break
+        candidates = set()
+        while len(candidates) < n - len(codes):
+            code = ''.join(secrets.choice(chars) for x in range(size))
+            if check_digit:
+                code += check_character(code, chars)
+            if code not in codes:
+                candidates.add(code)
+        # Ensure codes do not already exist
+        candidates = list(candidates)
+        for i in range(0, len(candidates), chunk_size):
+            chunk = candidates[i:i + chunk_size]
+            existing = set(Account.objects.filter(code__in=chunk).values_list(
+                'code', flat=True))
+            codes.update(code for code in chunk if code not in existing)
+    if len(codes) < n:
+        raise ValueError(
+            "Unable to generate %d new codes of length %d in %d attempts" % (
+                n, size, max_attempts))
+    return list(codes)
@@ -1,13 +1,103 @@
+"""
+Lookups of the named system accounts (see oscar_accounts.names).
+
+The fields of each account, apart from its balance, are cached in the process
+so that looking one up doesn't need a database query.  The balance is always
+loaded from the database when it is first accessed.  Saving or deleting a
+named account changes a version key in the shared cache, which makes every
+process reload its copy.  Copies are also reloaded once they are older than
+ACCOUNTS_LOCAL_CACHE_TIMEOUT, in case the change didn't reach the process,
+and aren't kept at all if the shared cache doesn't work.
+"""
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
 from oscar.core.loading import get_model
 
 from oscar_accounts import names
 
-Account = get_model('oscar_accounts', 'Account')
+VERSION_KEY = 'oscar_accounts:system_accounts:version'
+
+_accounts = {}
+
+
+def get_account(name):
+    """
+    Return the account with the passed name.  Raise Account.DoesNotExist if
+    there isn't one.
+    """
+    version = shared_version(VERSION_KEY)
+    cached = _accounts.get(name)
+    if cached is None or not is_current(cached[0], cached[1], version):
+        cached = (version, time.monotonic()) + _load(name)
+        if version is None:
+            _accounts.pop(name, None)
+        else:
+            _accounts[name] = cached
+    __, __, db, field_names, values = cached
+    Account = get_model('oscar_accounts', 'Account')
+    return Account.from_db(db, field_names, values)
+
+
+def clear_cache():
+    """
+    Make every process reload the named accounts
+    """
+    change_version(VERSION_KEY)
+
+
+def shared_version(key):
+    """
+    Return the version of the data cached under the passed key, which is
+    kept in the shared cache so that all processes see the same version.
+    Return None if the shared cache doesn't keep it (eg the dummy cache).
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, secrets.token_hex(8), None)
+        version = cache.get(key)
+    return version
+
+
+def change_version(key):
+    cache.set(key, secrets.token_hex(8), None)
+
+
+def is_current(cached_version, loaded, version):
+    """
+    Return whether data cached in the process with the passed version, and
+    loaded at the passed time.monotonic(), can still be used
+    """
+    if version is None or cached_version != version:
+        return False
+    timeout = getattr(settings, 'ACCOUNTS_LOCAL_CACHE_TIMEOUT', 60)
+    return time.monotonic() - loaded < timeout
+
+
+def _load(name):
+    Account = get_model('oscar_accounts', 'Account')
+    field_names = [
+        f.attname for f in Account._meta.concrete_fields
+        if f.attname not in Account.posting_fields]
+    db = router.db_for_read(Account)
+    values = Account.objects.using(db).filter(name=name).values_list(
+        *field_names).first()
+    if values is None:
+        raise Account.DoesNotExist(
+            "Account matching query does not exist.")
+    return db, field_names, values
 
 
 def redemptions_account():
-    return Account.objects.get(name=names.REDEMPTIONS)
+    return get_account(names.REDEMPTIONS)
 
 
 def lapsed_account():
-    return Account.objects.get(name=names.LAPSED)
+    return get_account(names.LAPSED)
+
+
+def bank_account():
+    return get_account(names.BANK)
@@ -8,7 +8,7 @@ from oscar.core.loading import get_model
 from oscar.forms.widgets import DatePickerInput
 from oscar.templatetags.currency_filters import currency
 
-from oscar_accounts import codes, names
+from oscar_accounts import accounttypes, codes, names
 
 Account = get_model('oscar_accounts', 'Account')
 AccountType = get_model('oscar_accounts', 'AccountType')
@@ -48,12 +48,13 @@ class EditAccountForm(forms.ModelForm):
             "You may need to create a product range first")
 
         # Add field for account type (if there is a choice)
-        deferred_income = AccountType.objects.get(name=names.DEFERRED_INCOME)
-        types = deferred_income.get_children()
-        if types.count() > 1:
+        deferred_income = accounttypes.get(names.DEFERRED_INCOME)
+        types = accounttypes.get_children(deferred_income)
+        if len(types) > 1:
             self.fields['account_type'] = forms.ModelChoiceField(
-                queryset=types)
-        elif types.count() == 1:
+                queryset=AccountType.objects.filter(
+                    pk__in=[t.pk for t in types]))
+        elif len(types) == 1:
             del self.fields['account_type']
             self._account_type = types[0]
         else:
@@ -67,8 +68,7 @@ class SourceAccountMixin(object):
         super().__init__(*args, **kwargs)
 
         # Add field for source account (if there is a choice)
-        unpaid_sources = AccountType.objects.get(
-            name=names.UNPAID_ACCOUNT_TYPE)
+        unpaid_sources = accounttypes.get(names.UNPAID_ACCOUNT_TYPE)
         sources = unpaid_sources.accounts.all()
         if sources.count() > 1:
             self.fields['source_account'] = forms.ModelChoiceField(
@@ -95,8 +95,7 @@ class NewAccountForm(SourceAccountMixin, EditAccountForm):
         super().__init__(*args, **kwargs)
 
         # Add field for source account (if there is a choice)
-        unpaid_sources = AccountType.objects.get(
-            name=names.UNPAID_ACCOUNT_TYPE)
+        unpaid_sources = accounttypes.get(names.UNPAID_ACCOUNT_TYPE)
         sources = unpaid_sources.accounts.all()
         if sources.count() > 1:
             self.fields['source_account'] = forms.ModelChoiceField(
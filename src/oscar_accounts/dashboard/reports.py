@@ -3,10 +3,8 @@ from decimal import Decimal as D
 from django.db.models import Sum
 from oscar.core.loading import get_model
 
-from oscar_accounts import names
+from oscar_accounts import accounttypes, core, names
 
-AccountType = get_model('oscar_accounts', 'AccountType')
-Account = get_model('oscar_accounts', 'Account')
 Transfer = get_model('oscar_accounts', 'Transfer')
 
 
@@ -31,84 +29,77 @@ class ProfitLossReport(object):
 
         return ctx
 
-    def transfer_total(self, qs):
-        filters = {
-            'date_created__gte': self.start,
-            'date_created__lt': self.end}
-        transfers = qs.filter(**filters)
-        total = transfers.aggregate(sum=Sum('amount'))['sum']
-        return total if total is not None else D('0.00')
+    def transfers(self):
+        return Transfer.objects.filter(
+            date_created__gte=self.start, date_created__lt=self.end)
+
+    def totals(self, transfers, *fields):
+        """
+        Return a dict mapping the values of the passed fields to the total
+        amount of the transfers with those values, using one grouped query
+        """
+        rows = transfers.order_by().values_list(*fields).annotate(
+            sum=Sum('amount'))
+        return {row[:-1]: row[-1] for row in rows}
+
+    def rows_total(self, rows):
+        return sum((row['total'] for row in rows), D('0.00'))
+
+    def loading_rows(self, account_type):
+        # Transfers from each account of the passed type
+        totals = self.totals(
+            self.transfers().filter(source__account_type=account_type),
+            'source')
+        rows = [{'name': name, 'total': totals.get((pk,), D('0.00'))}
+                for pk, name in account_type.accounts.order_by(
+                    'pk').values_list('pk', 'name')]
+        return rows, self.rows_total(rows)
 
     def get_paid_loading_data(self, ctx):
-        cash = AccountType.objects.get(name=names.CASH)
-        cash_rows = []
-        cash_total = D('0.00')
-        for account in cash.accounts.all():
-            total = self.transfer_total(account.source_transfers)
-            cash_rows.append({
-                'name': account.name,
-                'total': total})
-            cash_total += total
-        ctx['cash_rows'] = cash_rows
-        ctx['cash_total'] = cash_total
+        ctx['cash_rows'], ctx['cash_total'] = self.loading_rows(
+            accounttypes.get(names.CASH))
 
     def get_unpaid_loading_data(self, ctx):
-        unpaid = AccountType.objects.get(name=names.UNPAID_ACCOUNT_TYPE)
-        unpaid_rows = []
-        unpaid_total = D('0.00')
-        for account in unpaid.accounts.all():
-            total = self.transfer_total(account.source_transfers)
-            unpaid_rows.append({
-                'name': account.name,
-                'total': total})
-            unpaid_total += total
-        ctx['unpaid_rows'] = unpaid_rows
-        ctx['unpaid_total'] = unpaid_total
+        ctx['unpaid_rows'], ctx['unpaid_total'] = self.loading_rows(
+            accounttypes.get(names.UNPAID_ACCOUNT_TYPE))
 
     def get_deferred_income_data(self, ctx):
-        deferred_income = AccountType.objects.get(
-            name=names.DEFERRED_INCOME)
+        deferred_income = accounttypes.get(names.DEFERRED_INCOME)
+        children = accounttypes.get_children(deferred_income)
+        child_ids = [child.pk for child in children]
+        redemptions_act = core.redemptions_account()
+        lapsed_act = core.lapsed_account()
+        # Transfers to the redemptions and lapsed accounts, by the account type
+        # of the source account
+        spent = self.totals(
+            self.transfers().filter(
+                source__account_type__in=child_ids,
+                destination__in=[redemptions_act, lapsed_act]),
+            'source__account_type', 'destination')
+        # Transfers from the redemptions account, by the account type of the
+        # destination account
+        refunded = self.totals(
+            self.transfers().filter(
+                source=redemptions_act,
+                destination__account_type__in=child_ids),
+            'destination__account_type')
         redeem_rows = []
         closure_rows = []
         refund_rows = []
-        redeem_total = closure_total = refund_total = D('0.00')
-        redemptions_act = Account.objects.get(name=names.REDEMPTIONS)
-        lapsed_act = Account.objects.get(name=names.LAPSED)
-        for child in deferred_income.get_children():
-            child_redeem_total = D('0.00')
-            child_closure_total = D('0.00')
-            child_refund_total = D('0.00')
-            for account in child.accounts.all():
-                # Look for transfers to the redemptions account
-                qs = account.source_transfers.filter(
-                    destination=redemptions_act)
-                total = self.transfer_total(qs)
-                child_redeem_total += total
-                # Look for transfers to expired account
-                qs = account.source_transfers.filter(
-                    destination=lapsed_act)
-                total = self.transfer_total(qs)
-                child_closure_total += total
-                # Look for transfers from redemptions account
-                qs = redemptions_act.source_transfers.filter(
-                    destination=account)
-                child_refund_total += self.transfer_total(qs)
+        for child in children:
             redeem_rows.append({
                 'name': child.name,
-                'total': child_redeem_total})
+                'total': spent.get((child.pk, redemptions_act.pk), D('0.00'))})
             closure_rows.append({
                 'name': child.name,
-                'total': child_closure_total})
+                'total': spent.get((child.pk, lapsed_act.pk), D('0.00'))})
             refund_rows.append({
                 'name': child.name,
-                'total': child_refund_total})
-            redeem_total += child_redeem_total
-            closure_total += child_closure_total
-            refund_total += child_refund_total
+                'total': refunded.get((child.pk,), D('0.00'))})
 
         ctx['redeem_rows'] = redeem_rows
-        ctx['redeem_total'] = redeem_total
+        ctx['redeem_total'] = self.rows_total(redeem_rows)
         ctx['closure_rows'] = closure_rows
-        ctx['closure_total'] = closure_total
+        ctx['closure_total'] = self.rows_total(closure_rows)
         ctx['refund_rows'] = refund_rows
-        ctx['refund_total'] = refund_total
+        ctx['refund_total'] = self.rows_total(refund_rows)
@@ -13,10 +13,9 @@ from django.views import generic
 from oscar.core.loading import get_model
 from oscar.templatetags.currency_filters import currency
 
-from oscar_accounts import exceptions, facade, names
+from oscar_accounts import accounttypes, checkpoints, exceptions, facade, names
 from oscar_accounts.dashboard import forms, reports
 
-AccountType = get_model('oscar_accounts', 'AccountType')
 Account = get_model('oscar_accounts', 'Account')
 Transfer = get_model('oscar_accounts', 'Transfer')
 Transaction = get_model('oscar_accounts', 'Transaction')
@@ -330,7 +329,7 @@ class DeferredIncomeReportView(generic.FormView):
         totals = {'total': D('0.00'),
                   'num_accounts': 0}
         for acc_type_name in names.DEFERRED_INCOME_ACCOUNT_TYPES:
-            acc_type = AccountType.objects.get(name=acc_type_name)
+            acc_type = accounttypes.get(acc_type_name)
             data = {
                 'name': acc_type_name,
                 'total': D('0.00'),
@@ -346,13 +345,12 @@ class DeferredIncomeReportView(generic.FormView):
                 'total_expiring_outside_90': D('0.00'),
                 'total_open_ended': D('0.00'),
             }
-            for account in acc_type.accounts.all():
+            accounts = checkpoints.with_balances_as_of(
+                acc_type.accounts.only('account_type', 'end_date'),
+                threshold_datetime)
+            for account in accounts:
                 data['num_accounts'] += 1
-                total = account.transactions.filter(
-                    date_created__lt=threshold_datetime).aggregate(
-                        total=Sum('amount'))['total']
-                if total is None:
-                    total = D('0.00')
+                total = account.historical_balance
                 data['total'] += total
                 days_remaining = account.days_remaining(threshold_datetime)
                 if days_remaining is None:
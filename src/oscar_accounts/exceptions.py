@@ -20,3 +20,7 @@ class InactiveAccount(AccountException):
 
 class ClosedAccount(AccountException):
     pass
+
+
+class ConcurrentUpdate(AccountException):
+    pass
@@ -1,14 +1,85 @@
 import logging
+import random
+import threading
+import time
 
+from django.conf import settings
+from django.db import OperationalError, transaction
 from oscar.core.loading import get_model
 
-from oscar_accounts import core, exceptions
+from oscar_accounts import core, exceptions, threads
 
 Account = get_model('oscar_accounts', 'Account')
+PendingTransfer = get_model('oscar_accounts', 'PendingTransfer')
 Transfer = get_model('oscar_accounts', 'Transfer')
 
 logger = logging.getLogger('oscar_accounts')
 
+# Database errors that mean the transaction lost a race and can be retried:
+# PostgreSQL serialization failures and deadlocks, and MySQL deadlocks.
+RETRYABLE_PGCODES = ('40001', '40P01')
+RETRYABLE_MYSQL_ERRNOS = (1213,)
+
+_stats_lock = threading.Lock()
+_stats = {'conflicts': 0, 'retries': 0, 'failures': 0}
+
+
+def posting_stats():
+    """
+    Return the numbers of posting conflicts, retries and postings that failed
+    after exhausting their retries, since the process started.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(*names):
+    with _stats_lock:
+        for name in names:
+            _stats[name] += 1
+
+
+def _is_retryable(error):
+    if isinstance(error, exceptions.ConcurrentUpdate):
+        return True
+    if not isinstance(error, OperationalError):
+        return False
+    # A database error aborts the enclosing transaction, so it can only be
+    # retried when the posting is the outermost transaction.
+    if transaction.get_connection().in_atomic_block:
+        return False
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    args = getattr(cause, 'args', ())
+    return bool(args) and args[0] in RETRYABLE_MYSQL_ERRNOS
+
+
+def _post(msg, source, destination, **kwargs):
+    """
+    Create a transfer, retrying with a randomised exponential backoff if it
+    conflicts with a concurrent posting.
+    """
+    max_retries = getattr(settings, 'ACCOUNTS_POSTING_MAX_RETRIES', 3)
+    delay = getattr(settings, 'ACCOUNTS_POSTING_RETRY_DELAY', 0.01)
+    attempt = 0
+    while True:
+        try:
+            return Transfer.objects.create(source, destination, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e):
+                raise
+            if attempt == max_retries:
+                _count('conflicts', 'failures')
+                raise
+            _count('conflicts', 'retries')
+            logger.info("%s - conflict, retrying: '%s'", msg, e)
+        attempt += 1
+        # Reload the balances at the next attempt
+        source._expire_balance()
+        destination._expire_balance()
+        time.sleep(delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
 
 def close_expired_accounts():
     """
@@ -32,6 +103,14 @@ def close_expired_accounts():
             account.close()
 
 
+async def aclose_expired_accounts():
+    """
+    Async version of close_expired_accounts(), which runs it in a worker
+    thread (see oscar_accounts.threads)
+    """
+    return await threads.run_in_thread(close_expired_accounts)
+
+
 def transfer(source, destination, amount,
              parent=None, user=None, merchant_reference=None,
              description=None):
@@ -60,9 +139,10 @@ def transfer(source, destination, amount,
     if description:
         msg += " '%s'" % description
     try:
-        transfer = Transfer.objects.create(
-            source, destination, amount, parent, user,
-            merchant_reference, description)
+        transfer = _post(
+            msg, source, destination, amount=amount, parent=parent,
+            user=user, merchant_reference=merchant_reference,
+            description=description)
     except exceptions.AccountException as e:
         logger.warning("%s - failed: '%s'", msg, e)
         raise
@@ -76,6 +156,92 @@ def transfer(source, destination, amount,
         return transfer
 
 
+async def atransfer(*args, **kwargs):
+    """
+    Async version of transfer().
+
+    This doesn't access the database asynchronously: the whole transfer
+    (including any retries) is made in a single call to a worker thread, in
+    its own database transaction (see oscar_accounts.threads).  Concurrent
+    calls run in parallel.
+    """
+    return await threads.run_in_thread(transfer, *args, **kwargs)
+
+
+def transfer_many(legs):
+    """
+    Make a batch of transfers in a single database transaction.
+
+    Either all of the transfers are made or none of them are.  Will raise a
+    accounts.exceptions.AccountException if anything goes wrong.
+
+    :legs: A sequence of (source, destination, amount, metadata) tuples, where
+           metadata is a dict of any of the optional 'parent', 'user',
+           'merchant_reference' and 'description' arguments of transfer()
+    """
+    legs = list(legs)
+    for source, destination, amount, metadata in legs:
+        if source.id == destination.id:
+            raise exceptions.AccountException(
+                "The source and destination accounts for a transfer "
+                "must be different."
+            )
+    msg = "Batch of %d transfers" % len(legs)
+    try:
+        transfers = Transfer.objects.bulk_post(legs)
+    except exceptions.AccountException as e:
+        logger.warning("%s - failed: '%s'", msg, e)
+        raise
+    except Exception as e:
+        logger.error("%s - failed: '%s'", msg, e)
+        raise exceptions.AccountException(
+            "Unable to complete transfers: %s" % e)
+    else:
+        logger.info("%s - successful", msg)
+        return transfers
+
+
+def enqueue_transfer(source, destination, amount, user=None,
+                     merchant_reference=None, description=None):
+    """
+    Queue a transfer to be posted later by the process_pending_transfers
+    management command, and return the ID of the pending transfer.
+
+    The transfer is only verified when it is posted.  Use the ID to look up
+    the PendingTransfer and find out whether it was posted.
+    """
+    if source.id == destination.id:
+        raise exceptions.AccountException(
+            "The source and destination accounts for a transfer "
+            "must be different."
+        )
+    if amount <= 0:
+        raise exceptions.InvalidAmount("Debits must use a positive amount")
+    pending = PendingTransfer.objects.create(
+        source=source, destination=destination, amount=amount, user=user,
+        merchant_reference=merchant_reference, description=description)
+    logger.info("Transfer of %.2f from account #%d to account #%d queued as "
+                "pending transfer #%d", amount, source.id, destination.id,
+                pending.id)
+    return pending.id
+
+
+def process_pending_transfers(batch_size=500):
+    """
+    Post queued transfers in batches until the queue is empty.  Return the
+    numbers of transfers posted and failed.
+    """
+    num_posted = num_failed = 0
+    while True:
+        posted, failed = PendingTransfer.objects.process_batch(batch_size)
+        if not posted and not failed:
+            break
+        logger.info("Posted %d pending transfers, %d failed", posted, failed)
+        num_posted += posted
+        num_failed += failed
+    return num_posted, num_failed
+
+
 def reverse(transfer, user=None, merchant_reference=None, description=None):
     """
     Reverse a previous transfer, returning the money to the original source.
@@ -86,9 +252,8 @@ def reverse(transfer, user=None, merchant_reference=None, description=None):
     if description:
         msg += " '%s'" % description
     try:
-        transfer = Transfer.objects.create(
-            source=transfer.destination,
-            destination=transfer.source,
+        transfer = _post(
+            msg, transfer.destination, transfer.source,
             amount=transfer.amount, user=user,
             merchant_reference=merchant_reference,
             description=description)
@@ -103,3 +268,11 @@ def reverse(transfer, user=None, merchant_reference=None, description=None):
         logger.info("%s - successful, transfer: %s", msg,
                     transfer.reference)
         return transfer
+
+
+async def areverse(*args, **kwargs):
+    """
+    Async version of reverse(), which runs it in a worker thread (see
+    oscar_accounts.threads)
+    """
+    return await threads.run_in_thread(reverse, *args, **kwargs)
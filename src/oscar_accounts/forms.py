@@ -2,6 +2,8 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 from oscar.core.loading import get_model
 
+from oscar_accounts import codefilter, codes
+
 Account = get_model('oscar_accounts', 'Account')
 
 
@@ -9,7 +11,12 @@ class AccountForm(forms.Form):
     code = forms.CharField(label=_("Account code"))
 
     def clean_code(self):
-        code = self.cleaned_data['code'].strip()
+        code = codes.normalise(self.cleaned_data['code'])
+        if not codes.is_valid(code):
+            raise forms.ValidationError(
+                _("No account found with this code"), code='malformed')
+        if not codefilter.might_exist(code):
+            raise forms.ValidationError(_("No account found with this code"))
         try:
             self.account = Account.objects.get(
                 code=code)
@@ -0,0 +1,68 @@
+import logging
+
+from django.db import transaction
+from oscar.core.loading import get_model
+
+from oscar_accounts import codefilter, codes, core
+
+Account = get_model('oscar_accounts', 'Account')
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+logger = logging.getLogger('oscar_accounts')
+
+
+def issue_giftcards(count, amount, account_type=None, start_date=None,
+                    end_date=None, source=None, user=None,
+                    description="Load from bank", chunk_size=1000):
+    """
+    Create a number of code accounts loaded with the same amount, and yield
+    them as they are created.
+
+    The accounts are created and loaded in chunks, each in its own database
+    transaction, so memory use doesn't grow with the number of accounts.  If a
+    chunk fails, the accounts of the earlier chunks remain issued.
+
+    :count: Number of accounts to create
+    :amount: Amount to load each account with
+    :account_type: Type of the new accounts
+    :start_date: Start of the period the accounts are active in
+    :end_date: End of the period the accounts are active in
+    :source: Account to load from (defaults to the bank account)
+    :user: Authorising user
+    :description: Description of the load transfers
+    :chunk_size: Number of accounts to create in each database transaction
+    """
+    if source is None:
+        source = core.bank_account()
+    remaining = count
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        with transaction.atomic():
+            accounts = [
+                Account(code=code, account_type=account_type,
+                        start_date=start_date, end_date=end_date)
+                for code in codes.generate_many(size)]
+            _bulk_create(accounts)
+            # Each account is loaded by its own transfer, but the source
+            # account gets a single balance update for the chunk.
+            Transfer.objects.bulk_post(
+                [(source, account, amount,
+                  {'user': user, 'description': description})
+                 for account in accounts])
+        codefilter.add_many([account.code for account in accounts])
+        logger.info("Issued %d accounts loaded with %.2f", size, amount)
+        remaining -= size
+        yield from accounts
+
+
+def _bulk_create(accounts):
+    Account.objects.bulk_create(accounts)
+    if accounts[0].pk is not None:
+        return
+    # We need the PKs of the new accounts to load them, so look them up by
+    # code on databases that can't return them from the insert.
+    pks = dict(Account.objects.filter(
+        code__in=[account.code for account in accounts]).values_list(
+            'code', 'pk'))
+    for account in accounts:
+        account.pk = pks[account.code]
@@ -0,0 +1,88 @@
+import threading
+import time
+from decimal import Decimal as D
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from oscar.core.loading import get_model
+
+from oscar_accounts import exceptions, facade
+
+Account = get_model('oscar_accounts', 'Account')
+
+
+def run_concurrently(num_threads, func):
+    """
+    Call func(thread_index) in the passed number of threads, all released at
+    the same time, and return the number of seconds until they all finished
+    """
+    started = []
+    barrier = threading.Barrier(
+        num_threads, action=lambda: started.append(time.monotonic()))
+
+    def target(index):
+        try:
+            barrier.wait()
+            func(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(i,))
+               for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started[0]
+
+
+class Command(BaseCommand):
+    help = ('Measure how posting throughput degrades as more threads spend '
+            'from the same accounts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help="Number of threads posting at once")
+        parser.add_argument(
+            '--transfers', type=int, default=50,
+            help="Number of transfers each thread makes in each run")
+        parser.add_argument(
+            '--accounts', type=int, nargs='+', default=[8, 4, 2, 1],
+            help="Numbers of accounts to spread the threads over, one run each")
+
+    def handle(self, *args, **options):
+        num_threads = options['threads']
+        num_transfers = options['transfers']
+        amount = D('1.00')
+        source = Account.objects.create(
+            description="Posting benchmark", credit_limit=None)
+        for num_accounts in options['accounts']:
+            # Each thread spends from one of the shared accounts into an
+            # account of its own, so only the shared accounts are contended.
+            accounts = [
+                Account.objects.create(description="Posting benchmark")
+                for __ in range(num_accounts)]
+            for account in accounts:
+                facade.transfer(
+                    source, account, amount * num_threads * num_transfers)
+            destinations = [
+                Account.objects.create(description="Posting benchmark")
+                for __ in range(num_threads)]
+            failed = [0] * num_threads
+
+            def spend(i):
+                account = Account.objects.get(pk=accounts[i % num_accounts].pk)
+                for __ in range(num_transfers):
+                    try:
+                        facade.transfer(account, destinations[i], amount)
+                    except exceptions.AccountException:
+                        failed[i] += 1
+
+            elapsed = run_concurrently(num_threads, spend)
+            num_posted = num_threads * num_transfers - sum(failed)
+            self.stdout.write(
+                "%d threads over %d accounts: %d transfers in %.2fs (%.0f "
+                "per second), %d failed" % (
+                    num_threads, num_accounts, num_posted, elapsed,
+                    num_posted / elapsed, sum(failed)))
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from oscar.core.loading import get_model
+
+APIKey = get_model('oscar_accounts', 'APIKey')
+
+
+class Command(BaseCommand):
+    help = 'Create a key for authenticating to the accounts API as a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User to authenticate as")
+        parser.add_argument('--name', default='', help="Name of the key")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(
+                **{User.USERNAME_FIELD: options['username']})
+        except User.DoesNotExist:
+            raise CommandError("No user named '%s'" % options['username'])
+        __, key = APIKey.objects.create_key(user, options['name'])
+        self.stdout.write(
+            "Created API key (it can't be shown again): %s" % key)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from oscar_accounts import checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Create account balance checkpoints for the periods since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period', choices=sorted(checkpoints.PERIODS),
+            default=checkpoints.DAY,
+            help="Length of the periods between checkpoints")
+
+    def handle(self, *args, **options):
+        num_created = checkpoints.create_checkpoints(options['period'])
+        self.stdout.write("Created %d balance checkpoints" % num_created)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from oscar.core.loading import get_model
+
+IdempotencyKey = get_model('oscar_accounts', 'IdempotencyKey')
+
+
+class Command(BaseCommand):
+    help = 'Delete the idempotency keys of API requests that have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of keys to delete in each query")
+
+    def handle(self, *args, **options):
+        num_deleted = IdempotencyKey.objects.delete_expired(
+            options['batch_size'])
+        self.stdout.write("Deleted %d expired idempotency keys" % num_deleted)
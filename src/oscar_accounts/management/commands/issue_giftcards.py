@@ -0,0 +1,77 @@
+import csv
+from decimal import Decimal as D
+from decimal import InvalidOperation
+
+from dateutil import parser
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+from oscar_accounts import issuance
+
+AccountType = get_model('oscar_accounts', 'AccountType')
+
+
+def amount(value):
+    try:
+        return D(value)
+    except InvalidOperation:
+        raise ValueError("'%s' is not a valid amount" % value)
+
+
+def date(value):
+    date = parser.parse(value)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Create a batch of giftcard accounts and write their codes to a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', help="Path of the CSV file to write the codes to")
+        parser.add_argument(
+            '--count', type=int, required=True,
+            help="Number of accounts to create")
+        parser.add_argument(
+            '--amount', type=amount, required=True,
+            help="Amount to load each account with")
+        parser.add_argument(
+            '--account-type', help="Name of the type of the new accounts")
+        parser.add_argument(
+            '--start-date', type=date,
+            help="Start of the period the accounts are active in")
+        parser.add_argument(
+            '--end-date', type=date,
+            help="End of the period the accounts are active in")
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Number of accounts to create in each database transaction")
+
+    def handle(self, *args, **options):
+        account_type = None
+        if options['account_type']:
+            try:
+                account_type = AccountType.objects.get(
+                    name=options['account_type'])
+            except AccountType.DoesNotExist:
+                raise CommandError(
+                    "No account type named '%s'" % options['account_type'])
+
+        accounts = issuance.issue_giftcards(
+            options['count'], options['amount'], account_type=account_type,
+            start_date=options['start_date'], end_date=options['end_date'],
+            chunk_size=options['chunk_size'])
+        num_issued = 0
+        with open(options['output'], 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['code', 'amount', 'start_date', 'end_date'])
+            for account in accounts:
+                writer.writerow([
+                    account.code, "%.2f" % options['amount'],
+                    account.start_date.isoformat() if account.start_date else '',
+                    account.end_date.isoformat() if account.end_date else ''])
+                num_issued += 1
+        self.stdout.write("Issued %d accounts" % num_issued)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from oscar_accounts import facade
+
+
+class Command(BaseCommand):
+    help = 'Post the queued transfers in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of transfers to post in each database transaction")
+
+    def handle(self, *args, **options):
+        posted, failed = facade.process_pending_transfers(
+            options['batch_size'])
+        self.stdout.write(
+            "Posted %d pending transfers, %d failed" % (posted, failed))
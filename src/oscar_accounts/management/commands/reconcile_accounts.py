@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_accounts import reconciliation
+
+
+class Command(BaseCommand):
+    help = 'Check account balances and transfers against the transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of processes to check the ledger with")
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help="Number of accounts or transfers to check at a time")
+        parser.add_argument(
+            '--repair', action='store_true',
+            help="Recalculate the balances of mismatched accounts")
+
+    def handle(self, *args, **options):
+        report = reconciliation.reconcile(
+            chunk_size=options['chunk_size'], workers=options['workers'],
+            repair=options['repair'])
+        for pk, cached, actual in report.mismatched_accounts:
+            self.stdout.write(
+                "Account %d has balance %s but its transactions sum to %s" % (
+                    pk, cached, actual))
+        for pk, num_transactions, total in report.invalid_transfers:
+            self.stdout.write(
+                "Transfer %d has %d transactions summing to %s" % (
+                    pk, num_transactions, total))
+        if report.imbalance:
+            self.stdout.write(
+                "The ledger's transactions sum to %s" % report.imbalance)
+        self.stdout.write(
+            "Checked %d accounts and %d transfers" % (
+                report.num_accounts, report.num_transfers))
+        if report.num_repaired:
+            self.stdout.write(
+                "Repaired %d account balances" % report.num_repaired)
+        unrepaired = len(report.mismatched_accounts) - report.num_repaired
+        if unrepaired or report.invalid_transfers or report.imbalance:
+            raise CommandError("The ledger is inconsistent")
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:18
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0004_auto_20201109_1647'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountStripe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripes', to='oscar_accounts.account')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('account', 'index')},
+            },
+        ),
+    ]
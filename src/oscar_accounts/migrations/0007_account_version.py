@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0006_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
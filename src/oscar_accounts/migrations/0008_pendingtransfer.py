@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oscar_accounts', '0007_account_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingTransfer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('merchant_reference', models.CharField(max_length=128, null=True)),
+                ('description', models.CharField(max_length=256, null=True)),
+                ('status', models.CharField(db_index=True, default='Pending', max_length=32)),
+                ('error', models.CharField(blank=True, max_length=256)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_processed', models.DateTimeField(null=True)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_destination_transfers', to='oscar_accounts.account')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_source_transfers', to='oscar_accounts.account')),
+                ('transfer', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_transfer', to='oscar_accounts.transfer')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_transfers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
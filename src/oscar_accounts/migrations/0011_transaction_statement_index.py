@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0010_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date_created', 'id'], name='oscar_acc_txn_statement_idx'),
+        ),
+    ]
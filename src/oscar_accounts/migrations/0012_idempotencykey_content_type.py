@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0011_transaction_statement_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='content_type',
+            field=models.CharField(default='application/json', max_length=128),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0012_idempotencykey_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='feed_position',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+    ]
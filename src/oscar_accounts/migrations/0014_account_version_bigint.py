@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0013_transfer_feed_position'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -12,6 +12,11 @@ if not is_model_registered('oscar_accounts', 'Account'):
         pass
 
 
+if not is_model_registered('oscar_accounts', 'AccountStripe'):
+    class AccountStripe(abstract_models.AccountStripe):
+        pass
+
+
 if not is_model_registered('oscar_accounts', 'Transfer'):
     class Transfer(abstract_models.Transfer):
         pass
@@ -22,6 +27,26 @@ if not is_model_registered('oscar_accounts', 'Transaction'):
         pass
 
 
+if not is_model_registered('oscar_accounts', 'PendingTransfer'):
+    class PendingTransfer(abstract_models.PendingTransfer):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'BalanceCheckpoint'):
+    class BalanceCheckpoint(abstract_models.BalanceCheckpoint):
+        pass
+
+
 if not is_model_registered('oscar_accounts', 'IPAddressRecord'):
     class IPAddressRecord(abstract_models.IPAddressRecord):
         pass
+
+
+if not is_model_registered('oscar_accounts', 'APIKey'):
+    class APIKey(abstract_models.APIKey):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'IdempotencyKey'):
+    class IdempotencyKey(abstract_models.IdempotencyKey):
+        pass
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+APIKey = get_model('oscar_accounts', 'APIKey')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_api_keys_of_inactive_users(sender, instance, **kwargs):
+    # Only the deactivation needs to take effect straight away; a reactivated
+    # user's keys work again once their cached copies expire.
+    if not instance.is_active:
+        APIKey.objects.clear_cache(instance)
+
+
+@receiver(post_delete, sender=APIKey)
+def revoke_deleted_api_key(sender, instance, **kwargs):
+    # Keys are also deleted along with their user, without APIKey.delete
+    # being called
+    cache.delete(APIKey.cache_key(instance.prefix))
@@ -0,0 +1,175 @@
+"""
+Checks that the ledger is consistent:
+
+- the cached balance of each account matches the sum of its transactions;
+- each transfer has exactly two transactions which sum to zero;
+- the transactions of the whole ledger sum to zero.
+
+The ledger is processed in chunks of PK ranges so that memory use is bounded
+whatever its size, and the chunks can be spread over a pool of processes.
+The chunks are read at different times, so the checks can run on a live
+ledger: an account whose balance doesn't match is checked again with its row
+and stripes locked before it is reported or repaired, and the whole ledger is
+summed in a single query.
+"""
+import logging
+import multiprocessing
+from concurrent import futures
+from decimal import Decimal as D
+
+from django import db
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from oscar.core.loading import get_model
+
+Account = get_model('oscar_accounts', 'Account')
+AccountStripe = get_model('oscar_accounts', 'AccountStripe')
+Transfer = get_model('oscar_accounts', 'Transfer')
+Transaction = get_model('oscar_accounts', 'Transaction')
+
+logger = logging.getLogger('oscar_accounts')
+
+
+class Report(object):
+
+    def __init__(self):
+        # Lists of (account PK, cached balance, balance from transactions)
+        self.mismatched_accounts = []
+        # Lists of (transfer PK, number of transactions, sum of transactions)
+        self.invalid_transfers = []
+        self.num_accounts = 0
+        self.num_transfers = 0
+        self.num_repaired = 0
+        self.imbalance = D('0.00')
+
+    def merge(self, other):
+        self.mismatched_accounts.extend(other.mismatched_accounts)
+        self.invalid_transfers.extend(other.invalid_transfers)
+        self.num_accounts += other.num_accounts
+        self.num_transfers += other.num_transfers
+        self.num_repaired += other.num_repaired
+        self.imbalance += other.imbalance
+
+    @property
+    def is_consistent(self):
+        return not any([self.mismatched_accounts, self.invalid_transfers,
+                        self.imbalance])
+
+
+def pk_ranges(model, chunk_size):
+    bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    return [(start, start + chunk_size)
+            for start in range(bounds['first'], bounds['last'] + 1,
+                               chunk_size)]
+
+
+def check_accounts(start, end, repair=False):
+    """
+    Check the cached balances of the accounts with PKs in the passed range.
+    """
+    report = Report()
+    totals = dict(Transaction.objects.filter(
+        account_id__gte=start, account_id__lt=end).order_by().values(
+            'account').annotate(total=Sum('amount')).values_list(
+                'account', 'total'))
+    stripes = dict(AccountStripe.objects.filter(
+        account_id__gte=start, account_id__lt=end).order_by().values(
+            'account').annotate(total=Sum('balance')).values_list(
+                'account', 'total'))
+    balances = Account.objects.filter(pk__gte=start, pk__lt=end).values_list(
+        'pk', 'balance')
+    candidates = []
+    for pk, balance in balances:
+        report.num_accounts += 1
+        cached = (balance or D('0.00')) + stripes.get(pk, D('0.00'))
+        if cached != totals.get(pk, D('0.00')):
+            candidates.append(pk)
+    # The balances were read after the totals, so postings that committed in
+    # between make accounts look mismatched
+    for pk in candidates:
+        mismatch = check_account(pk, repair)
+        if mismatch is not None:
+            report.mismatched_accounts.append((pk,) + mismatch)
+            if repair:
+                report.num_repaired += 1
+    return report
+
+
+def check_account(pk, repair=False):
+    """
+    Check the cached balance of the account with the passed PK while its row
+    and stripes are locked, so that no posting can change it in the meantime.
+    Return the cached balance and the balance from transactions if they
+    don't match, or None if they do.
+    """
+    with transaction.atomic():
+        balance = Account.objects.select_for_update().filter(
+            pk=pk).values_list('balance', flat=True).first()
+        stripes = AccountStripe.objects.select_for_update().filter(
+            account_id=pk).values_list('balance', flat=True)
+        cached = sum(stripes, balance or D('0.00'))
+        actual = Transaction.objects.filter(account_id=pk).aggregate(
+            total=Sum('amount'))['total'] or D('0.00')
+        if cached == actual:
+            return None
+        if repair:
+            Account.objects.get(pk=pk).recalculate_balance()
+    return cached, actual
+
+
+def check_transfers(start, end):
+    """
+    Check the transactions of the transfers with PKs in the passed range.
+    """
+    report = Report()
+    transfers = Transfer.objects.filter(pk__gte=start, pk__lt=end).order_by()
+    report.num_transfers = transfers.count()
+    invalid = transfers.annotate(
+        num_transactions=Count('transactions'),
+        total=Sum('transactions__amount')).filter(
+            ~Q(num_transactions=2) | ~Q(total=0)).values_list(
+                'pk', 'num_transactions', 'total')
+    report.invalid_transfers = list(invalid)
+    return report
+
+
+def _run(task):
+    func, args = task
+    try:
+        return func(*args)
+    finally:
+        db.connections.close_all()
+
+
+def reconcile(chunk_size=10000, workers=1, repair=False):
+    """
+    Check the whole ledger and return a report.
+
+    :chunk_size: Number of PKs in each chunk of accounts or transfers
+    :workers: Number of processes to spread the chunks over
+    :repair: Whether to recalculate the cached balances that don't match
+    """
+    tasks = [(check_accounts, (start, end, repair))
+             for start, end in pk_ranges(Account, chunk_size)]
+    tasks.extend((check_transfers, (start, end))
+                 for start, end in pk_ranges(Transfer, chunk_size))
+    logger.info("Reconciling ledger in %d chunks", len(tasks))
+
+    report = Report()
+    # Each transfer's transactions are committed together, so a single query
+    # sees them balance however many postings are being made
+    report.imbalance = Transaction.objects.aggregate(
+        total=Sum('amount'))['total'] or D('0.00')
+    if workers > 1:
+        # Forked processes must not share the parent's connections
+        db.connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+            for chunk_report in pool.map(_run, tasks):
+                report.merge(chunk_report)
+    else:
+        for func, args in tasks:
+            report.merge(func(*args))
+    return report
@@ -1,37 +1,196 @@
+"""
+Protection against brute-forcing account codes.
+
+Failures are counted per IP address in Django's cache, so checking whether a
+request is blocked takes a single cache round-trip (and none at all when
+repeated within a request).  An IP address is:
+
+- temporarily blocked for IPAddressRecord.COOLING_OFF_PERIOD seconds once it
+  has made IPAddressRecord.FREEZE_THRESHOLD consecutive failures within a
+  sliding window of that length;
+- permanently blocked once its total failures exceed
+  IPAddressRecord.BLOCK_THRESHOLD.
+
+The counts are also written to IPAddressRecord for auditing, in batches at
+most once per ACCOUNTS_SECURITY_FLUSH_INTERVAL seconds, and when the process
+exits.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
 from oscar.core.loading import get_model
 
 IPAddressRecord = get_model('oscar_accounts', 'IPAddressRecord')
 
+logger = logging.getLogger('oscar_accounts')
+
+# How long the total failures of an IP address are kept in the cache before
+# they are reloaded from the audit records
+TOTAL_TIMEOUT = 24 * 60 * 60
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+
+
+def _cache():
+    return caches[getattr(settings, 'ACCOUNTS_SECURITY_CACHE', 'default')]
+
+
+def _ip_address(request):
+    return request.META['REMOTE_ADDR']
+
+
+def _keys(ip_address, now=None):
+    # Failures are counted in fixed windows; the count over the sliding window
+    # is estimated from the current and the previous windows.
+    window = int((now or time.time()) // IPAddressRecord.COOLING_OFF_PERIOD)
+    prefix = 'oscar_accounts:ip:%s:' % ip_address
+    return (prefix + str(window), prefix + str(window - 1), prefix + 'total',
+            prefix + 'blocked')
+
+
+def _state(request):
+    """
+    Return the failure counts for the request's IP address, which are fetched
+    once per request.
+    """
+    state = getattr(request, '_accounts_security', None)
+    if state is None:
+        now = time.time()
+        current, previous, total, blocked = _keys(_ip_address(request), now)
+        values = _cache().get_many([current, previous, total, blocked])
+        if total not in values:
+            values[total] = _load_total(_ip_address(request))
+        period = IPAddressRecord.COOLING_OFF_PERIOD
+        state = {
+            'current': values.get(current, 0),
+            'previous': values.get(previous, 0),
+            'total': values[total],
+            'blocked': values.get(blocked, False),
+            # Fraction of the current window that has elapsed
+            'elapsed': now % period / period}
+        request._accounts_security = state
+    return state
+
+
+def _load_total(ip_address):
+    # The total is reloaded from the audit records when it expires or is
+    # evicted.
+    total = IPAddressRecord.objects.filter(
+        ip_address=ip_address).values_list('total_failures', flat=True).first()
+    total = total or 0
+    _cache().add(_keys(ip_address)[2], total, TOTAL_TIMEOUT)
+    return total
+
+
+def _increment(key, timeout, initial=0):
+    cache = _cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, initial + 1, timeout):
+            return initial + 1
+        return cache.incr(key)
+
 
 def record_failed_request(request):
-    record, __ = IPAddressRecord.objects.get_or_create(
-        ip_address=request.META['REMOTE_ADDR'])
-    record.increment_failures()
+    state = _state(request)
+    ip_address = _ip_address(request)
+    current, __, total, blocked = _keys(ip_address)
+    state['current'] = _increment(
+        current, 2 * IPAddressRecord.COOLING_OFF_PERIOD)
+    state['total'] = _increment(total, TOTAL_TIMEOUT, state['total'])
+    if _recent_failures(state) >= IPAddressRecord.FREEZE_THRESHOLD:
+        # The estimate of the recent failures decays during the next window,
+        # so the block is kept for the whole cooling off period from here.
+        _cache().set(blocked, True, IPAddressRecord.COOLING_OFF_PERIOD)
+        state['blocked'] = True
+    with _lock:
+        entry = _pending.setdefault(ip_address, {
+            'failures': 0, 'consecutive': 0, 'reset': False})
+        entry['failures'] += 1
+        entry['consecutive'] += 1
+        entry['last_failure'] = timezone.now()
+    _maybe_flush()
 
 
 def record_successful_request(request):
-    try:
-        record, __ = IPAddressRecord.objects.get_or_create(
-            ip_address=request.META['REMOTE_ADDR'])
-    except IPAddressRecord.DoesNotExist:
+    state = _state(request)
+    if not state['current'] and not state['previous']:
         return
-    record.reset()
+    ip_address = _ip_address(request)
+    current, previous, __, blocked = _keys(ip_address)
+    _cache().delete_many([current, previous, blocked])
+    state['current'] = state['previous'] = 0
+    state['blocked'] = False
+    with _lock:
+        entry = _pending.setdefault(ip_address, {
+            'failures': 0, 'consecutive': 0})
+        entry['consecutive'] = 0
+        entry['reset'] = True
+    _maybe_flush()
 
 
 def record_blocked_request(request):
-    try:
-        record, __ = IPAddressRecord.objects.get_or_create(
-            ip_address=request.META['REMOTE_ADDR'])
-    except IPAddressRecord.DoesNotExist:
-        return
-    record.increment_blocks()
+    logger.info("Blocked request from %s", _ip_address(request))
 
 
 def is_blocked(request):
+    state = _state(request)
+    if state['total'] > IPAddressRecord.BLOCK_THRESHOLD:
+        return True
+    return state['blocked'] or (
+        _recent_failures(state) >= IPAddressRecord.FREEZE_THRESHOLD)
+
+
+def _recent_failures(state):
+    return state['current'] + state['previous'] * (1 - state['elapsed'])
+
+
+def _maybe_flush():
+    interval = getattr(settings, 'ACCOUNTS_SECURITY_FLUSH_INTERVAL', 60)
+    if time.monotonic() - _last_flush >= interval:
+        flush()
+
+
+def flush():
+    """
+    Write the failures counted since the last flush to IPAddressRecord
+    """
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    existing = set(IPAddressRecord.objects.filter(
+        ip_address__in=list(pending)).values_list('ip_address', flat=True))
+    IPAddressRecord.objects.bulk_create(
+        [IPAddressRecord(ip_address=ip_address)
+         for ip_address in pending if ip_address not in existing],
+        ignore_conflicts=True)
+    for ip_address, entry in pending.items():
+        consecutive = entry['consecutive']
+        if not entry.get('reset'):
+            consecutive = F('consecutive_failures') + consecutive
+        updates = {'consecutive_failures': consecutive,
+                   'total_failures': F('total_failures') + entry['failures']}
+        if 'last_failure' in entry:
+            updates['date_last_failure'] = entry['last_failure']
+        IPAddressRecord.objects.filter(ip_address=ip_address).update(**updates)
+
+
+@atexit.register
+def _flush_at_exit():
     try:
-        record = IPAddressRecord.objects.get(
-            ip_address=request.META['REMOTE_ADDR'])
-    except IPAddressRecord.DoesNotExist:
-        record = IPAddressRecord(
-            ip_address=request.META['REMOTE_ADDR'])
-    return record.is_blocked()
+        flush()
+    except Exception:
+        logger.exception("Unable to write the failed requests to the audit "
+                         "records")
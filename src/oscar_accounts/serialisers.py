@@ -0,0 +1,45 @@
+"""
+Helpers for serialising accounts and transfers quickly.
+
+URLs are built from templates, made with one call to reverse() per URL name,
+rather than by resolving each URL, and the related data that transfers are
+serialised with can be fetched with them (see with_related).
+"""
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.http import RFC3986_SUBDELIMS
+
+# A value that matches the URL patterns for both account codes and transfer
+# references
+PLACEHOLDER = 'X' * 32
+
+
+@lru_cache(maxsize=None)
+def _template(name, kwarg, prefix, urlconf, root_urlconf):
+    url = reverse('oscar_accounts_api:%s' % name, kwargs={kwarg: PLACEHOLDER})
+    head, __, tail = url.rpartition(PLACEHOLDER)
+    return head, tail
+
+
+def url(name, kwarg, value):
+    """
+    Return the URL of the named API view for the passed value of its only
+    keyword argument, eg url('transfer', 'reference', transfer.reference)
+    """
+    head, tail = _template(name, kwarg, get_script_prefix(), get_urlconf(),
+                           settings.ROOT_URLCONF)
+    return head + quote(str(value), safe=RFC3986_SUBDELIMS + '/~:@') + tail
+
+
+def with_related(transfers):
+    """
+    Fetch the passed transfers with their accounts and the amounts refunded
+    against them, so that Transfer.as_dict doesn't make any queries.
+    """
+    return transfers.select_related('source', 'destination').annotate(
+        refunded_amount=Sum('related_transfers__amount', filter=Q(
+            related_transfers__source=F('destination'))))
@@ -0,0 +1,99 @@
+"""
+Striped balances for busy system accounts.
+
+Every redemption credits the redemptions account and every new account is
+loaded from the bank account.  Under concurrent checkouts, the balance updates
+on those rows become a point of contention.  Accounts named in the
+``ACCOUNTS_STRIPED_ACCOUNTS`` setting spread their balance updates over a
+number of ``AccountStripe`` rows instead, eg::
+
+    ACCOUNTS_STRIPED_ACCOUNTS = {
+        'Redemptions': 8,
+        'Bank': 8,
+    }
+
+Transactions and transfers still reference the account itself, so reports are
+unaffected, and the balance of a loaded account is the balance of its row plus
+the balances of its stripes.  Before an account is removed from the setting,
+call its recalculate_balance() to move the balances of its stripes back onto
+its row, as they are no longer read once it isn't striped.
+"""
+import itertools
+import time
+import zlib
+
+from django.conf import settings
+
+from oscar_accounts import core
+
+HASH, ROUND_ROBIN = 'hash', 'round-robin'
+
+VERSION_KEY = 'oscar_accounts:striped_accounts:version'
+
+_round_robin = itertools.count()
+
+# The {account pk: number of stripes} lookup built from the striping config,
+# so that striped accounts can be recognised from their PK alone.  Like the
+# system accounts (see oscar_accounts.core), it is reloaded when the shared
+# version key changes or it is older than ACCOUNTS_LOCAL_CACHE_TIMEOUT.
+_state = {'config': None, 'version': None, 'loaded': None, 'ids': None}
+
+
+def get_config():
+    return getattr(settings, 'ACCOUNTS_STRIPED_ACCOUNTS', {})
+
+
+def striped_account_ids(account_model):
+    config = get_config()
+    key = tuple(sorted(config.items()))
+    version = core.shared_version(VERSION_KEY)
+    if _state['ids'] is not None and _state['config'] == key and core.is_current(
+            _state['version'], _state['loaded'], version):
+        return _state['ids']
+    loaded = time.monotonic()
+    ids = {pk: config[name] for pk, name in account_model.objects.filter(
+        name__in=list(config)).values_list('pk', 'name')}
+    if version is not None:
+        _state.update(config=key, version=version, loaded=loaded, ids=ids)
+    return ids
+
+
+def clear_cache():
+    """
+    Make every process reload the PKs of the striped accounts
+    """
+    core.change_version(VERSION_KEY)
+
+
+def is_striped_name(name):
+    return name in get_config()
+
+
+def num_stripes(account):
+    """
+    Return the number of stripes for the passed account (zero if the account
+    is not striped)
+    """
+    config = get_config()
+    if not config or account.pk is None:
+        return 0
+    # The name is loaded with the account in most cases, which saves looking
+    # up the PKs of the striped accounts
+    if 'name' not in account.get_deferred_fields():
+        return config.get(account.name, 0)
+    return striped_account_ids(type(account)).get(account.pk, 0)
+
+
+def choose_stripe(stripes, counterparty=None):
+    """
+    Return the index of the stripe that a posting should be applied to.
+
+    With the default 'hash' selection, postings are spread by the PK of the
+    other account of the transfer so that a given customer account always
+    hits the same stripe.  With 'round-robin' selection (or when there is no
+    counterparty), each posting goes to the next stripe in turn.
+    """
+    selection = getattr(settings, 'ACCOUNTS_STRIPE_SELECTION', HASH)
+    if selection == HASH and counterparty is not None:
+        return zlib.crc32(str(counterparty.pk).encode()) % stripes
+    return next(_round_robin) % stripes
@@ -0,0 +1,32 @@
+"""
+Running the sync ORM code behind the async API in worker threads.
+
+The async functions of the facade and managers don't access the database
+asynchronously: Django's ORM can't run a database transaction across awaits,
+so each call makes its whole posting in a thread from the event loop's default
+executor.  Unlike sync_to_async's default, the calls aren't queued for one
+shared thread, so several postings can run at once, each with its own
+database connection and transaction.  As a consequence, they don't take part
+in any transaction that the caller has open.
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def _call(func, args, kwargs):
+    # Worker threads outlive the call, so their connections are closed or
+    # kept according to CONN_MAX_AGE, as they are at the end of a request.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Call func with the passed arguments in a worker thread and return its
+    result
+    """
+    return await sync_to_async(_call, thread_sensitive=False)(
+        func, args, kwargs)
@@ -20,7 +20,10 @@ class AccountBalanceView(generic.FormView):
         return super().post(request, *args, **kwargs)
 
     def form_invalid(self, form):
-        security.record_failed_request(self.request)
+        # Codes with an invalid check digit are rejected without a query, so
+        # they don't count as attempts to guess a code
+        if not form.has_error('code', 'malformed'):
+            security.record_failed_request(self.request)
         return super().form_invalid(form)
 
     def form_valid(self, form):
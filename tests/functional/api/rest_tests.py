@@ -1,14 +1,20 @@
 import base64
+import io
 import json
 from decimal import Decimal as D
+from unittest import mock
 
 from django import test
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
 from django.contrib.auth.models import User
 from django.test.client import Client
 from django.urls import reverse
 
 from freezegun import freeze_time
-from oscar_accounts import models
+from oscar_accounts import facade, models
 from oscar_accounts.setup import create_default_accounts
 
 USERNAME, PASSWORD = 'client', 'password'
@@ -231,6 +237,106 @@ class TestTransferView(test.TestCase):
         self.assertEqual(404, response.status_code)
 
 
+class TestAuthenticatingWithAnAPIKey(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('pos', None, 'password')
+        self.api_key, self.key = models.APIKey.objects.create_key(user, 'POS')
+        self.url = reverse(
+            'oscar_accounts_api:transfer',
+            kwargs={'reference': '12345678123456781234567812345678'})
+
+    def get(self, key):
+        return Client().get(self.url, HTTP_AUTHORIZATION='Api-Key ' + key)
+
+    def test_accepts_a_valid_key(self):
+        self.assertEqual(404, self.get(self.key).status_code)
+
+    def test_rejects_an_invalid_key(self):
+        self.assertEqual(401, self.get(self.key[:-1] + '!').status_code)
+        self.assertEqual(401, self.get('unknown.key').status_code)
+
+    def test_rejects_a_revoked_key(self):
+        self.get(self.key)
+        self.api_key.is_active = False
+        self.api_key.save()
+        self.assertEqual(401, self.get(self.key).status_code)
+
+    def test_caches_the_key(self):
+        self.get(self.key)
+        with self.assertNumQueries(2):
+            # Only the queries for the transfer and its ETag
+            self.get(self.key)
+
+    def test_caches_only_the_id_and_status_of_the_user(self):
+        self.get(self.key)
+        cached = cache.get(models.APIKey.cache_key(self.api_key.prefix))
+        self.assertEqual(
+            (self.api_key.hashed_key, self.api_key.user_id, True), cached)
+
+    def test_rejects_the_key_of_a_deactivated_user(self):
+        self.get(self.key)
+        self.api_key.user.is_active = False
+        self.api_key.user.save()
+        self.assertEqual(401, self.get(self.key).status_code)
+
+    def test_rejects_the_key_of_a_deleted_user(self):
+        self.get(self.key)
+        self.api_key.user.delete()
+        self.assertEqual(401, self.get(self.key).status_code)
+
+    def test_can_be_created_by_a_management_command(self):
+        out = io.StringIO()
+        call_command('create_api_key', 'pos', name='Till 2', stdout=out)
+        key = out.getvalue().split()[-1]
+        self.assertEqual(404, self.get(key).status_code)
+
+    def test_still_allows_basic_auth(self):
+        self.assertEqual(404, get(self.url).status_code)
+
+
+class TestAccountView(test.TestCase):
+
+    @test.override_settings(ACCOUNTS_CODE_CHECK_DIGIT=True)
+    def test_returns_404_for_a_malformed_code_without_a_query(self):
+        url = reverse('oscar_accounts_api:account',
+                      kwargs={'code': 'ABCDEFGHIJKLM'})
+        headers = get_headers()
+        with self.assertNumQueries(1):
+            # Only the query to authenticate the client
+            response = Client().get(url, **headers)
+        self.assertEqual(404, response.status_code)
+
+
+class TestPendingTransferView(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        source = models.Account.objects.get(name='Bank')
+        destination = models.Account.objects.create(code='12345678')
+        self.pending_id = facade.enqueue_transfer(
+            source, destination, D('10.00'))
+        self.url = reverse('oscar_accounts_api:pending-transfer',
+                           kwargs={'pk': self.pending_id})
+
+    def test_returns_the_status_of_a_pending_transfer(self):
+        data = to_json(get(self.url))
+        self.assertEqual('Pending', data['status'])
+        self.assertIsNone(data['transfer_url'])
+
+    def test_links_to_the_posted_transfer(self):
+        facade.process_pending_transfers()
+        data = to_json(get(self.url))
+        self.assertEqual('Posted', data['status'])
+        self.assertEqual(200, get(data['transfer_url']).status_code)
+
+    def test_returns_404_for_missing_pending_transfer(self):
+        url = reverse('oscar_accounts_api:pending-transfer',
+                      kwargs={'pk': self.pending_id + 1})
+        self.assertEqual(404, get(url).status_code)
+
+
 @freeze_time('2019-01-01')
 class TestMakingARedemptionThenRefund(test.TestCase):
 
@@ -351,3 +457,397 @@ class TestMakingARedemptionThenTransferRefund(test.TestCase):
         refund_url = transfer_dict['refunds_url']
         response = post(refund_url, self.refund_payload)
         self.assertEqual(403, response.status_code)
+
+
+def post_batch(operations, atomic=False, ndjson=False, **extra):
+    url = reverse('oscar_accounts_api:batch')
+    if atomic:
+        url += '?atomic=1'
+    if ndjson:
+        body = ''.join(json.dumps(operation) + '\n' for operation in operations)
+        content_type = 'application/x-ndjson'
+    else:
+        body = json.dumps(operations)
+        content_type = 'application/json'
+    return Client().post(url, body, content_type=content_type,
+                         **get_headers(), **extra)
+
+
+def to_results(response):
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    return [json.loads(line) for line in content.decode('utf-8').splitlines()]
+
+
+@freeze_time('2019-01-01')
+class TestMakingABatchOfOperations(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        response = post(reverse('oscar_accounts_api:accounts'), {
+            'start_date': '2012-01-01T09:00:00+03:00',
+            'end_date': '2019-06-01T09:00:00+03:00',
+            'amount': '100.00',
+            'account_type': 'Test accounts',
+        })
+        self.code = to_json(response)['code']
+        self.account = models.Account.objects.get(code=self.code)
+
+    def test_streams_a_result_for_each_operation_in_order(self):
+        response = post_batch([
+            {'op': 'redeem', 'code': self.code, 'amount': '30.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '100.00'},
+            {'op': 'refund', 'code': self.code, 'amount': '5.00'},
+            {'op': 'redeem', 'code': 'UNKNOWN', 'amount': '5.00'},
+            {'op': 'bogus'},
+        ])
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        results = to_results(response)
+        self.assertEqual([0, 1, 2, 3, 4], [r['index'] for r in results])
+        self.assertEqual([201, 403, 201, 404, 400],
+                         [r['status'] for r in results])
+        self.assertEqual('30.00', results[0]['transfer']['amount'])
+        self.assertEqual('T101', results[1]['code'])
+        self.assertEqual(D('75.00'), models.Account.objects.get(code=self.code).balance)
+
+    def test_accepts_newline_delimited_json(self):
+        response = post_batch([
+            {'op': 'redeem', 'code': self.code, 'amount': '30.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '20.00'},
+        ], ndjson=True)
+        results = to_results(response)
+        self.assertEqual([201, 201], [r['status'] for r in results])
+        reverse_response = post_batch(
+            [{'op': 'reverse', 'reference': results[0]['transfer']['reference']}],
+            ndjson=True)
+        self.assertEqual([201], [r['status'] for r in to_results(reverse_response)])
+        self.assertEqual(D('80.00'), models.Account.objects.get(code=self.code).balance)
+
+    def test_reports_undecodable_lines(self):
+        response = Client().post(
+            reverse('oscar_accounts_api:batch'), b'{"op": \n',
+            content_type='application/x-ndjson', **get_headers())
+        self.assertEqual(400, to_results(response)[0]['status'])
+
+    def test_makes_all_operations_of_an_atomic_batch(self):
+        response = post_batch([
+            {'op': 'redeem', 'code': self.code, 'amount': '30.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '20.00'},
+        ], atomic=True)
+        self.assertEqual([201, 201], [r['status'] for r in to_results(response)])
+        self.assertEqual(D('50.00'), models.Account.objects.get(code=self.code).balance)
+
+    def test_makes_no_operations_if_any_of_an_atomic_batch_fails(self):
+        response = post_batch([
+            {'op': 'redeem', 'code': self.code, 'amount': '30.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '80.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '10.00'},
+        ], atomic=True)
+        self.assertEqual(403, response.status_code)
+        self.assertEqual(1, to_json(response)['index'])
+        self.assertEqual(D('100.00'), models.Account.objects.get(code=self.code).balance)
+        self.assertEqual(1, models.Transfer.objects.count())
+
+    def test_replays_an_atomic_batch_made_with_an_idempotency_key(self):
+        operations = [
+            {'op': 'redeem', 'code': self.code, 'amount': '30.00'},
+            {'op': 'redeem', 'code': self.code, 'amount': '20.00'}]
+        first = post_batch(operations, atomic=True, HTTP_IDEMPOTENCY_KEY='abc')
+        second = post_batch(operations, atomic=True, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual('true', second['Idempotent-Replayed'])
+        self.assertEqual('application/x-ndjson', second['Content-Type'])
+        self.assertEqual(to_results(first), to_results(second))
+        self.assertEqual(D('50.00'), models.Account.objects.get(code=self.code).balance)
+
+    def test_rejects_an_idempotency_key_for_a_batch_that_is_not_atomic(self):
+        response = post_batch(
+            [{'op': 'redeem', 'code': self.code, 'amount': '30.00'}],
+            HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(D('100.00'), models.Account.objects.get(code=self.code).balance)
+
+    def test_does_not_look_up_the_redemptions_account_for_each_operation(self):
+        with test.utils.CaptureQueriesContext(connection) as one:
+            to_results(post_batch([
+                {'op': 'redeem', 'code': self.code, 'amount': '1.00'}]))
+        with test.utils.CaptureQueriesContext(connection) as two:
+            to_results(post_batch([
+                {'op': 'redeem', 'code': self.code, 'amount': '1.00'},
+                {'op': 'redeem', 'code': self.code, 'amount': '1.00'}]))
+        redemptions = [q for q in two.captured_queries
+                       if 'Redemptions' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertLessEqual(len(redemptions), 1)
+        self.assertLess(len(two) - len(one), len(one))
+
+    def test_rejects_other_content_types(self):
+        response = Client().post(
+            reverse('oscar_accounts_api:batch'), '',
+            content_type='text/plain', **get_headers())
+        self.assertEqual(400, response.status_code)
+
+
+@freeze_time('2019-01-01')
+class TestRetryingARequestWithAnIdempotencyKey(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        response = post(reverse('oscar_accounts_api:accounts'), {
+            'start_date': '2012-01-01T09:00:00+03:00',
+            'end_date': '2019-06-01T09:00:00+03:00',
+            'amount': '100.00',
+            'account_type': 'Test accounts',
+        })
+        self.code = to_json(response)['code']
+        self.url = reverse('oscar_accounts_api:account-redemptions',
+                           kwargs={'code': self.code})
+
+    def redeem(self, amount, key='abc123'):
+        return Client().post(
+            self.url, json.dumps({'amount': amount}),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+            **get_headers())
+
+    def balance(self):
+        return models.Account.objects.get(code=self.code).balance
+
+    def test_replays_the_response_without_making_the_transfer_again(self):
+        first = self.redeem('30.00')
+        with self.assertNumQueries(3):
+            # Creating the headers, authentication and the key lookup
+            second = self.redeem('30.00')
+        self.assertEqual(201, second.status_code)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual('true', second['Idempotent-Replayed'])
+        self.assertEqual(D('70.00'), self.balance())
+
+    def test_makes_requests_with_different_keys(self):
+        self.redeem('30.00', key='a')
+        self.redeem('30.00', key='b')
+        self.assertEqual(D('40.00'), self.balance())
+
+    def test_replays_failed_requests(self):
+        first = self.redeem('300.00')
+        second = self.redeem('300.00')
+        self.assertEqual(403, second.status_code)
+        self.assertEqual(first.content, second.content)
+
+    def test_rejects_a_key_reused_for_a_different_request(self):
+        self.redeem('30.00')
+        response = self.redeem('40.00')
+        self.assertEqual(422, response.status_code)
+        self.assertEqual(D('70.00'), self.balance())
+
+    def test_replays_the_response_of_a_concurrent_request(self):
+        first = self.redeem('30.00')
+        # Make the retry miss the stored key, as if the first request hadn't
+        # committed when it was looked up
+        original_first = QuerySet.first
+        lookups = []
+
+        def first_after_a_miss(queryset):
+            lookups.append(queryset)
+            return None if len(lookups) == 1 else original_first(queryset)
+        with mock.patch.object(QuerySet, 'first', first_after_a_miss):
+            second = self.redeem('30.00')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(D('70.00'), self.balance())
+        self.assertEqual(2, models.Transfer.objects.count())
+
+    def test_expired_keys_are_deleted_by_a_management_command(self):
+        self.redeem('30.00')
+        out = io.StringIO()
+        call_command('delete_expired_idempotency_keys', stdout=out)
+        self.assertEqual(1, models.IdempotencyKey.objects.count())
+        with freeze_time('2019-01-02 00:00:01'):
+            call_command('delete_expired_idempotency_keys', stdout=out)
+        self.assertEqual(0, models.IdempotencyKey.objects.count())
+
+
+class TestAccountTransactionsView(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.account = models.Account.objects.create(code='STATEMENT')
+        bank = models.Account.objects.get(name='Bank')
+        with freeze_time('2019-01-01'):
+            # Transactions made at the same time are ordered by id
+            for amount in ('1.00', '2.00', '3.00'):
+                facade.transfer(bank, self.account, D(amount))
+        with freeze_time('2019-02-01'):
+            for amount in ('4.00', '5.00'):
+                facade.transfer(bank, self.account, D(amount))
+        self.url = reverse('oscar_accounts_api:account-transactions',
+                           kwargs={'code': 'STATEMENT'})
+
+    def fetch_all(self, url):
+        amounts = []
+        while url:
+            data = to_json(get(url))
+            amounts.extend(txn['amount'] for txn in data['transactions'])
+            url = data['next_url']
+        return amounts
+
+    def test_pages_through_the_transactions_newest_first(self):
+        self.assertEqual(['5.00', '4.00', '3.00', '2.00', '1.00'],
+                         self.fetch_all(self.url + '?page_size=2'))
+
+    def test_returns_the_counterparty_of_each_transaction(self):
+        txn = to_json(get(self.url))['transactions'][0]
+        self.assertEqual('Bank', txn['counterparty_name'])
+        self.assertEqual(200, get(txn['transfer_url']).status_code)
+
+    def test_filters_by_date(self):
+        self.assertEqual(['3.00', '2.00', '1.00'], self.fetch_all(
+            self.url + '?page_size=2&end_date=2019-01-15T00:00:00%2B00:00'))
+        self.assertEqual(['5.00', '4.00'], self.fetch_all(
+            self.url + '?start_date=2019-01-15T00:00:00%2B00:00'))
+
+    def test_fetches_a_page_with_a_fixed_number_of_queries(self):
+        first_page = to_json(get(self.url + '?page_size=2'))
+        # Creating the headers, authentication, the account and the page
+        with self.assertNumQueries(4):
+            response = get(first_page['next_url'])
+        self.assertEqual(2, len(to_json(response)['transactions']))
+
+    def test_rejects_invalid_parameters(self):
+        for query in ('?cursor=nonsense', '?page_size=0', '?start_date=never'):
+            self.assertEqual(400, get(self.url + query).status_code, query)
+
+    def test_returns_404_for_unknown_accounts(self):
+        url = reverse('oscar_accounts_api:account-transactions',
+                      kwargs={'code': 'UNKNOWN'})
+        self.assertEqual(404, get(url).status_code)
+
+
+class TestTransferFeedView(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.account = models.Account.objects.create(code='FEED')
+        self.bank = models.Account.objects.get(name='Bank')
+        with freeze_time('2019-01-01'):
+            for amount in ('1.00', '2.00', '3.00'):
+                facade.transfer(self.bank, self.account, D(amount))
+        self.url = reverse('oscar_accounts_api:transfer-feed')
+
+    def fetch(self, query=''):
+        with freeze_time('2019-01-02'):
+            return to_results(get(self.url + query))
+
+    def test_streams_transfers_oldest_first(self):
+        lines = self.fetch()
+        self.assertEqual(['1.00', '2.00', '3.00'], [t['amount'] for t in lines])
+        self.assertEqual('Bank', lines[0]['source_name'])
+        self.assertEqual('FEED', lines[0]['destination_code'])
+
+    def test_resumes_after_a_cursor(self):
+        first = self.fetch('?page_size=2')
+        self.assertEqual(2, len(first))
+        rest = self.fetch('?after=%d' % first[-1]['position'])
+        self.assertEqual(['3.00'], [t['amount'] for t in rest])
+        self.assertEqual([], self.fetch('?after=%d' % rest[-1]['position']))
+
+    def test_includes_transfers_that_commit_after_later_ones(self):
+        lines = self.fetch()
+        # A transfer whose id was allocated before the others', but which
+        # only committed once they had been read
+        late = models.Transfer.objects.order_by('pk').first()
+        models.Transfer.objects.filter(pk=late.pk).update(feed_position=None)
+        rest = self.fetch('?after=%d' % lines[-1]['position'])
+        self.assertEqual([late.pk], [t['id'] for t in rest])
+
+    def test_assigns_positions_in_the_order_transfers_are_first_read(self):
+        self.fetch('?page_size=1')
+        facade.transfer(self.bank, self.account, D('4.00'))
+        self.assertEqual(None, models.Transfer.objects.get(
+            amount=D('4.00')).feed_position)
+        lines = self.fetch()
+        self.assertEqual([1, 2, 3, 4], [t['position'] for t in lines])
+        self.assertEqual('4.00', lines[-1]['amount'])
+
+    def test_does_not_commit_positions_taken_concurrently(self):
+        # Another request gives the first position to the last transfer after
+        # this one has read the last position
+        last = models.Transfer.objects.order_by('pk').last()
+        models.Transfer.objects.filter(pk=last.pk).update(feed_position=1)
+        aggregate = models.Transfer.objects.aggregate
+        stale = [{'last': None}]
+
+        def read_a_stale_position(**kwargs):
+            if stale:
+                return stale.pop()
+            return aggregate(**kwargs)
+
+        with mock.patch.object(models.Transfer.objects, 'aggregate',
+                               read_a_stale_position):
+            self.assertEqual(2, models.Transfer.objects.assign_feed_positions(10))
+        self.assertEqual(['3.00', '1.00', '2.00'],
+                         [t['amount'] for t in self.fetch()])
+
+    def test_streams_a_page_with_a_fixed_number_of_queries(self):
+        get_headers()
+        self.fetch()
+        # Creating the headers, authentication, the last position and the
+        # transfers without one (in a savepoint) and the page
+        with self.assertNumQueries(7):
+            self.fetch()
+
+    def test_rejects_invalid_parameters(self):
+        for query in ('?after=x', '?page_size=0'):
+            with freeze_time('2019-01-02'):
+                self.assertEqual(400, get(self.url + query).status_code)
+
+
+class TestConditionalRequests(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.account = models.Account.objects.create(code='POLLED')
+        self.bank = models.Account.objects.get(name='Bank')
+        self.transfer = facade.transfer(self.bank, self.account, D('10.00'))
+        self.account_url = reverse('oscar_accounts_api:account',
+                                   kwargs={'code': 'POLLED'})
+        self.transfer_url = reverse(
+            'oscar_accounts_api:transfer',
+            kwargs={'reference': self.transfer.reference})
+        get_headers()
+
+    def get(self, url, etag):
+        return Client().get(url, HTTP_IF_NONE_MATCH=etag, **get_headers())
+
+    def test_returns_304_for_an_unchanged_account(self):
+        etag = get(self.account_url)['ETag']
+        # Creating the headers, authentication and the ETag
+        with self.assertNumQueries(3):
+            response = self.get(self.account_url, etag)
+        self.assertEqual(304, response.status_code)
+
+    def test_returns_the_account_once_its_balance_changes(self):
+        etag = get(self.account_url)['ETag']
+        facade.transfer(self.bank, self.account, D('5.00'))
+        response = self.get(self.account_url, etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('15.00', to_json(response)['balance'])
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_returns_the_account_once_it_is_changed(self):
+        etag = get(self.account_url)['ETag']
+        self.account.status = models.Account.FROZEN
+        self.account.save()
+        self.assertEqual(200, self.get(self.account_url, etag).status_code)
+
+    def test_returns_304_for_an_unchanged_transfer(self):
+        etag = get(self.transfer_url)['ETag']
+        self.assertEqual(304, self.get(self.transfer_url, etag).status_code)
+
+    def test_returns_the_transfer_once_it_is_refunded(self):
+        etag = get(self.transfer_url)['ETag']
+        facade.transfer(self.account, self.bank, D('4.00'),
+                        parent=self.transfer)
+        response = self.get(self.transfer_url, etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('6.00', to_json(response)['available_to_refund'])
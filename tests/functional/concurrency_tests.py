@@ -0,0 +1,160 @@
+import io
+import threading
+from decimal import Decimal as D
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase, override_settings
+
+from oscar_accounts import exceptions, facade
+from oscar_accounts.models import Account, Transaction, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+def run_concurrently(num_threads, func):
+    """
+    Call func(thread_index) in the passed number of threads, all released at
+    the same time.
+    """
+    barrier = threading.Barrier(num_threads)
+    errors = []
+
+    def target(index):
+        try:
+            barrier.wait()
+            func(index)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(i,))
+               for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+@skipUnless(connection.features.has_select_for_update,
+            "Row locking is not supported by this database")
+class TestConcurrentRedemptions(TransactionTestCase):
+    num_threads = 8
+    redemptions_per_thread = 5
+
+    def setUp(self):
+        self.bank = AccountFactory(credit_limit=None)
+        self.redemptions = AccountFactory(credit_limit=None)
+
+    def create_giftcard(self, amount):
+        giftcard = AccountFactory()
+        facade.transfer(self.bank, giftcard, amount)
+        return giftcard
+
+    def redeem(self, giftcard, amount, times):
+        # Load the giftcard before the other threads spend from it, so that
+        # the in-memory balance is stale for all but the first redemption.
+        giftcard = Account.objects.get(pk=giftcard.pk)
+        redemptions = Account.objects.get(pk=self.redemptions.pk)
+        successful = 0
+        for __ in range(times):
+            try:
+                facade.transfer(giftcard, redemptions, amount)
+            except (exceptions.InsufficientFunds,
+                    exceptions.ConcurrentUpdate):
+                pass
+            else:
+                successful += 1
+        return successful
+
+    def test_cannot_overdraw_an_account(self):
+        giftcard = self.create_giftcard(D('100.00'))
+        run_concurrently(
+            self.num_threads,
+            lambda i: self.redeem(giftcard, D('10.00'),
+                                  self.redemptions_per_thread))
+
+        giftcard.refresh_from_db()
+        self.assertEqual(D('0.00'), giftcard.balance)
+        self.assertEqual(10, Transfer.objects.filter(
+            source=giftcard).count())
+        total = Transaction.objects.filter(account=giftcard).aggregate(
+            sum=Sum('amount'))['sum']
+        self.assertEqual(giftcard.balance, total)
+
+    def test_balances_stay_consistent_as_contention_rises(self):
+        # Run the same number of redemptions spread over fewer and fewer
+        # giftcards, so that more and more threads contend for each row.
+        for num_giftcards in (self.num_threads, 4, 2, 1):
+            giftcards = [self.create_giftcard(D('1000.00'))
+                         for __ in range(num_giftcards)]
+            successful = [0] * self.num_threads
+
+            def redeem(i):
+                successful[i] = self.redeem(
+                    giftcards[i % num_giftcards], D('1.00'),
+                    self.redemptions_per_thread)
+
+            run_concurrently(self.num_threads, redeem)
+            balance = Account.objects.filter(
+                pk__in=[giftcard.pk for giftcard in giftcards]).aggregate(
+                    sum=Sum('balance'))['sum']
+            self.assertEqual(D('1000.00') * num_giftcards - sum(successful),
+                             balance)
+
+
+@skipUnless(connection.features.has_select_for_update,
+            "Row locking is not supported by this database")
+class TestThePostingBenchmark(TransactionTestCase):
+
+    def test_reports_the_throughput_at_each_level_of_contention(self):
+        out = io.StringIO()
+        call_command('benchmark_postings', threads=4, transfers=5,
+                     accounts=[4, 1], stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith(
+            "4 threads over 4 accounts: 20 transfers in "))
+        self.assertTrue(lines[1].startswith(
+            "4 threads over 1 accounts: 20 transfers in "))
+        # Five loads of the shared accounts and 40 transfers from them
+        self.assertEqual(45, Transfer.objects.count())
+    num_threads = 8
+
+    def test_give_each_transfer_one_position(self):
+        bank = AccountFactory(credit_limit=None)
+        accounts = [AccountFactory() for __ in range(self.num_threads)]
+
+        def post_and_read(i):
+            for __ in range(5):
+                facade.transfer(bank, accounts[i], D('1.00'))
+                Transfer.objects.assign_feed_positions(3)
+
+        run_concurrently(self.num_threads, post_and_read)
+        while Transfer.objects.assign_feed_positions(100):
+            pass
+        positions = list(Transfer.objects.values_list(
+            'feed_position', flat=True))
+        self.assertEqual(5 * self.num_threads, len(positions))
+        self.assertNotIn(None, positions)
+
+
+@override_settings(ACCOUNTS_OPTIMISTIC_LOCKING=True,
+                   ACCOUNTS_POSTING_MAX_RETRIES=50,
+                   ACCOUNTS_POSTING_RETRY_DELAY=0.001)
+class TestConcurrentRedemptionsWithOptimisticLocking(
+        TestConcurrentRedemptions):
+
+    def test_counts_conflicts(self):
+        before = facade.posting_stats()
+        giftcard = self.create_giftcard(D('100.00'))
+        run_concurrently(
+            self.num_threads,
+            lambda i: self.redeem(giftcard, D('10.00'),
+                                  self.redemptions_per_thread))
+        after = facade.posting_stats()
+        self.assertTrue(after['conflicts'] > before['conflicts'])
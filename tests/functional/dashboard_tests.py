@@ -1,11 +1,16 @@
+import datetime
 from decimal import Decimal as D
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from oscar.test.factories import UserFactory
 
 from django_webtest import WebTest
-from oscar_accounts import models
+from oscar_accounts import accounttypes, core, facade, models, names
 from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
 
 
 class TestAStaffMember(WebTest):
@@ -28,3 +33,21 @@ class TestAStaffMember(WebTest):
 
         acc = models.Account.objects.get(name='Test account')
         self.assertEqual(D('120.00'), acc.balance)
+
+    def test_can_run_the_deferred_income_report_with_a_query_per_type(self):
+        account_type = accounttypes.get(names.DEFERRED_INCOME_ACCOUNT_TYPES[0])
+        url = reverse('accounts_dashboard:report-deferred-income')
+        date = (timezone.now() + datetime.timedelta(days=1)).date().isoformat()
+        # Load the session, user and account types
+        self.app.get(url, {'date': date}, user=self.staff)
+        num_queries = []
+        for num_accounts in (2, 4):
+            while account_type.accounts.count() < num_accounts:
+                account = AccountFactory(account_type=account_type)
+                facade.transfer(core.bank_account(), account, D('10.00'))
+            with CaptureQueriesContext(connection) as queries:
+                page = self.app.get(url, {'date': date}, user=self.staff)
+            num_queries.append(len(queries))
+        self.assertEqual(D('40.00'), page.context['totals']['total'])
+        self.assertEqual(4, page.context['totals']['num_accounts'])
+        self.assertEqual(num_queries[0], num_queries[1])
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from oscar_accounts import accounttypes, names
+from oscar_accounts.models import AccountType
+from oscar_accounts.setup import create_default_accounts
+
+
+class TestTheAccountTypeTree(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+
+    def test_resolves_names_without_a_query_once_loaded(self):
+        accounttypes.get(names.CASH)
+        with self.assertNumQueries(0):
+            cash = accounttypes.get(names.CASH)
+        self.assertEqual(AccountType.objects.get(name=names.CASH), cash)
+
+    def test_returns_full_names_without_a_query_once_loaded(self):
+        cash = AccountType.objects.get(name=names.CASH)
+        accounttypes.get(names.CASH)
+        with self.assertNumQueries(0):
+            self.assertEqual('Assets / Cash', cash.full_name)
+
+    def test_returns_children_in_tree_order(self):
+        liabilities = accounttypes.get(names.LIABILITIES)
+        self.assertEqual(
+            [t.name for t in liabilities.get_children()],
+            [t.name for t in accounttypes.get_children(liabilities)])
+
+    def test_is_reloaded_when_a_type_is_added(self):
+        deferred_income = accounttypes.get(names.DEFERRED_INCOME)
+        before = len(accounttypes.get_children(deferred_income))
+        child = deferred_income.add_child(name='Vouchers')
+        self.assertEqual(before + 1, len(accounttypes.get_children(deferred_income)))
+        self.assertEqual('Liabilities / Deferred income / Vouchers', child.full_name)
+
+    def test_is_reloaded_when_a_type_is_renamed_or_deleted(self):
+        cash = AccountType.objects.get(name=names.CASH)
+        cash.name = 'Money'
+        cash.save()
+        self.assertEqual('Assets / Money', accounttypes.get('Money').full_name)
+        cash.delete()
+        with self.assertRaises(AccountType.DoesNotExist):
+            accounttypes.get('Money')
+
+    def test_raises_for_ambiguous_names(self):
+        accounttypes.get(names.ASSETS).add_child(name=names.CASH)
+        with self.assertRaises(AccountType.MultipleObjectsReturned):
+            accounttypes.get(names.CASH)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_is_not_cached_without_a_shared_cache(self):
+        accounttypes.get(names.CASH)
+        AccountType.objects.filter(name=names.CASH).update(name='Money')
+        with self.assertNumQueries(1):
+            self.assertEqual('Money', accounttypes.get('Money').name)
+
+    @override_settings(ACCOUNTS_LOCAL_CACHE_TIMEOUT=60)
+    def test_is_reloaded_once_the_local_timeout_passes(self):
+        accounttypes.get(names.CASH)
+        AccountType.objects.filter(name=names.CASH).update(name='Money')
+        with self.assertRaises(AccountType.DoesNotExist):
+            accounttypes.get('Money')
+        later = accounttypes.time.monotonic() + 61
+        with mock.patch.object(accounttypes.time, 'monotonic', return_value=later):
+            self.assertEqual('Money', accounttypes.get('Money').name)
@@ -0,0 +1,113 @@
+import datetime
+import io
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from freezegun import freeze_time
+
+from oscar_accounts import checkpoints, facade
+from oscar_accounts.models import Account, BalanceCheckpoint
+from oscar_accounts.test_factories import AccountFactory
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+class TestBalanceCheckpoints(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.account = AccountFactory()
+        for date, amount in [(utc(2021, 1, 5), D('10.00')),
+                             (utc(2021, 1, 20), D('15.00')),
+                             (utc(2021, 2, 10), D('20.00')),
+                             (utc(2021, 3, 3), D('40.00'))]:
+            with freeze_time(date):
+                facade.transfer(self.source, self.account, amount)
+
+    def test_are_created_at_period_boundaries_for_active_accounts(self):
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 3, 15))
+        balances = dict(BalanceCheckpoint.objects.filter(
+            account=self.account).values_list('date', 'balance'))
+        self.assertEqual({utc(2021, 2, 1): D('25.00'),
+                          utc(2021, 3, 1): D('45.00')}, balances)
+        self.assertEqual(4, BalanceCheckpoint.objects.count())
+
+    def test_are_created_incrementally(self):
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 2, 15))
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 4, 15))
+        balances = dict(BalanceCheckpoint.objects.filter(
+            account=self.account).values_list('date', 'balance'))
+        self.assertEqual({utc(2021, 2, 1): D('25.00'),
+                          utc(2021, 3, 1): D('45.00'),
+                          utc(2021, 4, 1): D('85.00')}, balances)
+
+    def test_can_be_created_by_a_management_command(self):
+        with freeze_time(utc(2021, 3, 15)):
+            call_command('create_balance_checkpoints', period='day',
+                         stdout=io.StringIO())
+        self.assertEqual(D('85.00'), BalanceCheckpoint.objects.get(
+            account=self.account, date=utc(2021, 3, 4)).balance)
+
+    def test_give_the_same_historical_balances_as_the_transactions(self):
+        dates = [utc(2021, 1, 1), utc(2021, 1, 20), utc(2021, 2, 1),
+                 utc(2021, 2, 28), utc(2021, 3, 3, 12), utc(2022, 1, 1)]
+        expected = [self.account.balance_as_of(date) for date in dates]
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 4, 1))
+        self.assertEqual(
+            expected, [self.account.balance_as_of(date) for date in dates])
+        self.assertEqual([D('0.00'), D('10.00'), D('25.00'), D('45.00'),
+                          D('85.00'), D('85.00')], expected)
+
+    def test_give_the_historical_balances_of_many_accounts_in_one_query(self):
+        other = AccountFactory()
+        with freeze_time(utc(2021, 2, 10)):
+            facade.transfer(self.source, other, D('5.00'))
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 3, 1))
+        accounts = Account.objects.filter(
+            pk__in=[self.source.pk, self.account.pk, other.pk])
+        for date in [utc(2021, 1, 1), utc(2021, 2, 1), utc(2021, 2, 15),
+                     utc(2021, 3, 3, 12), utc(2022, 1, 1)]:
+            expected = {account.pk: account.balance_as_of(date)
+                        for account in accounts}
+            with self.assertNumQueries(1):
+                balances = {
+                    account.pk: account.historical_balance
+                    for account in checkpoints.with_balances_as_of(
+                        accounts, date)}
+            self.assertEqual(expected, balances)
+
+    def test_are_all_or_nothing_at_each_boundary(self):
+        other = AccountFactory()
+        with freeze_time(utc(2021, 1, 6)):
+            facade.transfer(self.source, other, D('5.00'))
+        bulk_create = BalanceCheckpoint.objects.bulk_create
+        calls = []
+
+        def fail_on_second_batch(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError("Lost the connection")
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(BalanceCheckpoint.objects, 'bulk_create',
+                               fail_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                checkpoints.create_checkpoints(
+                    checkpoints.MONTH, until=utc(2021, 3, 15), batch_size=1)
+        self.assertFalse(BalanceCheckpoint.objects.exists())
+
+        checkpoints.create_checkpoints(
+            checkpoints.MONTH, until=utc(2021, 3, 15))
+        self.assertEqual(D('5.00'), BalanceCheckpoint.objects.get(
+            account=other, date=utc(2021, 2, 1)).balance)
+        self.assertEqual(D('5.00'), other.balance_as_of(utc(2021, 3, 10)))
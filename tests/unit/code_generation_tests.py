@@ -1,8 +1,10 @@
 import string
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from oscar_accounts import codes
+from oscar_accounts.checkout.forms import ValidAccountForm
+from oscar_accounts.test_factories import AccountFactory
 
 
 class TestCodeGeneration(TestCase):
@@ -23,3 +25,78 @@ class TestCodeGeneration(TestCase):
         code = codes.generate(chars=chars)
         for char in code:
             self.assertTrue(char in chars)
+
+
+class TestGeneratingManyCodes(TestCase):
+
+    def test_creates_the_requested_number_of_distinct_codes(self):
+        generated = codes.generate_many(500, size=6)
+        self.assertEqual(500, len(set(generated)))
+        self.assertTrue(all(len(code) == 6 for code in generated))
+
+    def test_checks_for_existing_codes_in_chunks(self):
+        with self.assertNumQueries(3):
+            codes.generate_many(250, chunk_size=100)
+
+    def test_avoids_existing_codes(self):
+        # Use up all but two of the possible codes
+        existing = ['A', 'B', 'C']
+        for code in existing:
+            AccountFactory(code=code)
+        generated = codes.generate_many(2, size=1, chars='ABCDE')
+        self.assertEqual({'D', 'E'}, set(generated))
+
+    def test_refuses_more_codes_than_the_character_set_allows(self):
+        with self.assertRaises(ValueError):
+            codes.generate_many(10, size=1, chars='ABC')
+
+    def test_gives_up_when_existing_codes_use_up_the_character_set(self):
+        for code in 'ABC':
+            AccountFactory(code=code)
+        with self.assertNumQueries(5):
+            with self.assertRaises(ValueError):
+                codes.generate_many(1, size=1, chars='ABC', max_attempts=5)
+
+
+@override_settings(ACCOUNTS_CODE_CHECK_DIGIT=True)
+class TestCheckDigitCodes(TestCase):
+
+    def test_are_generated_with_a_check_character(self):
+        code = codes.generate(size=12)
+        self.assertEqual(13, len(code))
+        self.assertEqual(codes.check_character(code[:-1]), code[-1])
+        self.assertTrue(codes.is_valid(code))
+
+    def test_reject_a_mistyped_character(self):
+        code = codes.generate()
+        for i, char in enumerate(code):
+            for typo in 'A0':
+                if typo != char:
+                    mistyped = code[:i] + typo + code[i + 1:]
+                    self.assertFalse(codes.is_valid(mistyped))
+
+    def test_reject_characters_outside_the_character_set(self):
+        self.assertFalse(codes.is_valid('ABC$'))
+
+    def test_accept_legacy_codes_without_a_check_character(self):
+        self.assertTrue(codes.is_valid('ABCDEFGHIJKL'))
+        self.assertFalse(codes.is_valid('ABCDEFGHIJKLM'))
+
+    @override_settings(ACCOUNTS_LEGACY_CODE_LENGTHS=(8,))
+    def test_accept_legacy_codes_of_the_configured_lengths(self):
+        self.assertTrue(codes.is_valid('ABCDEFGH'))
+        self.assertFalse(codes.is_valid('ABCDEFGHIJKL'))
+
+    def test_are_rejected_by_the_checkout_form_without_a_query(self):
+        code = codes.generate()
+        mistyped = code[:-1] + ('A' if code[-1] != 'A' else 'B')
+        form = ValidAccountForm(None, data={'code': mistyped})
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+        self.assertTrue(form.has_error('code', 'malformed'))
+
+
+class TestNormalisingCodes(TestCase):
+
+    def test_ignores_case_whitespace_and_hyphens(self):
+        self.assertEqual('ABCD1234', codes.normalise(' abcd-12 34 '))
@@ -0,0 +1,141 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from oscar_accounts import codefilter, codes
+from oscar_accounts.checkout.forms import ValidAccountForm
+from oscar_accounts.forms import AccountForm
+from oscar_accounts.models import Account
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestABloomFilter(TestCase):
+
+    def setUp(self):
+        self.filter = codefilter.BloomFilter(1000, error_rate=0.01)
+        self.codes = codes.generate_many(1000)
+        for code in self.codes:
+            self.filter.add(code)
+
+    def test_contains_every_code_added(self):
+        self.assertTrue(all(code in self.filter for code in self.codes))
+
+    def test_has_roughly_the_requested_false_positive_rate(self):
+        others = set(codes.generate_many(5000)) - set(self.codes)
+        false_positives = sum(1 for code in others if code in self.filter)
+        self.assertTrue(false_positives < 0.03 * len(others))
+
+    def test_is_sized_for_its_capacity(self):
+        self.assertEqual(7, self.filter.num_hashes)
+        self.assertEqual(1199, len(self.filter.bits))
+
+
+@override_settings(ACCOUNTS_CODE_FILTER=True,
+                   ACCOUNTS_CODE_FILTER_REFRESH_INTERVAL=3600)
+class TestTheCodeFilter(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        codefilter.clear()
+        self.account = AccountFactory(code='ABCDEFGHIJKL')
+        codefilter.load()
+
+    def tearDown(self):
+        codefilter.clear()
+
+    def create_elsewhere(self, code):
+        # Create an account as another process would, without adding it to
+        # this process's filter
+        Account.objects.bulk_create([Account(code=code)])
+        codefilter._publish([code])
+
+    def test_is_loaded_from_the_existing_accounts(self):
+        self.assertTrue(codefilter.might_exist('ABCDEFGHIJKL'))
+        self.assertFalse(codefilter.might_exist('LKJIHGFEDCBA'))
+
+    def test_includes_accounts_saved_in_this_process(self):
+        AccountFactory(code='LKJIHGFEDCBA')
+        with self.assertNumQueries(0):
+            self.assertTrue(codefilter.might_exist('LKJIHGFEDCBA'))
+
+    def test_publishes_new_codes_when_they_are_committed(self):
+        sequence = cache.get(codefilter.SEQUENCE_KEY)
+        with mock.patch.object(codefilter.transaction, 'on_commit') as on_commit:
+            AccountFactory(code='LKJIHGFEDCBA')
+        self.assertEqual(sequence, cache.get(codefilter.SEQUENCE_KEY))
+        for (callback,), __ in on_commit.call_args_list:
+            callback()
+        self.assertEqual(['LKJIHGFEDCBA'], cache.get(
+            codefilter.BATCH_KEY % (sequence + 1)))
+
+    def test_picks_up_accounts_created_elsewhere_without_a_query(self):
+        self.create_elsewhere('LKJIHGFEDCBA')
+        with self.assertNumQueries(0):
+            self.assertTrue(codefilter.might_exist('LKJIHGFEDCBA'))
+            self.assertFalse(codefilter.might_exist('AAAAAAAAAAAA'))
+
+    def test_does_not_rule_out_codes_when_it_may_have_missed_some(self):
+        self.create_elsewhere('LKJIHGFEDCBA')
+        cache.delete(codefilter.BATCH_KEY % cache.get(codefilter.SEQUENCE_KEY))
+        self.assertTrue(codefilter.might_exist('LKJIHGFEDCBA'))
+        self.assertTrue(codefilter.might_exist('AAAAAAAAAAAA'))
+        # Until it reloads, in the background once the interval has passed
+        with override_settings(ACCOUNTS_CODE_FILTER_REFRESH_INTERVAL=0):
+            with mock.patch.object(codefilter, 'warm_up') as warm_up:
+                self.assertTrue(codefilter.might_exist('AAAAAAAAAAAA'))
+        warm_up.assert_called_once_with()
+        codefilter.load()
+        self.assertTrue(codefilter.might_exist('LKJIHGFEDCBA'))
+        self.assertFalse(codefilter.might_exist('AAAAAAAAAAAA'))
+
+    def test_reloads_when_the_sequence_is_evicted(self):
+        cache.delete(codefilter.SEQUENCE_KEY)
+        self.create_elsewhere('LKJIHGFEDCBA')
+        self.assertTrue(codefilter.might_exist('LKJIHGFEDCBA'))
+        self.assertTrue(codefilter.might_exist('AAAAAAAAAAAA'))
+        codefilter.load()
+        self.assertFalse(codefilter.might_exist('AAAAAAAAAAAA'))
+
+    def test_does_not_rule_out_codes_until_it_is_loaded(self):
+        codefilter.clear()
+        with mock.patch.object(codefilter, 'warm_up') as warm_up:
+            with self.assertNumQueries(0):
+                self.assertTrue(codefilter.might_exist('AAAAAAAAAAAA'))
+        warm_up.assert_called_once_with()
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_never_rules_out_codes_without_a_working_cache(self):
+        self.assertTrue(codefilter.might_exist('AAAAAAAAAAAA'))
+
+    def test_lets_the_checkout_form_reject_unknown_codes_without_a_query(self):
+        form = ValidAccountForm(None, data={'code': 'LKJIHGFEDCBA'})
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+
+    def test_lets_the_balance_form_reject_unknown_codes_without_a_query(self):
+        form = AccountForm(data={'code': 'LKJIHGFEDCBA'})
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+        form = AccountForm(data={'code': 'ABCDEFGHIJKL'})
+        self.assertTrue(form.is_valid())
+
+
+@override_settings(ACCOUNTS_CODE_FILTER=True)
+class TestWarmingUpTheCodeFilter(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        codefilter.clear()
+
+    def tearDown(self):
+        codefilter.clear()
+
+    def test_loads_it_in_a_background_thread(self):
+        AccountFactory(code='ABCDEFGHIJKL')
+        codefilter.warm_up()
+        codefilter._state['thread'].join()
+        with self.assertNumQueries(0):
+            self.assertTrue(codefilter.might_exist('ABCDEFGHIJKL'))
+            self.assertFalse(codefilter.might_exist('LKJIHGFEDCBA'))
@@ -0,0 +1,66 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from oscar_accounts import core, facade
+from oscar_accounts.models import Account
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestLookingUpASystemAccount(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+
+    def test_makes_no_query_once_cached(self):
+        core.redemptions_account()
+        with self.assertNumQueries(0):
+            account = core.redemptions_account()
+        self.assertEqual(Account.objects.get(name='Redemptions').pk, account.pk)
+
+    def test_loads_the_current_balance(self):
+        core.redemptions_account()
+        facade.transfer(AccountFactory(credit_limit=None),
+                        core.redemptions_account(), D('12.00'))
+        self.assertEqual(D('12.00'), core.redemptions_account().balance)
+
+    def test_returns_a_new_instance_each_time(self):
+        self.assertIsNot(core.bank_account(), core.bank_account())
+
+    def test_reloads_an_account_once_it_is_saved(self):
+        core.lapsed_account()
+        lapsed = Account.objects.get(name='Lapsed accounts')
+        lapsed.status = Account.FROZEN
+        lapsed.save()
+        self.assertEqual(Account.FROZEN, core.lapsed_account().status)
+
+    def test_reloads_an_account_once_another_process_clears_the_cache(self):
+        core.bank_account()
+        Account.objects.filter(name='Bank').update(description='Updated')
+        core.clear_cache()
+        self.assertEqual('Updated', core.bank_account().description)
+
+    def test_raises_does_not_exist_for_a_missing_account(self):
+        Account.objects.get(name='Bank').delete()
+        with self.assertRaises(Account.DoesNotExist):
+            core.bank_account()
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_is_not_cached_without_a_shared_cache(self):
+        core.bank_account()
+        Account.objects.filter(name='Bank').update(description='Updated')
+        with self.assertNumQueries(1):
+            account = core.bank_account()
+        self.assertEqual('Updated', account.description)
+
+    @override_settings(ACCOUNTS_LOCAL_CACHE_TIMEOUT=60)
+    def test_reloads_an_account_once_the_local_timeout_passes(self):
+        core.bank_account()
+        Account.objects.filter(name='Bank').update(description='Updated')
+        self.assertNotEqual('Updated', core.bank_account().description)
+        later = core.time.monotonic() + 61
+        with mock.patch.object(core.time, 'monotonic', return_value=later):
+            self.assertEqual('Updated', core.bank_account().description)
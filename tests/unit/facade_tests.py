@@ -1,12 +1,17 @@
+import asyncio
+import threading
 from decimal import Decimal as D
 from unittest import mock
 
+from asgiref.sync import async_to_sync
 from django.db.models import Sum
 from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 from oscar.test.factories import UserFactory
 
-from oscar_accounts import exceptions, facade
+from oscar_accounts import exceptions, facade, threads
 from oscar_accounts.models import Account, Transaction, Transfer
+from oscar_accounts.setup import create_default_accounts
 from oscar_accounts.test_factories import AccountFactory
 
 
@@ -129,3 +134,113 @@ class TestErrorHandling(TransactionTestCase):
             mock_method.side_effect = RuntimeError()
             with self.assertRaises(exceptions.AccountException):
                 facade.transfer(source, destination, D('100'), user)
+
+
+class TestABatchOfTransfers(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.source = AccountFactory(credit_limit=None, primary_user=None)
+        self.destinations = [AccountFactory() for __ in range(3)]
+        legs = [(self.source, destination, D('10.00'),
+                 {'user': self.user, 'description': "Top-up"})
+                for destination in self.destinations]
+        legs.append((self.destinations[0], self.destinations[1], D('5.00'),
+                     None))
+        self.transfers = facade.transfer_many(legs)
+
+    def test_creates_a_transfer_per_leg(self):
+        self.assertEqual(4, len(self.transfers))
+        self.assertEqual(4, Transfer.objects.all().count())
+
+    def test_generates_references(self):
+        references = set(Transfer.objects.values_list('reference', flat=True))
+        self.assertEqual(4, len(references))
+        self.assertNotIn(None, references)
+
+    def test_creates_two_transactions_per_leg(self):
+        self.assertEqual(8, Transaction.objects.all().count())
+        aggregates = Transaction.objects.aggregate(sum=Sum('amount'))
+        self.assertEqual(D('0.00'), aggregates['sum'])
+
+    def test_records_the_metadata(self):
+        self.assertEqual(self.user, self.transfers[0].user)
+        self.assertEqual(self.user.username, self.transfers[0].username)
+        self.assertEqual("Top-up", self.transfers[0].description)
+
+    def test_updates_the_balances(self):
+        self.assertEqual(D('-30.00'), self.source.balance)
+        self.assertEqual(D('5.00'), self.destinations[0].balance)
+        self.assertEqual(D('15.00'), self.destinations[1].balance)
+        self.assertEqual(D('10.00'), self.destinations[2].balance)
+
+
+class TestAnInvalidBatchOfTransfers(TestCase):
+
+    def test_is_rejected_when_the_cumulative_debits_exceed_the_funds(self):
+        source = AccountFactory(credit_limit=D('15.00'))
+        destination = AccountFactory()
+        legs = [(source, destination, D('10.00'), {}),
+                (source, destination, D('10.00'), {})]
+        with self.assertRaises(exceptions.InsufficientFunds):
+            facade.transfer_many(legs)
+        self.assertEqual(0, Transfer.objects.all().count())
+
+    def test_is_rejected_when_a_leg_uses_the_same_account_twice(self):
+        account = AccountFactory(credit_limit=None)
+        with self.assertRaises(exceptions.AccountException):
+            facade.transfer_many([(account, account, D('10.00'), {})])
+
+
+class TestTheAsyncFacade(TransactionTestCase):
+    # The postings are made in worker threads, with their own connections,
+    # so they can't see the data of a test wrapped in a transaction.
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.destination = AccountFactory()
+
+    def test_makes_a_transfer(self):
+        transfer = async_to_sync(facade.atransfer)(
+            self.source, self.destination, D('10.00'), description="Async")
+        self.assertEqual("Async", transfer.description)
+        self.assertEqual(D('10.00'), self.destination.balance)
+
+    def test_reverses_a_transfer(self):
+        transfer = facade.transfer(self.source, self.destination, D('10.00'))
+        async_to_sync(facade.areverse)(transfer)
+        self.assertEqual(D('0.00'), self.destination.balance)
+
+    def test_raises_the_same_exceptions(self):
+        with self.assertRaises(exceptions.InsufficientFunds):
+            async_to_sync(facade.atransfer)(
+                self.destination, self.source, D('10.00'))
+
+    def test_closes_expired_accounts(self):
+        create_default_accounts()
+        account = AccountFactory(end_date=timezone.now())
+        facade.transfer(self.source, account, D('10.00'))
+        async_to_sync(facade.aclose_expired_accounts)()
+        account.refresh_from_db()
+        self.assertTrue(account.is_closed())
+
+    def test_verifies_and_posts_through_the_manager(self):
+        async_to_sync(Transfer.objects.averify_transfer)(
+            self.source, self.destination, D('10.00'))
+        async_to_sync(Transfer.objects.acreate)(
+            self.source, self.destination, D('10.00'))
+        async_to_sync(Transfer.objects.abulk_post)(
+            [(self.source, self.destination, D('5.00'), None)])
+        self.assertEqual(D('15.00'), self.destination.balance)
+
+    def test_runs_concurrent_calls_in_parallel(self):
+        # Each call waits for the other, so they would time out if they were
+        # made one at a time.
+        barrier = threading.Barrier(2, timeout=5)
+
+        async def run_both():
+            return await asyncio.gather(
+                threads.run_in_thread(barrier.wait),
+                threads.run_in_thread(barrier.wait))
+
+        self.assertEqual({0, 1}, set(async_to_sync(run_both)()))
@@ -0,0 +1,75 @@
+import csv
+import datetime
+import io
+import os
+import tempfile
+from decimal import Decimal as D
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from oscar_accounts import issuance, names, reconciliation
+from oscar_accounts.models import Account, AccountType, Transfer
+from oscar_accounts.setup import create_default_accounts
+
+
+class TestIssuingGiftcards(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.bank = Account.objects.get(name=names.BANK)
+        self.account_type = AccountType.objects.get(
+            name=names.DEFERRED_INCOME_ACCOUNT_TYPES[0])
+
+    def test_creates_loaded_accounts(self):
+        end_date = timezone.now() + datetime.timedelta(days=365)
+        accounts = list(issuance.issue_giftcards(
+            25, D('20.00'), account_type=self.account_type,
+            end_date=end_date, chunk_size=10))
+        self.assertEqual(25, len({account.code for account in accounts}))
+        for account in Account.objects.filter(
+                pk__in=[account.pk for account in accounts]):
+            self.assertEqual(D('20.00'), account.balance)
+            self.assertEqual(self.account_type, account.account_type)
+            self.assertEqual(end_date, account.end_date)
+
+    def test_debits_the_bank(self):
+        list(issuance.issue_giftcards(25, D('20.00'), chunk_size=10))
+        self.bank.refresh_from_db()
+        self.assertEqual(D('-500.00'), self.bank.balance)
+        self.assertEqual(25, Transfer.objects.filter(source=self.bank).count())
+        self.assertTrue(reconciliation.reconcile().is_consistent)
+
+    def test_issues_a_chunk_with_a_fixed_number_of_queries(self):
+        num_queries = []
+        for count in (10, 50):
+            accounts = issuance.issue_giftcards(
+                count, D('20.00'), source=self.bank)
+            with CaptureQueriesContext(connection) as queries:
+                list(accounts)
+            num_queries.append(len(queries))
+        self.assertEqual(num_queries[0], num_queries[1])
+
+
+class TestIssuingGiftcardsFromTheCommandLine(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_writes_the_codes_to_a_csv_file(self):
+        call_command('issue_giftcards', self.path, count=5, amount=D('10.00'),
+                     end_date=timezone.now(), stdout=io.StringIO())
+        with open(self.path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(5, len(rows))
+        for row in rows:
+            self.assertEqual(D('10.00'),
+                             Account.objects.get(code=row['code']).balance)
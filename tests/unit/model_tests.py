@@ -177,3 +177,34 @@ class TestATransaction(TestCase):
         self.assertEqual(2, txn.transactions.all().count())
         user.delete()
         self.assertEqual(2, txn.transactions.all().count())
+
+
+class TestAnAccountBalance(TestCase):
+
+    def setUp(self):
+        source = AccountFactory(credit_limit=None)
+        self.account = AccountFactory()
+        Transfer.objects.create(source, self.account, D('20.00'))
+
+    def test_is_not_recalculated_on_save(self):
+        Account.objects.filter(pk=self.account.pk).update(balance=D('5.00'))
+        account = Account.objects.get(pk=self.account.pk)
+        account.save()
+        account.refresh_from_db()
+        self.assertEqual(D('5.00'), account.balance)
+
+    def test_is_not_overwritten_by_saving_a_stale_instance(self):
+        stale = Account.objects.get(pk=self.account.pk)
+        source = AccountFactory(credit_limit=None)
+        Transfer.objects.create(source, self.account, D('10.00'))
+        stale.name = 'Renamed'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual('Renamed', stale.name)
+        self.assertEqual(D('30.00'), stale.balance)
+
+    def test_can_be_recalculated_from_transactions(self):
+        Account.objects.filter(pk=self.account.pk).update(balance=D('5.00'))
+        self.account.recalculate_balance()
+        self.account.refresh_from_db()
+        self.assertEqual(D('20.00'), self.account.balance)
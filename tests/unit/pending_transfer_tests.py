@@ -0,0 +1,112 @@
+import io
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from oscar_accounts import exceptions, facade
+from oscar_accounts.models import PendingTransfer, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestEnqueuingATransfer(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.destination = AccountFactory()
+
+    def test_does_not_post_it(self):
+        pending_id = facade.enqueue_transfer(
+            self.source, self.destination, D('10.00'))
+        pending = PendingTransfer.objects.get(pk=pending_id)
+        self.assertEqual(PendingTransfer.PENDING, pending.status)
+        self.assertEqual(0, Transfer.objects.count())
+
+    def test_rejects_an_invalid_amount(self):
+        with self.assertRaises(exceptions.InvalidAmount):
+            facade.enqueue_transfer(self.source, self.destination, D('0.00'))
+
+    def test_rejects_the_same_source_and_destination(self):
+        with self.assertRaises(exceptions.AccountException):
+            facade.enqueue_transfer(self.source, self.source, D('10.00'))
+
+
+class TestProcessingPendingTransfers(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.giftcard = AccountFactory()
+        self.redemptions = AccountFactory(credit_limit=None)
+        self.ids = [
+            facade.enqueue_transfer(self.source, self.giftcard, D('10.00')),
+            facade.enqueue_transfer(self.giftcard, self.redemptions, D('6.00')),
+            facade.enqueue_transfer(self.giftcard, self.redemptions, D('6.00')),
+            facade.enqueue_transfer(self.source, self.giftcard, D('5.00')),
+        ]
+
+    def test_posts_valid_transfers_and_fails_the_rest(self):
+        self.assertEqual((3, 1), facade.process_pending_transfers())
+        statuses = [PendingTransfer.objects.get(pk=pk).status
+                    for pk in self.ids]
+        self.assertEqual(['Posted', 'Posted', 'Failed', 'Posted'], statuses)
+        self.giftcard.refresh_from_db()
+        self.assertEqual(D('9.00'), self.giftcard.balance)
+
+    def test_links_each_posted_transfer(self):
+        facade.process_pending_transfers()
+        pending = PendingTransfer.objects.get(pk=self.ids[0])
+        self.assertEqual(D('10.00'), pending.transfer.amount)
+        self.assertEqual(self.giftcard, pending.transfer.destination)
+        self.assertIsNotNone(pending.date_processed)
+
+    def test_records_why_a_transfer_failed(self):
+        facade.process_pending_transfers()
+        pending = PendingTransfer.objects.get(pk=self.ids[2])
+        self.assertIsNone(pending.transfer)
+        self.assertIn("Unable to debit", pending.error)
+
+    def test_processes_in_batches(self):
+        self.assertEqual((2, 0),
+                         PendingTransfer.objects.process_batch(batch_size=2))
+        self.assertEqual((1, 1), facade.process_pending_transfers(2))
+
+    def test_posts_each_transfer_only_once(self):
+        facade.process_pending_transfers()
+        self.assertEqual((0, 0), facade.process_pending_transfers())
+        self.assertEqual(3, Transfer.objects.count())
+
+    def test_falls_back_to_posting_one_at_a_time(self):
+        # As if an account changed after the batch was verified
+        with mock.patch.object(type(Transfer.objects), 'bulk_post',
+                               side_effect=exceptions.InsufficientFunds):
+            self.assertEqual((3, 1), facade.process_pending_transfers())
+        self.assertEqual(3, Transfer.objects.count())
+
+    def test_leaves_transfers_that_conflict_pending(self):
+        create = type(Transfer.objects).create
+
+        def conflict_on_first_load(manager, source, destination, amount,
+                                   **kwargs):
+            if amount == D('10.00'):
+                raise exceptions.ConcurrentUpdate("Account changed")
+            return create(manager, source, destination, amount, **kwargs)
+
+        manager = type(Transfer.objects)
+        with mock.patch.object(manager, 'bulk_post',
+                               side_effect=exceptions.ConcurrentUpdate):
+            with mock.patch.object(manager, 'create', conflict_on_first_load):
+                self.assertEqual(
+                    (1, 2), PendingTransfer.objects.process_batch())
+        pending = PendingTransfer.objects.get(pk=self.ids[0])
+        self.assertEqual(PendingTransfer.PENDING, pending.status)
+        self.assertIsNone(pending.date_processed)
+        # And posted by the next batch
+        self.assertEqual((1, 0), facade.process_pending_transfers())
+        self.assertEqual(PendingTransfer.POSTED, PendingTransfer.objects.get(
+            pk=self.ids[0]).status)
+
+    def test_can_be_run_from_the_management_command(self):
+        out = io.StringIO()
+        call_command('process_pending_transfers', batch_size=3, stdout=out)
+        self.assertIn("Posted 3 pending transfers, 1 failed", out.getvalue())
@@ -0,0 +1,125 @@
+import io
+from decimal import Decimal as D
+from unittest import mock, skipIf
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from oscar_accounts import facade, reconciliation
+from oscar_accounts.models import Account, Transaction
+from oscar_accounts.test_factories import AccountFactory
+
+
+class LedgerMixin(object):
+
+    def create_ledger(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.accounts = [AccountFactory() for i in range(5)]
+        self.transfers = [
+            facade.transfer(self.source, account, D('10.00'))
+            for account in self.accounts]
+
+
+class TestReconcilingAConsistentLedger(LedgerMixin, TestCase):
+
+    def setUp(self):
+        self.create_ledger()
+
+    def test_finds_no_problems(self):
+        report = reconciliation.reconcile(chunk_size=2)
+        self.assertTrue(report.is_consistent)
+        self.assertEqual(6, report.num_accounts)
+        self.assertEqual(5, report.num_transfers)
+
+    def test_succeeds_from_the_management_command(self):
+        out = io.StringIO()
+        call_command('reconcile_accounts', chunk_size=2, stdout=out)
+        self.assertIn("Checked 6 accounts and 5 transfers", out.getvalue())
+
+
+class TestReconcilingAnInconsistentLedger(LedgerMixin, TestCase):
+
+    def setUp(self):
+        self.create_ledger()
+        self.corrupted = self.accounts[1]
+        Account.objects.filter(pk=self.corrupted.pk).update(
+            balance=D('99.00'))
+        self.one_legged = self.transfers[3]
+        self.one_legged.transactions.filter(
+            account=self.accounts[3]).delete()
+
+    def test_finds_mismatched_balances(self):
+        report = reconciliation.reconcile(chunk_size=2)
+        self.assertFalse(report.is_consistent)
+        self.assertIn((self.corrupted.pk, D('99.00'), D('10.00')),
+                      report.mismatched_accounts)
+
+    def test_finds_transfers_without_two_balanced_transactions(self):
+        report = reconciliation.reconcile(chunk_size=2)
+        self.assertEqual([(self.one_legged.pk, 1, D('-10.00'))],
+                         report.invalid_transfers)
+        self.assertEqual(D('-10.00'), report.imbalance)
+
+    def test_repairs_mismatched_balances(self):
+        reconciliation.reconcile(chunk_size=2, repair=True)
+        self.corrupted.refresh_from_db()
+        self.assertEqual(D('10.00'), self.corrupted.balance)
+        self.assertEqual(
+            [], reconciliation.reconcile(chunk_size=2).mismatched_accounts)
+
+    def test_fails_from_the_management_command(self):
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_accounts', stdout=out)
+        self.assertIn("Account %d has balance 99.00" % self.corrupted.pk,
+                      out.getvalue())
+
+
+class TestReconcilingALiveLedger(LedgerMixin, TestCase):
+
+    def setUp(self):
+        self.create_ledger()
+
+    def post_after_the_totals_are_read(self):
+        # Make a transfer between the chunk's reads of the transactions and
+        # the balances, as a concurrent posting would
+        read_balances = Account.objects.filter
+
+        def filter(*args, **kwargs):
+            Account.objects.filter = read_balances
+            facade.transfer(self.source, self.accounts[0], D('5.00'))
+            return read_balances(*args, **kwargs)
+
+        return mock.patch.object(Account.objects, 'filter', filter)
+
+    def test_does_not_report_balances_changed_during_the_check(self):
+        with self.post_after_the_totals_are_read():
+            report = reconciliation.reconcile(chunk_size=100)
+        self.assertTrue(report.is_consistent)
+
+    def test_does_not_repair_balances_changed_during_the_check(self):
+        with self.post_after_the_totals_are_read():
+            report = reconciliation.reconcile(chunk_size=100, repair=True)
+        self.assertEqual(0, report.num_repaired)
+        self.assertEqual(D('15.00'), Account.objects.get(
+            pk=self.accounts[0].pk).balance)
+
+
+@skipIf(connection.vendor == 'sqlite',
+        "Worker processes can't share an in-memory database")
+class TestReconcilingInParallel(LedgerMixin, TransactionTestCase):
+
+    def setUp(self):
+        self.create_ledger()
+        Transaction.objects.filter(account=self.accounts[0]).update(
+            amount=D('12.00'))
+
+    def test_gives_the_same_report_as_a_single_process(self):
+        serial = reconciliation.reconcile(chunk_size=2)
+        parallel = reconciliation.reconcile(chunk_size=2, workers=3)
+        self.assertEqual(serial.mismatched_accounts,
+                         parallel.mismatched_accounts)
+        self.assertEqual(serial.invalid_transfers,
+                         parallel.invalid_transfers)
+        self.assertEqual(D('2.00'), parallel.imbalance)
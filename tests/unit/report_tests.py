@@ -0,0 +1,88 @@
+import datetime
+from decimal import Decimal as D
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from freezegun import freeze_time
+
+from oscar_accounts import core, facade, names
+from oscar_accounts.dashboard.reports import ProfitLossReport
+from oscar_accounts.models import Account, AccountType
+from oscar_accounts.setup import create_default_accounts
+
+
+def transfer(date, source, destination, amount):
+    with freeze_time(date):
+        facade.transfer(source, destination, D(amount))
+
+
+class TestTheProfitLossReport(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        deferred_income = AccountType.objects.get(name=names.DEFERRED_INCOME)
+        self.vouchers = deferred_income.add_child(name='Vouchers')
+        self.giftcards = AccountType.objects.get(
+            name=names.DEFERRED_INCOME_ACCOUNT_TYPES[0])
+        self.bank = core.bank_account()
+        self.unpaid = Account.objects.get(name=names.UNPAID_ACCOUNTS[0])
+        self.redemptions = core.redemptions_account()
+        self.lapsed = core.lapsed_account()
+
+        giftcard = Account.objects.create(account_type=self.giftcards)
+        voucher = Account.objects.create(account_type=self.vouchers)
+        transfer('2019-01-15', self.bank, giftcard, '100.00')
+        transfer('2019-01-15', self.unpaid, voucher, '50.00')
+        transfer('2019-01-16', giftcard, self.redemptions, '30.00')
+        transfer('2019-01-16', voucher, self.redemptions, '10.00')
+        transfer('2019-01-17', self.redemptions, giftcard, '5.00')
+        transfer('2019-01-18', giftcard, self.lapsed, '20.00')
+        # Outside the reporting period
+        transfer('2018-12-31', self.bank, giftcard, '1000.00')
+        transfer('2019-02-01', giftcard, self.redemptions, '7.00')
+
+    def run_report(self):
+        return ProfitLossReport(
+            datetime.datetime(2019, 1, 1, tzinfo=timezone.utc),
+            datetime.datetime(2019, 2, 1, tzinfo=timezone.utc)).run()
+
+    def test_totals_the_transfers_in_the_period(self):
+        ctx = self.run_report()
+        giftcards, vouchers = self.giftcards.name, self.vouchers.name
+        self.assertEqual([{'name': 'Bank', 'total': D('100.00')}],
+                         ctx['cash_rows'])
+        self.assertEqual(D('100.00'), ctx['cash_total'])
+        self.assertEqual([{'name': self.unpaid.name, 'total': D('50.00')}],
+                         ctx['unpaid_rows'])
+        self.assertEqual(D('50.00'), ctx['unpaid_total'])
+        self.assertEqual([{'name': giftcards, 'total': D('30.00')},
+                          {'name': vouchers, 'total': D('10.00')}],
+                         ctx['redeem_rows'])
+        self.assertEqual(D('40.00'), ctx['redeem_total'])
+        self.assertEqual([{'name': giftcards, 'total': D('20.00')},
+                          {'name': vouchers, 'total': D('0.00')}],
+                         ctx['closure_rows'])
+        self.assertEqual(D('20.00'), ctx['closure_total'])
+        self.assertEqual([{'name': giftcards, 'total': D('5.00')},
+                          {'name': vouchers, 'total': D('0.00')}],
+                         ctx['refund_rows'])
+        self.assertEqual(D('5.00'), ctx['refund_total'])
+        self.assertEqual(D('155.00'), ctx['increase_total'])
+        self.assertEqual(D('60.00'), ctx['reduction_total'])
+        self.assertEqual(D('95.00'), ctx['position_difference'])
+
+    def test_makes_the_same_number_of_queries_however_many_accounts_there_are(self):
+        self.run_report()
+        with CaptureQueriesContext(connection) as before:
+            self.run_report()
+        for i in range(10):
+            giftcard = Account.objects.create(account_type=self.giftcards)
+            transfer('2019-01-20', self.bank, giftcard, '10.00')
+            transfer('2019-01-21', giftcard, self.redemptions, '5.00')
+        with CaptureQueriesContext(connection) as after:
+            ctx = self.run_report()
+        self.assertEqual(len(before), len(after))
+        self.assertEqual(D('200.00'), ctx['cash_total'])
+        self.assertEqual(D('90.00'), ctx['redeem_total'])
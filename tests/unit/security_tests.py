@@ -1,13 +1,22 @@
+import datetime
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import RequestFactory
+from freezegun import freeze_time
 
 from oscar_accounts import security
+from oscar_accounts.models import IPAddressRecord
 
 
 class TestBruteForceAPI(TestCase):
     """Brute force API"""
 
     def setUp(self):
+        cache.clear()
+        # Discard the failures recorded by earlier tests
+        security._pending.clear()
         factory = RequestFactory()
         self.request = factory.post('/')
 
@@ -25,3 +34,69 @@ class TestBruteForceAPI(TestCase):
         security.record_successful_request(self.request)
         security.record_failed_request(self.request)
         self.assertFalse(security.is_blocked(self.request))
+
+    def test_blocks_permanently_after_block_threshold(self):
+        for __ in range(IPAddressRecord.BLOCK_THRESHOLD + 1):
+            security.record_failed_request(self.request)
+            security.record_successful_request(self.request)
+        self.assertTrue(security.is_blocked(self.request))
+
+    def test_unblocks_after_the_cooling_off_period(self):
+        with freeze_time('2021-01-01 12:00:00') as frozen:
+            for __ in range(3):
+                security.record_failed_request(self.request)
+            frozen.tick(datetime.timedelta(
+                seconds=2 * IPAddressRecord.COOLING_OFF_PERIOD))
+            request = RequestFactory().post('/')
+            self.assertFalse(security.is_blocked(request))
+
+    def test_stays_blocked_for_the_whole_cooling_off_period(self):
+        period = IPAddressRecord.COOLING_OFF_PERIOD
+        # Fail at the end of a window, so that the sliding estimate would
+        # fall below the threshold early in the next one
+        with freeze_time(datetime.datetime.fromtimestamp(
+                10 * period - 1, datetime.timezone.utc)) as frozen:
+            for __ in range(3):
+                security.record_failed_request(self.request)
+            frozen.tick(datetime.timedelta(seconds=period // 2))
+            self.assertTrue(security.is_blocked(RequestFactory().post('/')))
+
+    def test_checks_the_cache_once_per_request(self):
+        security.is_blocked(self.request)
+        with self.assertNumQueries(0):
+            with mock.patch.object(cache, 'get_many') as get_many:
+                security.is_blocked(self.request)
+        self.assertFalse(get_many.called)
+
+    def test_writes_failures_to_the_audit_records_when_flushed(self):
+        for __ in range(2):
+            security.record_failed_request(self.request)
+        security.flush()
+        record = IPAddressRecord.objects.get(ip_address='127.0.0.1')
+        self.assertEqual(2, record.total_failures)
+        self.assertEqual(2, record.consecutive_failures)
+
+        security.record_successful_request(self.request)
+        security.record_failed_request(self.request)
+        security.flush()
+        record.refresh_from_db()
+        self.assertEqual(3, record.total_failures)
+        self.assertEqual(1, record.consecutive_failures)
+
+    def test_writes_failures_to_the_audit_records_at_exit(self):
+        security.record_failed_request(self.request)
+        security._flush_at_exit()
+        self.assertEqual(1, IPAddressRecord.objects.get(
+            ip_address='127.0.0.1').total_failures)
+
+    def test_keeps_the_total_in_the_cache_for_a_limited_time(self):
+        with mock.patch.object(cache, 'add') as add:
+            security.is_blocked(self.request)
+        add.assert_called_once_with(
+            'oscar_accounts:ip:127.0.0.1:total', 0, security.TOTAL_TIMEOUT)
+
+    def test_reloads_the_total_from_the_audit_records(self):
+        IPAddressRecord.objects.create(
+            ip_address='127.0.0.1',
+            total_failures=IPAddressRecord.BLOCK_THRESHOLD + 1)
+        self.assertTrue(security.is_blocked(self.request))
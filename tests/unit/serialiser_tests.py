@@ -0,0 +1,66 @@
+import json
+from decimal import Decimal as D
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse, set_script_prefix
+
+from oscar_accounts import facade, serialisers
+from oscar_accounts.api import serialisers as api_serialisers
+from oscar_accounts.models import Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestBuildingURLs(TestCase):
+
+    def test_matches_reverse(self):
+        self.assertEqual(
+            reverse('oscar_accounts_api:account-refunds', kwargs={'code': 'ABC123'}),
+            serialisers.url('account-refunds', 'code', 'ABC123'))
+
+    def test_quotes_the_value(self):
+        self.assertEqual(
+            reverse('oscar_accounts_api:account', kwargs={'code': 'A B?'}),
+            serialisers.url('account', 'code', 'A B?'))
+
+    def test_honours_the_script_prefix(self):
+        set_script_prefix('/shop/')
+        try:
+            self.assertTrue(serialisers.url(
+                'account', 'code', 'ABC').startswith('/shop/'))
+        finally:
+            set_script_prefix('/')
+
+
+class TestSerialisingTransfers(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.destination = AccountFactory(credit_limit=None)
+        self.transfers = [
+            facade.transfer(self.source, self.destination, D('10.00'))
+            for i in range(3)]
+        facade.transfer(self.destination, self.source, D('4.00'),
+                        parent=self.transfers[0])
+
+    def test_serialises_a_list_of_transfers_with_one_query(self):
+        expected = [Transfer.objects.get(pk=transfer.pk).as_dict()
+                    for transfer in self.transfers]
+        with self.assertNumQueries(1):
+            transfers = serialisers.with_related(Transfer.objects.filter(
+                pk__in=[transfer.pk for transfer in self.transfers]).order_by('pk'))
+            data = [transfer.as_dict() for transfer in transfers]
+        self.assertEqual(expected, data)
+        self.assertEqual('6.00', data[0]['available_to_refund'])
+        self.assertEqual('10.00', data[1]['available_to_refund'])
+
+
+class TestEncodingJSON(TestCase):
+
+    def test_returns_bytes(self):
+        data = {'amount': '10.00', 'code': None}
+        self.assertEqual(data, json.loads(api_serialisers.dumps(data)))
+
+    def test_falls_back_to_the_json_module(self):
+        with mock.patch.object(api_serialisers, 'orjson', None):
+            self.assertEqual(b'{"a": 1}', api_serialisers.dumps({'a': 1}))
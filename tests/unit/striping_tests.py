@@ -0,0 +1,86 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from oscar_accounts import core, facade, names, striping
+from oscar_accounts.models import Account, AccountStripe
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+@override_settings(ACCOUNTS_STRIPED_ACCOUNTS={names.REDEMPTIONS: 4})
+class TestAStripedAccount(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.redemptions = core.redemptions_account()
+        source = AccountFactory(credit_limit=None)
+        self.customers = [AccountFactory() for __ in range(4)]
+        for customer in self.customers:
+            facade.transfer(source, customer, D('100.00'))
+            facade.transfer(customer, self.redemptions, D('10.00'))
+
+    def test_posts_balance_changes_to_its_stripes(self):
+        self.assertTrue(AccountStripe.objects.filter(
+            account=self.redemptions).exists())
+        row_balance = Account.objects.filter(
+            pk=self.redemptions.pk).values_list('balance', flat=True).get()
+        self.assertEqual(D('0.00'), row_balance)
+
+    def test_reports_the_summed_balance(self):
+        self.assertEqual(D('40.00'), core.redemptions_account().balance)
+        self.assertEqual(D('40.00'), self.redemptions.balance)
+
+    def test_records_transactions_against_the_account_itself(self):
+        self.assertEqual(4, self.redemptions.num_transactions())
+
+    def test_can_be_debited(self):
+        facade.transfer(self.redemptions, self.customers[0], D('40.00'))
+        self.assertEqual(D('0.00'), core.redemptions_account().balance)
+
+    def test_can_be_recalculated(self):
+        self.redemptions.recalculate_balance()
+        self.assertEqual(D('40.00'), core.redemptions_account().balance)
+        self.assertFalse(AccountStripe.objects.filter(
+            account=self.redemptions).exclude(balance=D('0.00')).exists())
+
+    def test_is_not_affected_by_saving(self):
+        self.redemptions.description = "Sales"
+        self.redemptions.save()
+        self.assertEqual(D('40.00'), core.redemptions_account().balance)
+
+    @override_settings(ACCOUNTS_STRIPE_SELECTION='round-robin')
+    def test_supports_round_robin_stripe_selection(self):
+        for __ in range(4):
+            facade.transfer(self.customers[0], self.redemptions, D('1.00'))
+        self.assertEqual(4, AccountStripe.objects.filter(
+            account=self.redemptions).count())
+        self.assertEqual(D('44.00'), core.redemptions_account().balance)
+
+
+@override_settings(ACCOUNTS_STRIPED_ACCOUNTS={'Rewards': 4})
+class TestLookingUpStripedAccountsByPK(TestCase):
+
+    def setUp(self):
+        striping.clear_cache()
+        striping.striped_account_ids(Account)
+        # Created as another process would, without clearing the cache here
+        Account.objects.bulk_create([Account(name='Rewards')])
+        self.rewards = Account.objects.only('pk').get(name='Rewards')
+
+    def test_reloads_once_another_process_changes_a_striped_account(self):
+        self.assertEqual(0, striping.num_stripes(self.rewards))
+        cache.set(striping.VERSION_KEY, 'changed elsewhere', None)
+        self.assertEqual(4, striping.num_stripes(self.rewards))
+
+    def test_reloads_once_the_local_timeout_passes(self):
+        later = core.time.monotonic() + 61
+        with mock.patch.object(core.time, 'monotonic', return_value=later):
+            self.assertEqual(4, striping.num_stripes(self.rewards))
+
+    def test_is_not_needed_when_the_name_is_loaded(self):
+        rewards = Account.objects.get(name='Rewards')
+        with self.assertNumQueries(0):
+            self.assertEqual(4, striping.num_stripes(rewards))
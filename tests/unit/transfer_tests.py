@@ -1,11 +1,12 @@
 from decimal import Decimal as D
 
-from django.test import TestCase
+from django.db.models import F
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from oscar.test.factories import UserFactory
 
-from oscar_accounts import exceptions
-from oscar_accounts.models import Transfer
+from oscar_accounts import exceptions, facade
+from oscar_accounts.models import Account, Transfer
 from oscar_accounts.test_factories import AccountFactory
 
 
@@ -34,6 +35,9 @@ class TestASuccessfulTransfer(TestCase):
         with self.assertRaises(RuntimeError):
             self.transfer.delete()
 
+    def test_has_a_reference_in_the_expected_format(self):
+        self.assertRegex(self.transfer.reference, r'^[A-Z0-9]{32}$')
+
     def test_records_static_user_information_in_case_user_is_deleted(self):
         self.assertEqual('barry', self.transfer.authorisor_username)
         self.user.delete()
@@ -41,6 +45,17 @@ class TestASuccessfulTransfer(TestCase):
         self.assertEqual('barry', transfer.authorisor_username)
 
 
+class TestSavingATransfer(TestCase):
+
+    def test_generates_the_reference_without_a_second_write(self):
+        transfer = Transfer(source=AccountFactory(),
+                            destination=AccountFactory(), amount=D('10.00'))
+        with self.assertNumQueries(1):
+            transfer.save()
+        self.assertEqual(transfer.reference, Transfer.objects.get(
+            pk=transfer.pk).reference)
+
+
 class TestATransferToAnInactiveAccount(TestCase):
 
     def test_is_permitted(self):
@@ -105,3 +120,91 @@ class TestAnAttemptedTransfer(TestCase):
         with self.assertRaises(exceptions.ClosedAccount):
             Transfer.objects.create(
                 source, destination, D('20.00'), user=self.user)
+
+
+class TestATransferFromAStaleAccount(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=D('0.00'))
+        self.destination = AccountFactory()
+        Transfer.objects.create(
+            AccountFactory(credit_limit=None), self.source, D('50.00'))
+        # Load a copy of the account that will become stale when another
+        # process spends the funds
+        self.stale = Account.objects.get(pk=self.source.pk)
+        self.stale.balance
+        Transfer.objects.create(self.source, self.destination, D('50.00'))
+
+    def test_is_checked_against_the_locked_account_row(self):
+        with self.assertRaises(exceptions.InsufficientFunds):
+            Transfer.objects.create(self.stale, self.destination, D('50.00'))
+        self.assertEqual(D('0.00'), Account.objects.get(
+            pk=self.source.pk).balance)
+
+    def test_is_checked_against_the_locked_account_row_in_a_batch(self):
+        with self.assertRaises(exceptions.InsufficientFunds):
+            Transfer.objects.bulk_post(
+                [(self.stale, self.destination, D('50.00'), {})])
+
+
+@override_settings(ACCOUNTS_OPTIMISTIC_LOCKING=True,
+                   ACCOUNTS_POSTING_RETRY_DELAY=0)
+class TestOptimisticLocking(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None)
+        self.giftcard = AccountFactory()
+        self.destination = AccountFactory()
+        facade.transfer(self.source, self.giftcard, D('20.00'))
+        self.giftcard = Account.objects.get(pk=self.giftcard.pk)
+
+    def spend_concurrently(self, amount):
+        # Simulate a posting made by another process since the giftcard was
+        # loaded
+        Account.objects.filter(pk=self.giftcard.pk).update(
+            balance=F('balance') - amount, version=F('version') + 1)
+
+    def test_increments_the_version_of_both_accounts(self):
+        version = self.destination.version
+        facade.transfer(self.giftcard, self.destination, D('5.00'))
+        self.assertEqual(version + 1, self.destination.version)
+        self.assertEqual(2, self.giftcard.version)
+
+    def test_refuses_a_debit_from_a_changed_account(self):
+        self.spend_concurrently(D('15.00'))
+        with self.assertRaises(exceptions.ConcurrentUpdate):
+            Transfer.objects.create(
+                self.giftcard, self.destination, D('10.00'))
+        self.assertEqual(1, Transfer.objects.count())
+        self.destination.refresh_from_db()
+        self.assertEqual(D('0.00'), self.destination.balance)
+
+    def test_retries_a_conflicting_transfer(self):
+        before = facade.posting_stats()
+        self.spend_concurrently(D('5.00'))
+        facade.transfer(self.giftcard, self.destination, D('10.00'))
+        self.assertEqual(D('5.00'), self.giftcard.balance)
+        after = facade.posting_stats()
+        self.assertEqual(before['retries'] + 1, after['retries'])
+
+    def test_rechecks_the_funds_when_retrying(self):
+        self.spend_concurrently(D('15.00'))
+        with self.assertRaises(exceptions.InsufficientFunds):
+            facade.transfer(self.giftcard, self.destination, D('10.00'))
+
+    @override_settings(ACCOUNTS_POSTING_MAX_RETRIES=0)
+    def test_gives_up_after_the_maximum_number_of_retries(self):
+        before = facade.posting_stats()
+        self.spend_concurrently(D('5.00'))
+        with self.assertRaises(exceptions.ConcurrentUpdate):
+            facade.transfer(self.giftcard, self.destination, D('10.00'))
+        after = facade.posting_stats()
+        self.assertEqual(before['failures'] + 1, after['failures'])
+
+    def test_refuses_a_batch_debiting_a_changed_account(self):
+        self.spend_concurrently(D('15.00'))
+        with self.assertRaises(exceptions.ConcurrentUpdate):
+            Transfer.objects.bulk_post([
+                (self.giftcard, self.destination, D('10.00'), None)])
+        self.destination.refresh_from_db()
+        self.assertEqual(D('0.00'), self.destination.balance)